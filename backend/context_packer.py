@@ -0,0 +1,153 @@
+import re
+import importlib.util
+from typing import List, Dict, Any, Optional
+
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+# tiktoken is optional and imported on first use; its encoding takes a
+# while to load, which should not be paid at backend import time
+_HAS_TIKTOKEN = importlib.util.find_spec("tiktoken") is not None
+_encoding = None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Token count for prompt budgeting. Uses tiktoken's o200k_base encoding
+    (gpt-4o family) when installed, otherwise counts words and punctuation,
+    which tracks BPE counts closely enough for packing.
+    """
+    global _encoding
+    if _HAS_TIKTOKEN:
+        if _encoding is None:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("o200k_base")
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(_WORD_RE.findall(text))
+
+
+def _truncate_to_tokens(text: str, budget: int) -> str:
+    """Cuts `text` at a line boundary so it fits in roughly `budget` tokens."""
+    lines = text.split("\n")
+    out: List[str] = []
+    used = 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        out.append(line)
+        used += cost
+    return "\n".join(out).strip()
+
+
+def _suffix_prefix_overlap(a: str, b: str, max_overlap: int = 400) -> int:
+    """Length of the longest suffix of `a` that is also a prefix of `b`."""
+    for n in range(min(len(a), len(b), max_overlap), 0, -1):
+        if a.endswith(b[:n]):
+            return n
+    return 0
+
+
+def merge_hits(hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merges hits from the same source back into contiguous spans.
+    Hits whose metadata has char offsets (start/end) are stitched by position;
+    others fall back to textual suffix/prefix overlap. Exact duplicate texts
+    are dropped. Each span keeps the best score of the hits it absorbed.
+
+    Returns spans as {text, source, score}, best first.
+    """
+    spans: List[Dict[str, Any]] = []
+    by_source: Dict[str, List[Dict[str, Any]]] = {}
+    seen_texts = set()
+    for h in hits:
+        if h["text"] in seen_texts:
+            continue
+        seen_texts.add(h["text"])
+        source = h["metadata"].get("source", "unknown")
+        by_source.setdefault(source, []).append(h)
+
+    for source, group in by_source.items():
+        positioned = [h for h in group if "start" in h["metadata"]]
+        loose = [h for h in group if "start" not in h["metadata"]]
+
+        positioned.sort(key=lambda h: h["metadata"]["start"])
+        current = None
+        for h in positioned:
+            start, end = h["metadata"]["start"], h["metadata"]["end"]
+            # only true overlaps are stitched: structure-aware chunks (e.g.
+            # compact JSON) can be adjacent without being verbatim slices
+            if current is not None and start < current["end"]:
+                if end > current["end"]:
+                    current["text"] += h["text"][current["end"] - start:]
+                    current["end"] = end
+                current["score"] = max(current["score"], h["score"])
+                continue
+            current = {"text": h["text"], "source": source, "score": h["score"],
+                       "start": start, "end": end}
+            spans.append(current)
+
+        for h in loose:
+            for span in spans:
+                if span["source"] != source:
+                    continue
+                if h["text"] in span["text"]:
+                    span["score"] = max(span["score"], h["score"])
+                    break
+                n = _suffix_prefix_overlap(span["text"], h["text"])
+                if n:
+                    span["text"] += h["text"][n:]
+                    span["score"] = max(span["score"], h["score"])
+                    break
+                n = _suffix_prefix_overlap(h["text"], span["text"])
+                if n:
+                    span["text"] = h["text"] + span["text"][n:]
+                    span["score"] = max(span["score"], h["score"])
+                    break
+            else:
+                spans.append({"text": h["text"], "source": source, "score": h["score"]})
+
+    spans.sort(key=lambda s: s["score"], reverse=True)
+    return spans
+
+
+def pack_context(
+    hits: List[Dict[str, Any]],
+    token_budget: Optional[int] = None,
+    separator: str = "\n\n---\n\n",
+) -> Dict[str, Any]:
+    """
+    Merges overlapping hits (merge_hits) and packs the resulting spans, best
+    first, into at most `token_budget` tokens (None = unbounded). The span
+    that crosses the budget is cut at a line boundary; later spans are dropped.
+
+    Returns {context_text, sources, num_tokens}.
+    """
+    spans = merge_hits(hits)
+    sep_cost = estimate_tokens(separator)
+
+    texts: List[str] = []
+    sources: List[str] = []
+    used = 0
+    for span in spans:
+        text = span["text"]
+        cost = estimate_tokens(text) + (sep_cost if texts else 0)
+        if token_budget is not None and used + cost > token_budget:
+            remaining = token_budget - used - (sep_cost if texts else 0)
+            text = _truncate_to_tokens(text, remaining) if remaining > 0 else ""
+            if text:
+                texts.append(text)
+                used += estimate_tokens(text) + (sep_cost if len(texts) > 1 else 0)
+                if span["source"] not in sources:
+                    sources.append(span["source"])
+            break
+        texts.append(text)
+        used += cost
+        if span["source"] not in sources:
+            sources.append(span["source"])
+
+    return {
+        "context_text": separator.join(texts),
+        "sources": sources,
+        "num_tokens": used,
+    }
@@ -0,0 +1,119 @@
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Persistent chunk-embedding cache:
+    - SQLite table keyed by (model name, chunk hash)
+    - vectors stored as raw float32 bytes
+    - bounded to `max_entries`, evicting the least recently used rows
+    """
+
+    def __init__(self, path: str = "embedding_cache.sqlite", max_entries: int = 200_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # opened on first use, so importing the backend creates no file
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """The database connection, opened (and the table created) on first call."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL,"
+                " chunk_hash TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " PRIMARY KEY (model, chunk_hash))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, model: str, chunk_hashes: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Returns the cached vector for each hash, or None where it is missing.
+        """
+        found: Dict[str, np.ndarray] = {}
+        unique = list(dict.fromkeys(chunk_hashes))
+        with self._lock:
+            conn = self._connect()
+            # stay well below SQLite's bound-parameter limit
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT chunk_hash, vector FROM embeddings"
+                    f" WHERE model = ? AND chunk_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND chunk_hash = ?",
+                    [(now, model, h) for h in found],
+                )
+                conn.commit()
+
+            result = [found.get(h) for h in chunk_hashes]
+            hits = sum(v is not None for v in result)
+            self.hits += hits
+            self.misses += len(result) - hits
+        return result
+
+    def put_many(self, model: str, chunk_hashes: List[str], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, chunk_hash, vector, last_used)"
+                " VALUES (?, ?, ?, ?)",
+                [(model, h, v.tobytes(), now) for h, v in zip(chunk_hashes, vectors)],
+            )
+            self._evict()
+            conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN"
+                " (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (count,) = self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        total = self.hits + self.misses
+        return {
+            "entries": count,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM embeddings")
+            conn.commit()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,151 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """Raised from a progress report once cancellation has been requested."""
+
+
+class Job:
+    """
+    One background unit of work. Status moves queued -> running -> one of
+    succeeded / failed / cancelled; stage, done and total describe progress
+    within the running stage (e.g. "embedding", 300 of 1200 chunks).
+    """
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.stage = "queued"
+        self.done = 0
+        self.total = 0
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_requested = False
+        self._finished = threading.Event()
+
+    def report(self, stage: str, done: int = 0, total: int = 0):
+        """
+        Progress callback handed to the job function. Raises JobCancelled if
+        the job was cancelled, so functions should report before any step
+        they must not be interrupted after (e.g. before writing the store).
+        """
+        if self.cancel_requested:
+            raise JobCancelled()
+        self.stage = stage
+        self.done = done
+        self.total = total
+
+    def finish(self, status: str, result: Any = None, error: Optional[str] = None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+        self._finished.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._finished.wait(timeout)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "done": self.done,
+            "total": self.total,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "cancel_requested": self.cancel_requested,
+        }
+
+
+class JobQueue:
+    """
+    FIFO of jobs run one at a time by a single daemon worker thread, so jobs
+    that write the KB never overlap. Finished jobs are kept for status
+    lookups, oldest dropped past `max_finished`.
+    """
+
+    def __init__(self, max_finished: int = 100):
+        self.max_finished = max_finished
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def submit(self, kind: str, fn: Callable[..., Any], *args, **kwargs) -> Job:
+        """
+        Queues fn(*args, progress=job.report, **kwargs); its return value
+        becomes the job result.
+        """
+        job = Job(kind)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="job-queue", daemon=True
+                )
+                self._worker.start()
+        self._queue.put((job, fn, args, kwargs))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Requests cancellation. A queued job is cancelled immediately; a running
+        one stops at its next progress report. Finished jobs are left as-is.
+        """
+        job = self.get(job_id)
+        if job is None or job.status in TERMINAL_STATUSES:
+            return job
+        job.cancel_requested = True
+        if job.status == "queued":
+            job.finish("cancelled")
+        return job
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.status in TERMINAL_STATUSES]
+        for job in finished[: max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job.id]
+
+    def _run(self):
+        while True:
+            job, fn, args, kwargs = self._queue.get()
+            try:
+                if job.status != "queued":
+                    continue  # cancelled while waiting
+                job.status = "running"
+                job.started_at = time.time()
+                try:
+                    result = fn(*args, progress=job.report, **kwargs)
+                except JobCancelled:
+                    job.finish("cancelled")
+                except Exception as e:
+                    job.finish("failed", error=str(e))
+                else:
+                    job.stage = "done"
+                    job.finish("succeeded", result=result)
+            finally:
+                self._queue.task_done()
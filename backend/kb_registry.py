@@ -0,0 +1,161 @@
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from .vector_store import SimpleVectorStore, store_exists
+
+
+DEFAULT_KB_ID = "default"
+
+_KB_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+class InvalidKBId(ValueError):
+    pass
+
+
+def validate_kb_id(kb_id: str) -> str:
+    """kb_id doubles as a directory name, so only a safe subset is allowed."""
+    if not _KB_ID_RE.match(kb_id or "") or ".." in kb_id:
+        raise InvalidKBId(
+            f"Invalid kb_id {kb_id!r}: use 1-64 letters, digits, '_', '-' or '.'"
+        )
+    return kb_id
+
+
+class KBRegistry:
+    """
+    Named knowledge bases, each a SimpleVectorStore in its own directory
+    under `root`. Stores are opened on first use and kept in an LRU; once the
+    loaded stores exceed `memory_budget_bytes` the least recently used ones
+    are dropped (they reopen from disk on their next use). The store being
+    requested is never evicted, even if it alone exceeds the budget.
+
+    legacy_default_path: a pre-existing single-KB directory, served (and
+    written) as the "default" KB as long as `root` has no KB of that name.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        memory_budget_bytes: int,
+        index_type: Optional[str] = None,
+        quantization: Optional[str] = None,
+        legacy_default_path: Optional[str] = None,
+        **index_kwargs,
+    ):
+        self.root = root
+        self.memory_budget_bytes = memory_budget_bytes
+        self.index_type = index_type
+        self.quantization = quantization
+        self.index_kwargs = index_kwargs
+        self.legacy_default_path = legacy_default_path
+        self._stores: "OrderedDict[str, SimpleVectorStore]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def path_for(self, kb_id: str) -> str:
+        path = os.path.join(self.root, validate_kb_id(kb_id))
+        if (
+            kb_id == DEFAULT_KB_ID
+            and self.legacy_default_path
+            and not os.path.exists(path)
+            and store_exists(self.legacy_default_path)
+        ):
+            return self.legacy_default_path
+        return path
+
+    def get(self, kb_id: str) -> SimpleVectorStore:
+        """
+        Returns the store for kb_id, opening it if needed. A KB that does not
+        exist yet comes back empty and is only registered once written.
+        """
+        with self._lock:
+            store = self._stores.get(kb_id)
+            if store is not None:
+                self._stores.move_to_end(kb_id)
+                return store
+        path = self.path_for(kb_id)
+        # open outside the lock: loading a large store must not stall lookups
+        # of other KBs; if two threads race, the first one registered wins
+        store = SimpleVectorStore(
+            path=path,
+            index_type=self.index_type,
+            quantization=self.quantization,
+            **self.index_kwargs,
+        )
+        if not store_exists(path):
+            return store
+        with self._lock:
+            existing = self._stores.get(kb_id)
+            if existing is not None:
+                self._stores.move_to_end(kb_id)
+                return existing
+            self._stores[kb_id] = store
+            self.loads += 1
+            self._evict(keep=kb_id)
+        return store
+
+    def touch(self, kb_id: str, store: SimpleVectorStore):
+        """
+        Re-registers `store` after a write, replacing any copy opened from
+        disk while it was being written, and re-checks the budget.
+        """
+        with self._lock:
+            self._stores[kb_id] = store
+            self._stores.move_to_end(kb_id)
+            self._evict(keep=kb_id)
+
+    def _evict(self, keep: str):
+        used = sum(s.memory_bytes() for s in self._stores.values())
+        for kb_id in list(self._stores):
+            if used <= self.memory_budget_bytes:
+                break
+            if kb_id == keep:
+                continue
+            # no explicit close: in-flight readers may still hold the store,
+            # its files are released once the last reference goes away
+            used -= self._stores.pop(kb_id).memory_bytes()
+            self.evictions += 1
+
+    def delete(self, kb_id: str) -> bool:
+        """Forgets a KB and removes its directory. Returns False if unknown."""
+        path = self.path_for(kb_id)
+        with self._lock:
+            self._stores.pop(kb_id, None)
+        if not os.path.exists(path):
+            return False
+        shutil.rmtree(path)
+        return True
+
+    def list_kbs(self) -> List[Dict[str, Any]]:
+        """Every KB on disk, with whether it is loaded and its footprint."""
+        names = set()
+        if os.path.isdir(self.root):
+            names.update(
+                n for n in os.listdir(self.root)
+                if store_exists(os.path.join(self.root, n))
+            )
+        if self.path_for(DEFAULT_KB_ID) == self.legacy_default_path:
+            names.add(DEFAULT_KB_ID)
+        with self._lock:
+            loaded = {k: s.memory_bytes() for k, s in self._stores.items()}
+        return [
+            {"kb_id": n, "loaded": n in loaded, "memory_bytes": loaded.get(n, 0)}
+            for n in sorted(names)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            used = sum(s.memory_bytes() for s in self._stores.values())
+            return {
+                "loaded": len(self._stores),
+                "memory_bytes": used,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,219 @@
+import os
+import re
+import json
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+KW_TERMS_FILE = "bm25_terms.json"
+KW_OFFSETS_FILE = "bm25_offsets.npy"
+KW_ROWS_FILE = "bm25_rows.npy"
+KW_TFS_FILE = "bm25_tfs.npy"
+KW_DOC_LEN_FILE = "bm25_doc_len.npy"
+
+# Compound tokens keep their separators so exact identifiers survive
+# ("save15", "discount-code", "/api/v1/cart" -> "api/v1/cart"); their parts
+# are indexed as well so "cart" still matches.
+_TOKEN_RE = re.compile(r"[a-z0-9_]+(?:[-./:#][a-z0-9_]+)*")
+_PART_RE = re.compile(r"[-./:#_]")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        tokens.append(tok)
+        parts = _PART_RE.split(tok)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p)
+    return tokens
+
+
+class KeywordIndex:
+    """
+    BM25 over an inverted index kept in flat arrays (CSR layout):
+    - terms: vocabulary, term id = position
+    - offsets[t]:offsets[t + 1] slices rows / tfs for term t, rows ascending
+    - doc_len: token count per row
+
+    A query touches only the postings of its own terms, so lookups cost
+    microseconds regardless of KB size. Rebuilding after a write reuses the
+    previous postings for surviving rows and only tokenizes new ones.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.terms: List[str] = []
+        self.term_ids: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.rows = np.zeros(0, dtype=np.int32)
+        self.tfs = np.zeros(0, dtype=np.float32)
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.avgdl = 1.0
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.doc_len)
+
+    def build(
+        self,
+        new_texts: Iterable[str],
+        previous: Optional["KeywordIndex"] = None,
+        kept: Optional[np.ndarray] = None,
+    ):
+        """
+        Indexes the rows of a store written as previous rows `kept` (old row
+        indices, in their new order) followed by `new_texts`.
+        """
+        terms: List[str] = []
+        term_ids: Dict[str, int] = {}
+        post_terms: List[np.ndarray] = []
+        post_rows: List[np.ndarray] = []
+        post_tfs: List[np.ndarray] = []
+        n_old = 0
+        doc_len = []
+
+        if previous is not None and kept is not None and len(kept):
+            n_old = len(kept)
+            terms = list(previous.terms)
+            term_ids = dict(previous.term_ids)
+            remap = np.full(previous.n_rows, -1, dtype=np.int64)
+            remap[kept] = np.arange(n_old)
+            old_terms = np.repeat(
+                np.arange(len(previous.terms), dtype=np.int64), np.diff(previous.offsets)
+            )
+            new_rows = remap[previous.rows]
+            live = new_rows >= 0
+            post_terms.append(old_terms[live])
+            post_rows.append(new_rows[live])
+            post_tfs.append(previous.tfs[live])
+            doc_len.append(previous.doc_len[kept])
+
+        t_list: List[int] = []
+        r_list: List[int] = []
+        f_list: List[float] = []
+        lengths: List[float] = []
+        for i, text in enumerate(new_texts):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                tid = term_ids.get(term)
+                if tid is None:
+                    tid = term_ids[term] = len(terms)
+                    terms.append(term)
+                t_list.append(tid)
+                r_list.append(n_old + i)
+                f_list.append(tf)
+        post_terms.append(np.asarray(t_list, dtype=np.int64))
+        post_rows.append(np.asarray(r_list, dtype=np.int64))
+        post_tfs.append(np.asarray(f_list, dtype=np.float32))
+        doc_len.append(np.asarray(lengths, dtype=np.float32))
+
+        all_terms = np.concatenate(post_terms)
+        all_rows = np.concatenate(post_rows)
+        counts = np.bincount(all_terms, minlength=len(terms))
+        if not counts.all():
+            # drop terms whose rows were all removed
+            alive = counts > 0
+            new_ids = np.cumsum(alive) - 1
+            all_terms = new_ids[all_terms]
+            terms = [t for t, a in zip(terms, alive) if a]
+            term_ids = {t: i for i, t in enumerate(terms)}
+            counts = counts[alive]
+        order = np.lexsort((all_rows, all_terms))
+
+        self.terms = terms
+        self.term_ids = term_ids
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.rows = all_rows[order].astype(np.int32)
+        self.tfs = np.concatenate(post_tfs)[order].astype(np.float32)
+        self.doc_len = np.concatenate(doc_len).astype(np.float32)
+        self.avgdl = float(self.doc_len.mean()) if len(self.doc_len) else 1.0
+        return self
+
+    def save(self, path: str):
+        with open(os.path.join(path, KW_TERMS_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.terms, f, ensure_ascii=False)
+        for name, arr in (
+            (KW_OFFSETS_FILE, self.offsets),
+            (KW_ROWS_FILE, self.rows),
+            (KW_TFS_FILE, self.tfs),
+            (KW_DOC_LEN_FILE, self.doc_len),
+        ):
+            np.save(os.path.join(path, name), arr)
+
+    def load(self, path: str) -> bool:
+        """Loads a saved index. Returns False if none is present on disk."""
+        terms_path = os.path.join(path, KW_TERMS_FILE)
+        if not os.path.exists(terms_path):
+            return False
+        with open(terms_path, "r", encoding="utf-8") as f:
+            self.terms = json.load(f)
+        self.term_ids = {t: i for i, t in enumerate(self.terms)}
+        self.offsets = np.load(os.path.join(path, KW_OFFSETS_FILE))
+        self.rows = np.load(os.path.join(path, KW_ROWS_FILE), mmap_mode="r")
+        self.tfs = np.load(os.path.join(path, KW_TFS_FILE), mmap_mode="r")
+        self.doc_len = np.load(os.path.join(path, KW_DOC_LEN_FILE))
+        self.avgdl = float(self.doc_len.mean()) if len(self.doc_len) else 1.0
+        return True
+
+    def memory_bytes(self) -> int:
+        return (
+            self.offsets.nbytes + self.rows.nbytes + self.tfs.nbytes + self.doc_len.nbytes
+            + sum(len(t) + 50 for t in self.terms)
+        )
+
+    def score(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 scores of every row matching at least one query term.
+        Returns (rows ascending, scores); both empty if nothing matches.
+        """
+        n = self.n_rows
+        tids = {self.term_ids[t] for t in tokenize(query) if t in self.term_ids}
+        if not tids or n == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        avgdl = self.avgdl or 1.0
+        rows_parts, score_parts = [], []
+        for tid in tids:
+            lo, hi = self.offsets[tid], self.offsets[tid + 1]
+            rows = np.asarray(self.rows[lo:hi])
+            tf = np.asarray(self.tfs[lo:hi])
+            df = hi - lo
+            idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self.doc_len[rows] / avgdl)
+            rows_parts.append(rows)
+            score_parts.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+        rows = np.concatenate(rows_parts)
+        if len(rows_parts) == 1:
+            return rows.astype(np.int64), score_parts[0].astype(np.float32)
+        uniq, inverse = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+        return uniq.astype(np.int64), scores.astype(np.float32)
+
+    def search(self, query: str, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top `top_k` rows by BM25, best first, as (rows, scores)."""
+        rows, scores = self.score(query)
+        if len(rows) > top_k:
+            part = np.argpartition(-scores, top_k - 1)[:top_k]
+            rows, scores = rows[part], scores[part]
+        order = np.argsort(-scores, kind="stable")
+        return rows[order], scores[order]
+
+
+def reciprocal_rank_fusion(
+    rankings: List[np.ndarray], top_k: int, k: int = 60
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fuses best-first lists of row ids: each row scores sum(1 / (k + rank)).
+    Returns the top `top_k` rows and fused scores, best first.
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking.tolist()):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank + 1)
+    best = sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+    rows = np.asarray([r for r, _ in best], dtype=np.int64)
+    scores = np.asarray([s for _, s in best], dtype=np.float32)
+    return rows, scores
@@ -0,0 +1,232 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+
+def make_cache_key(model: str, temperature: float, system_prompt: str, user_prompt: str) -> str:
+    h = hashlib.sha256()
+    for part in (model, repr(float(temperature)), system_prompt, user_prompt):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class MemoryLRUCache:
+    """
+    In-process LRU of (value, tag, stored_at) entries, bounded by entry count.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[str, str, float]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: str, tag: str, stored_at: float):
+        with self._lock:
+            self._data[key] = (value, tag, stored_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_tagged(self, prefix: str):
+        """Drops every entry whose tag starts with `prefix`."""
+        with self._lock:
+            for key in [k for k, (_, tag, _) in self._data.items() if tag.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    On-disk counterpart of MemoryLRUCache, shared by every process that opens
+    the same file. Evicts least recently used rows past `max_entries`.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10_000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " tag TEXT NOT NULL,"
+            " stored_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[str, str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, tag, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key)
+                )
+                self._conn.commit()
+        return row
+
+    def set(self, key: str, value: str, tag: str, stored_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, tag, stored_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, value, tag, stored_at, stored_at),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            excess = count - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN"
+                    " (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def delete_tagged(self, prefix: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM responses WHERE substr(tag, 1, ?) = ?", (len(prefix), prefix)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        return count
+
+
+class ResponseCache:
+    """
+    LLM response cache:
+    - in-memory LRU in front of an optional SQLite store
+    - entries expire after `ttl_seconds` (0 = never); an expired entry is
+      dropped on lookup and counts as stale
+    - each entry carries a tag (e.g. the KB version it was generated against)
+      that is part of its key: a lookup only sees entries stored under the
+      same tag, and entries of different tags live side by side until the LRU
+      or TTL retires them. invalidate_tagged drops them explicitly.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 24 * 3600,
+        sqlite_path: Optional[str] = None,
+        sqlite_max_entries: int = 10_000,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.memory = MemoryLRUCache(max_entries)
+        self.disk = SQLiteCache(sqlite_path, sqlite_max_entries) if sqlite_path else None
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._lock = threading.Lock()
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def _fresh(self, entry: Tuple[str, str, float]) -> bool:
+        return not self.ttl_seconds or time.time() - entry[2] <= self.ttl_seconds
+
+    @staticmethod
+    def _entry_key(key: str, tag: str) -> str:
+        return f"{key}:{tag}" if tag else key
+
+    def get(self, key: str, tag: str = "") -> Optional[str]:
+        key = self._entry_key(key, tag)
+        for layer in (self.memory, self.disk):
+            if layer is None:
+                continue
+            entry = layer.get(key)
+            if entry is None:
+                continue
+            if not self._fresh(entry):
+                self._invalidate(key)
+                self._count("stale")
+                break
+            if layer is self.disk:
+                self.memory.set(key, *entry)
+            self._count("hits")
+            return entry[0]
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: str, tag: str = ""):
+        now = time.time()
+        key = self._entry_key(key, tag)
+        self.memory.set(key, value, tag, now)
+        if self.disk is not None:
+            self.disk.set(key, value, tag, now)
+
+    def invalidate(self, key: str, tag: str = ""):
+        self._invalidate(self._entry_key(key, tag))
+
+    def _invalidate(self, entry_key: str):
+        self.memory.delete(entry_key)
+        if self.disk is not None:
+            self.disk.delete(entry_key)
+
+    def invalidate_tagged(self, prefix: str):
+        """
+        Drops every entry whose tag starts with `prefix` (e.g. "<kb_id>/").
+        Other processes sharing the SQLite file keep their in-memory copies.
+        """
+        self.memory.delete_tagged(prefix)
+        if self.disk is not None:
+            self.disk.delete_tagged(prefix)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+        with self._lock:
+            self.hits = self.misses = self.stale = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "memory_entries": len(self.memory),
+            "disk_entries": len(self.disk) if self.disk is not None else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -1,36 +1,315 @@
 import os
-from typing import List, Dict, Any
+import time
+import random
+import asyncio
+import threading
+import weakref
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 
-import openai
+from .llm_cache import ResponseCache, make_cache_key
+from .llm_providers import (
+    LLM_MAX_CONCURRENCY,
+    LLMProvider,
+    aclose_sessions,
+    make_provider,
+)
+from .context_packer import estimate_tokens
+from .metrics import metrics, span
 
-# Configure OpenAI via environment variable
-openai.api_key = os.getenv("OPENAI_API_KEY", "")
+# Provider behind every call: LLM_PROVIDER=openai (default), openai_compatible
+# (LLM_API_BASE, LLM_MODEL) or fake (offline, see llm_providers.FakeProvider).
+# Built on first use.
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+_provider: Optional[LLMProvider] = None
+_provider_lock = threading.Lock()
+
+# Response cache; LLM_CACHE_PATH adds an on-disk SQLite layer shared across
+# processes, LLM_CACHE_DISABLED=1 turns caching off.
+_response_cache: Optional[ResponseCache] = None
+if os.getenv("LLM_CACHE_DISABLED", "") not in ("1", "true", "yes"):
+    _response_cache = ResponseCache(
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+        ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", str(24 * 3600))),
+        sqlite_path=os.getenv("LLM_CACHE_PATH") or None,
+    )
+
+
+# Timeouts, retries and concurrency for provider calls
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE_SECONDS = 0.5
+LLM_BACKOFF_MAX_SECONDS = 20.0
+
+# Concurrency limit per event loop (asyncio primitives are bound to the loop
+# that first uses them), created lazily; entries go away with their loop
+_aio_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_llm_provider() -> LLMProvider:
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = make_provider(LLM_PROVIDER)
+    return _provider
+
+
+def set_llm_provider(provider: Optional[LLMProvider]):
+    """Replaces the provider; None rebuilds it from LLM_PROVIDER on next use."""
+    global _provider
+    _provider = provider
+
+
+def set_response_cache(cache: Optional[ResponseCache]):
+    """Replaces the response cache; None disables caching."""
+    global _response_cache
+    _response_cache = cache
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    return _response_cache
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for retry number `attempt` (0-based)."""
+    cap = min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+def _resolve(model: Optional[str]) -> Tuple[LLMProvider, str, str]:
+    """
+    (provider, model, model name for cache keys and metrics). Providers other
+    than OpenAI prefix their name so their responses never mix in the cache.
+    """
+    provider = get_llm_provider()
+    model = model or provider.default_model
+    label = model if provider.name == "openai" else f"{provider.name}/{model}"
+    return provider, model, label
+
+
+def _cache_lookup(
+    use_cache: bool, model: str, temperature: float, system_prompt: str, user_prompt: str, cache_tag: str
+):
+    """Returns (cache or None, key or None, cached value or None)."""
+    cache = _response_cache if use_cache else None
+    if cache is None:
+        return None, None, None
+    key = make_cache_key(model, temperature, system_prompt, user_prompt)
+    cached = cache.get(key, tag=cache_tag)
+    metrics.inc("cache_requests_total", cache="llm", result="miss" if cached is None else "hit")
+    return cache, key, cached
+
+
+def _record_usage(model: str, usage: Optional[Dict[str, Any]]):
+    """Counts prompt and completion tokens reported by the provider."""
+    if not usage:
+        return
+    metrics.inc("llm_tokens_total", usage.get("prompt_tokens", 0), kind="prompt", model=model)
+    metrics.inc(
+        "llm_tokens_total", usage.get("completion_tokens", 0), kind="completion", model=model
+    )
 
 
 def call_llm(
     system_prompt: str,
     user_prompt: str,
-    model: str = "gpt-4o-mini",
+    model: Optional[str] = None,
+    temperature: float = 0.2,
+    cache_tag: str = "",
+    use_cache: bool = True,
+) -> str:
+    """
+    Chat completion through the configured provider (see LLM_PROVIDER);
+    model defaults to the provider's own default.
+
+    Responses are cached by (model, temperature, system prompt, user prompt,
+    cache_tag); the tag (e.g. the KB version) keeps generations for different
+    KBs and versions apart. Each attempt is bounded by
+    LLM_TIMEOUT_SECONDS and 429/5xx/timeouts are retried with backoff.
+    """
+    provider, model, label = _resolve(model)
+    cache, key, cached = _cache_lookup(
+        use_cache, label, temperature, system_prompt, user_prompt, cache_tag
+    )
+    if cached is not None:
+        return cached
+
+    provider.check()
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+    with span("llm", model=label):
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                content, usage = provider.complete(
+                    messages, model, temperature, LLM_TIMEOUT_SECONDS
+                )
+                break
+            except Exception as e:
+                if attempt == LLM_MAX_RETRIES or not provider.is_retryable(e):
+                    raise
+                metrics.inc("llm_retries_total", model=label)
+                time.sleep(_backoff_delay(attempt))
+
+    _record_usage(label, usage)
+    content = content.strip()
+    if cache is not None:
+        cache.set(key, content, tag=cache_tag)
+    return content
+
+
+def _get_aio_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _aio_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _aio_semaphores[loop] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return semaphore
+
+
+async def acall_llm(
+    system_prompt: str,
+    user_prompt: str,
+    model: Optional[str] = None,
     temperature: float = 0.2,
+    cache_tag: str = "",
+    use_cache: bool = True,
+    timeout: Optional[float] = None,
 ) -> str:
     """
-    Thin wrapper around OpenAI ChatCompletion.
-    You can replace this with any other LLM provider.
+    Async counterpart of call_llm with the same caching semantics.
+    Calls share one pooled HTTP session, at most LLM_MAX_CONCURRENCY run at
+    once, each attempt is bounded by `timeout` (default LLM_TIMEOUT_SECONDS),
+    and 429/5xx/timeouts are retried with jittered exponential backoff.
     """
-    if not openai.api_key:
-        raise RuntimeError(
-            "OPENAI_API_KEY is not set. Please export it before running the backend."
-        )
+    provider, model, label = _resolve(model)
+    cache, key, cached = _cache_lookup(
+        use_cache, label, temperature, system_prompt, user_prompt, cache_tag
+    )
+    if cached is not None:
+        return cached
+
+    provider.check()
+    timeout = timeout or LLM_TIMEOUT_SECONDS
 
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_prompt},
     ]
 
-    resp = openai.ChatCompletion.create(
-        model=model,
-        messages=messages,
-        temperature=temperature,
+    with span("llm", model=label):
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                async with _get_aio_semaphore():
+                    content, usage = await asyncio.wait_for(
+                        provider.acomplete(messages, model, temperature, timeout),
+                        timeout=timeout,
+                    )
+                break
+            except Exception as e:
+                if attempt == LLM_MAX_RETRIES or not provider.is_retryable(e):
+                    raise
+                metrics.inc("llm_retries_total", model=label)
+                await asyncio.sleep(_backoff_delay(attempt))
+
+    _record_usage(label, usage)
+    content = content.strip()
+    if cache is not None:
+        cache.set(key, content, tag=cache_tag)
+    return content
+
+
+async def astream_llm(
+    system_prompt: str,
+    user_prompt: str,
+    model: Optional[str] = None,
+    temperature: float = 0.2,
+    cache_tag: str = "",
+    use_cache: bool = True,
+    timeout: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """
+    Streaming counterpart of acall_llm: yields content deltas as the provider
+    produces them. A cached response is yielded as a single chunk, and the
+    full text is cached once the stream completes. Retries only happen before
+    the first delta; `timeout` bounds the wait for each delta.
+    """
+    provider, model, label = _resolve(model)
+    cache, key, cached = _cache_lookup(
+        use_cache, label, temperature, system_prompt, user_prompt, cache_tag
+    )
+    if cached is not None:
+        yield cached
+        return
+
+    provider.check()
+    timeout = timeout or LLM_TIMEOUT_SECONDS
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+    parts: List[str] = []
+    started = time.perf_counter()
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        # held while streaming, released while backing off between attempts
+        async with _get_aio_semaphore():
+            chunks = provider.astream(messages, model, temperature, timeout)
+            retry = False
+            try:
+                delta = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+            except StopAsyncIteration:
+                delta = None
+            except Exception as e:
+                await chunks.aclose()
+                if attempt == LLM_MAX_RETRIES or not provider.is_retryable(e):
+                    raise
+                retry = True
+
+            if not retry:
+                metrics.observe(
+                    "stage_duration_seconds", time.perf_counter() - started,
+                    stage="llm_first_delta", model=label,
+                )
+                try:
+                    while delta is not None:
+                        parts.append(delta)
+                        yield delta
+                        try:
+                            delta = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+                        except StopAsyncIteration:
+                            delta = None
+                finally:
+                    # also when the consumer stops early (e.g. the client
+                    # disconnected): release the provider's response and the
+                    # semaphore slot now, not at garbage collection
+                    await chunks.aclose()
+                break
+        metrics.inc("llm_retries_total", model=label)
+        await asyncio.sleep(_backoff_delay(attempt))
+
+    metrics.observe(
+        "stage_duration_seconds", time.perf_counter() - started, stage="llm", model=label
     )
+    # streamed responses carry no usage block; count tokens locally instead
+    content = "".join(parts).strip()
+    _record_usage(
+        label,
+        {
+            "prompt_tokens": estimate_tokens(system_prompt) + estimate_tokens(user_prompt),
+            "completion_tokens": estimate_tokens(content),
+        },
+    )
+    if cache is not None:
+        cache.set(key, content, tag=cache_tag)
+
 
-    return resp.choices[0].message["content"].strip()
+async def aclose_llm_client():
+    """Closes the running loop's pooled HTTP session; call on application shutdown."""
+    await aclose_sessions()
+    _aio_semaphores.pop(asyncio.get_running_loop(), None)
@@ -0,0 +1,426 @@
+import os
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import threading
+import weakref
+import zlib
+from typing import (
+    TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, List, Optional, Tuple,
+)
+
+if TYPE_CHECKING:
+    import aiohttp
+
+# Max concurrent provider calls; also sizes the pooled HTTP connector
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+Messages = List[Dict[str, str]]
+# prompt_tokens / completion_tokens as reported by the provider, if any
+Usage = Optional[Dict[str, int]]
+
+# openai (with requests and aiohttp) is imported on first use, see load_openai
+_openai = None
+
+# One pooled HTTP session per event loop (a session only works on the loop
+# it was created on), created lazily; entries go away with their loop
+_aio_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def load_openai():
+    """Imports and configures the openai module once; returns it."""
+    global _openai
+    if _openai is None:
+        import openai
+
+        # Configure OpenAI via environment variable
+        openai.api_key = os.getenv("OPENAI_API_KEY", "")
+        _openai = openai
+    return _openai
+
+
+def _get_aio_session() -> "aiohttp.ClientSession":
+    loop = asyncio.get_running_loop()
+    session = _aio_sessions.get(loop)
+    if session is None or session.closed:
+        import aiohttp
+
+        # one pooled session for all provider calls on this loop
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=LLM_MAX_CONCURRENCY),
+        )
+        _aio_sessions[loop] = session
+    return session
+
+
+async def aclose_sessions():
+    """Closes the running loop's session."""
+    session = _aio_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+class LLMProvider:
+    """
+    One chat-completion backend. llm_client adds caching, retries, the
+    concurrency limit and metrics on top; a provider only talks to its
+    service:
+    - complete / acomplete: one full response as (content, usage)
+    - astream: the response as content deltas
+    - is_retryable: whether llm_client should retry after an exception
+    """
+
+    name = "base"
+    default_model = "gpt-4o-mini"
+
+    def check(self):
+        """Raises RuntimeError if the provider is not usable as configured."""
+
+    def warm_up(self):
+        """Imports or connects whatever the first call would otherwise pay for."""
+
+    def is_retryable(self, exc: Exception) -> bool:
+        return isinstance(exc, asyncio.TimeoutError)
+
+    def complete(
+        self, messages: Messages, model: str, temperature: float, timeout: float
+    ) -> Tuple[str, Usage]:
+        raise NotImplementedError
+
+    async def acomplete(
+        self, messages: Messages, model: str, temperature: float, timeout: float
+    ) -> Tuple[str, Usage]:
+        raise NotImplementedError
+
+    def astream(
+        self, messages: Messages, model: str, temperature: float, timeout: float
+    ) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+
+class OpenAIProvider(LLMProvider):
+    """
+    openai.ChatCompletion (openai 0.28). api_base / api_key override the
+    module-level settings, which is all an OpenAI-compatible server needs.
+    """
+
+    name = "openai"
+
+    def __init__(
+        self,
+        api_base: Optional[str] = None,
+        api_key: Optional[str] = None,
+        default_model: str = "gpt-4o-mini",
+        require_api_key: bool = True,
+    ):
+        self.api_base = api_base
+        self.api_key = api_key
+        self.default_model = default_model
+        self.require_api_key = require_api_key
+
+    def _request_kwargs(self) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {}
+        if self.api_base:
+            kwargs["api_base"] = self.api_base
+        if self.api_key is not None:
+            # local servers usually ignore the key, but openai insists on one
+            kwargs["api_key"] = self.api_key or "unused"
+        return kwargs
+
+    def check(self):
+        if self.require_api_key and not (self.api_key or load_openai().api_key):
+            raise RuntimeError(
+                "OPENAI_API_KEY is not set. Please export it before running the backend."
+            )
+
+    def warm_up(self):
+        load_openai()
+
+    def is_retryable(self, exc: Exception) -> bool:
+        """429s, 5xx, timeouts and dropped connections are worth retrying."""
+        openai = load_openai()
+        if isinstance(
+            exc,
+            (
+                openai.error.RateLimitError,
+                openai.error.ServiceUnavailableError,
+                openai.error.Timeout,
+                openai.error.APIConnectionError,
+                openai.error.TryAgain,
+                asyncio.TimeoutError,
+            ),
+        ):
+            return True
+        if isinstance(exc, openai.error.APIError):
+            return (exc.http_status or 500) >= 500
+        return False
+
+    def complete(self, messages, model, temperature, timeout):
+        resp = load_openai().ChatCompletion.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            request_timeout=timeout,
+            **self._request_kwargs(),
+        )
+        return resp.choices[0].message["content"], resp.get("usage")
+
+    async def acomplete(self, messages, model, temperature, timeout):
+        openai = load_openai()
+        # openai 0.28 reads its aiohttp session from a context variable
+        openai.aiosession.set(_get_aio_session())
+        resp = await openai.ChatCompletion.acreate(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            request_timeout=timeout,
+            **self._request_kwargs(),
+        )
+        return resp.choices[0].message["content"], resp.get("usage")
+
+    async def astream(self, messages, model, temperature, timeout):
+        openai = load_openai()
+        openai.aiosession.set(_get_aio_session())
+        stream = await openai.ChatCompletion.acreate(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            request_timeout=timeout,
+            stream=True,
+            **self._request_kwargs(),
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+
+class FakeRateLimitError(Exception):
+    """Injected by FakeProvider at LLM_FAKE_ERROR_RATE; retried like a 429."""
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Latency distribution in milliseconds, returned as a sampler in seconds:
+    "fixed:MS", "uniform:LO:HI", "normal:MEAN:STD" or
+    "lognormal:MEDIAN:SIGMA" (heavy right tail, like real provider latency).
+    """
+    kind, _, rest = spec.partition(":")
+    try:
+        args = [float(a) for a in rest.split(":")] if rest else []
+        if kind == "fixed" and len(args) == 1:
+            return lambda rng: args[0] / 1000
+        if kind == "uniform" and len(args) == 2:
+            return lambda rng: rng.uniform(args[0], args[1]) / 1000
+        if kind == "normal" and len(args) == 2:
+            return lambda rng: max(0.0, rng.gauss(args[0], args[1])) / 1000
+        if kind == "lognormal" and len(args) == 2:
+            mu = math.log(max(args[0], 1e-3))
+            return lambda rng: rng.lognormvariate(mu, args[1]) / 1000
+    except ValueError:
+        pass
+    raise ValueError(
+        f"Invalid latency spec {spec!r}; expected fixed:MS, uniform:LO:HI, "
+        "normal:MEAN:STD or lognormal:MEDIAN:SIGMA"
+    )
+
+
+_FILENAME_RE = re.compile(r"\b[\w-]+\.(?:md|txt|json|html)\b")
+_ELEMENT_ID_RE = re.compile(r"""(?:\bid=["']|#)([A-Za-z][\w-]*)""")
+_TEST_CASE_RE = re.compile(r"Test Case \(JSON\):\s*(\{.*?\n\})", re.S)
+_REQUEST_RE = re.compile(r"User request:\s*(.+?)\n\s*\n", re.S)
+
+
+class FakeProvider(LLMProvider):
+    """
+    Offline stand-in for load tests: no network, no key, no cost.
+    Responses are deterministic functions of the prompt and have the shape
+    the backend parses - a JSON array of test cases for test-case prompts,
+    a Selenium script for script prompts. Only timing is random: time to
+    first token is drawn from `latency` and output is paced at
+    `tokens_per_second` (both seeded, so runs are reproducible), and
+    `error_rate` of calls fail with a retryable FakeRateLimitError.
+    """
+
+    name = "fake"
+    default_model = "fake"
+
+    def __init__(
+        self,
+        latency: str = "fixed:0",
+        tokens_per_second: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.sample_latency = parse_latency(latency)
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def is_retryable(self, exc: Exception) -> bool:
+        return isinstance(exc, (FakeRateLimitError, asyncio.TimeoutError))
+
+    def _draw(self) -> Tuple[float, bool]:
+        """(time to first token in seconds, whether this call fails)"""
+        with self._lock:
+            return self.sample_latency(self._rng), self._rng.random() < self.error_rate
+
+    def _pieces(self, content: str) -> List[str]:
+        # roughly one token per 4 characters, streamed a few tokens at a time
+        return [content[i:i + 16] for i in range(0, len(content), 16)]
+
+    def _usage(self, messages: Messages, content: str) -> Dict[str, int]:
+        prompt = sum(len(m["content"]) for m in messages)
+        return {"prompt_tokens": prompt // 4, "completion_tokens": len(content) // 4}
+
+    def _generation_seconds(self, content: str) -> float:
+        if self.tokens_per_second <= 0:
+            return 0.0
+        return (len(content) / 4) / self.tokens_per_second
+
+    def respond(self, messages: Messages) -> str:
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        user = next((m["content"] for m in messages if m["role"] == "user"), "")
+        if "Selenium" in system:
+            return self._selenium_script(user)
+        return self._test_cases(user)
+
+    def _test_cases(self, user: str) -> str:
+        match = _REQUEST_RE.search(user)
+        request = " ".join((match.group(1) if match else "the checkout page").split())
+        rng = random.Random(zlib.crc32(user.encode("utf-8")))
+        sources = list(dict.fromkeys(_FILENAME_RE.findall(user))) or ["product_specs.md"]
+        feature = request.split(":")[0][:60] or "Checkout"
+        cases = []
+        for i in range(rng.randint(3, 5)):
+            positive = i % 2 == 0
+            cases.append({
+                "id": f"TC-{i + 1:03d}",
+                "feature": feature,
+                "scenario": f"{'Valid' if positive else 'Invalid'} input for {request[:80]} ({i + 1})",
+                "steps": [
+                    "Open the checkout page",
+                    f"Fill in the form with {'valid' if positive else 'invalid'} data",
+                    "Click Pay Now",
+                ],
+                "expected_result": (
+                    "Payment Successful! is shown" if positive
+                    else "An inline error message is shown in red"
+                ),
+                "grounded_in": sources[: rng.randint(1, min(2, len(sources)))],
+            })
+        return json.dumps(cases, indent=2)
+
+    def _selenium_script(self, user: str) -> str:
+        match = _TEST_CASE_RE.search(user)
+        try:
+            test_case = json.loads(match.group(1)) if match else {}
+        except ValueError:
+            test_case = {}
+        ids = list(dict.fromkeys(_ELEMENT_ID_RE.findall(user)))[:4] or ["name"]
+        steps = "\n".join(
+            f"        wait.until(EC.presence_of_element_located((By.ID, {el!r})))"
+            for el in ids
+        )
+        return (
+            f"# {test_case.get('id', 'TC-000')}: {test_case.get('scenario', '')}\n"
+            "from selenium import webdriver\n"
+            "from selenium.webdriver.common.by import By\n"
+            "from selenium.webdriver.support.ui import WebDriverWait\n"
+            "from selenium.webdriver.support import expected_conditions as EC\n"
+            "\n\n"
+            "def test_generated():\n"
+            "    driver = webdriver.Chrome()\n"
+            "    wait = WebDriverWait(driver, 10)\n"
+            "    try:\n"
+            "        driver.get(\"http://localhost:8501/static/checkout.html\")\n"
+            f"{steps}\n"
+            f"        # expected: {test_case.get('expected_result', '')}\n"
+            "        assert driver.find_element(By.TAG_NAME, \"body\").is_displayed()\n"
+            "    finally:\n"
+            "        driver.quit()\n"
+        )
+
+    def complete(self, messages, model, temperature, timeout):
+        latency, fail = self._draw()
+        time.sleep(latency)
+        if fail:
+            raise FakeRateLimitError("fake provider: injected rate limit")
+        content = self.respond(messages)
+        time.sleep(self._generation_seconds(content))
+        return content, self._usage(messages, content)
+
+    async def acomplete(self, messages, model, temperature, timeout):
+        latency, fail = self._draw()
+        await asyncio.sleep(latency)
+        if fail:
+            raise FakeRateLimitError("fake provider: injected rate limit")
+        content = self.respond(messages)
+        await asyncio.sleep(self._generation_seconds(content))
+        return content, self._usage(messages, content)
+
+    async def astream(self, messages, model, temperature, timeout):
+        latency, fail = self._draw()
+        await asyncio.sleep(latency)
+        if fail:
+            raise FakeRateLimitError("fake provider: injected rate limit")
+        content = self.respond(messages)
+        pieces = self._pieces(content)
+        pause = self._generation_seconds(content) / max(len(pieces), 1)
+        for i, piece in enumerate(pieces):
+            if i and pause:
+                await asyncio.sleep(pause)
+            yield piece
+
+
+def _openai_provider() -> LLMProvider:
+    return OpenAIProvider()
+
+
+def _openai_compatible_provider() -> LLMProvider:
+    # e.g. vLLM, llama.cpp server, Ollama: LLM_API_BASE=http://localhost:8000/v1
+    api_base = os.getenv("LLM_API_BASE", "")
+    if not api_base:
+        raise RuntimeError("LLM_PROVIDER=openai_compatible needs LLM_API_BASE.")
+    return OpenAIProvider(
+        api_base=api_base,
+        api_key=os.getenv("LLM_API_KEY", ""),
+        default_model=os.getenv("LLM_MODEL", "gpt-4o-mini"),
+        require_api_key=False,
+    )
+
+
+def _fake_provider() -> LLMProvider:
+    return FakeProvider(
+        latency=os.getenv("LLM_FAKE_LATENCY", "lognormal:800:0.5"),
+        tokens_per_second=float(os.getenv("LLM_FAKE_TOKENS_PER_SECOND", "80")),
+        error_rate=float(os.getenv("LLM_FAKE_ERROR_RATE", "0")),
+        seed=int(os.getenv("LLM_FAKE_SEED", "0")),
+    )
+
+
+_PROVIDER_FACTORIES: Dict[str, Callable[[], LLMProvider]] = {
+    "openai": _openai_provider,
+    "openai_compatible": _openai_compatible_provider,
+    "fake": _fake_provider,
+}
+
+
+def register_provider(name: str, factory: Callable[[], LLMProvider]):
+    """Makes LLM_PROVIDER=<name> build the provider with factory()."""
+    _PROVIDER_FACTORIES[name] = factory
+
+
+def make_provider(name: str) -> LLMProvider:
+    factory = _PROVIDER_FACTORIES.get(name)
+    if factory is None:
+        raise ValueError(
+            f"Unknown LLM provider {name!r}; expected one of {sorted(_PROVIDER_FACTORIES)}"
+        )
+    return factory()
@@ -1,19 +1,61 @@
-from fastapi import FastAPI
+import os
+import json
+import time
+from typing import Dict, List
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from .models import (
     BuildKBRequest,
     BuildKBResponse,
+    Document,
+    JobStatus,
+    UpsertDocumentsRequest,
+    UpsertDocumentsResponse,
+    DeleteDocumentsRequest,
+    DeleteDocumentsResponse,
     GenerateTestCasesRequest,
     GenerateTestCasesResponse,
     GenerateSeleniumScriptRequest,
     GenerateSeleniumScriptResponse,
+    GenerateSeleniumScriptsRequest,
+    GenerateSeleniumScriptsResponse,
+    SeleniumScriptResult,
     TestCase,
 )
-from .rag_engine import build_knowledge_base, generate_test_cases, generate_selenium_script_from_test_case
+from .jobs import JobQueue
+from .metrics import metrics
+from .kb_registry import InvalidKBId, validate_kb_id
+from .llm_client import get_response_cache, aclose_llm_client
+from .rag_engine import (
+    DuplicateFilenames,
+    check_unique_filenames,
+    build_knowledge_base,
+    upsert_documents,
+    delete_documents,
+    get_embedding_cache_stats,
+    get_retrieval_cache_stats,
+    get_kb_registry,
+    get_readiness,
+    start_warm_up,
+    delete_knowledge_base,
+    generate_test_cases,
+    generate_selenium_script_from_test_case,
+    agenerate_test_cases,
+    agenerate_selenium_script_from_test_case,
+    agenerate_selenium_scripts,
+    astream_test_cases,
+    shutdown_ingest_pool,
+)
 
 app = FastAPI(title="Autonomous QA Agent Backend")
 
+# KB builds submitted via /build_kb_async run here, one at a time
+_jobs = JobQueue()
+
 # Allow Streamlit on localhost to call this API
 app.add_middleware(
     CORSMiddleware,
@@ -24,39 +66,251 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # label by route template (/jobs/{job_id}), not the raw path, so
+        # ids do not create a series each
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        # for streaming endpoints this is the time to the first byte
+        metrics.observe(
+            "http_request_duration_seconds", time.perf_counter() - start,
+            method=request.method, path=path,
+        )
+        metrics.inc(
+            "http_requests_total", method=request.method, path=path, status=str(status)
+        )
+
+
+@app.exception_handler(InvalidKBId)
+async def invalid_kb_id_handler(request: Request, exc: InvalidKBId):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+
+@app.exception_handler(DuplicateFilenames)
+async def duplicate_filenames_handler(request: Request, exc: DuplicateFilenames):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+
+@app.on_event("startup")
+def warm_up_on_start():
+    # opt-in: loads the embedding model in the background so the first
+    # request does not pay for it; /ready reports when it is done
+    if os.getenv("BACKEND_WARMUP", "") in ("1", "true", "yes"):
+        start_warm_up()
+
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await aclose_llm_client()
+
+
+@app.on_event("shutdown")
+def stop_ingest_workers():
+    shutdown_ingest_pool()
+
+
 @app.get("/health")
 def health():
+    """Liveness: the process is up and serving HTTP."""
     return {"status": "ok"}
 
 
-@app.post("/build_kb", response_model=BuildKBResponse)
-def build_kb(req: BuildKBRequest):
-    docs = [
+@app.get("/ready")
+def ready():
+    """Readiness: 503 while the startup warm-up is still loading (or failed)."""
+    readiness = get_readiness()
+    if not readiness["ready"]:
+        return JSONResponse(status_code=503, content=readiness)
+    return readiness
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    Per-stage latency summaries (p50/p95/p99 over recent samples), request,
+    chunk, cache and LLM token counters in the Prometheus text format.
+    """
+    return PlainTextResponse(
+        metrics.render_prometheus(), media_type="text/plain; version=0.0.4"
+    )
+
+
+def _documents_payload(documents: List[Document]) -> List[Dict[str, str]]:
+    return [
         {
             "filename": d.filename,
             "content": d.content,
             "doc_type": d.doc_type,
         }
-        for d in req.documents
+        for d in documents
     ]
-    num_chunks = build_knowledge_base(docs)
+
+
+@app.post("/build_kb", response_model=BuildKBResponse)
+def build_kb(req: BuildKBRequest):
+    num_chunks = build_knowledge_base(_documents_payload(req.documents), kb_id=req.kb_id)
     return BuildKBResponse(
         message="Knowledge Base Built",
         num_chunks=num_chunks,
     )
 
 
+@app.post("/build_kb_async", response_model=JobStatus, status_code=202)
+def build_kb_async(req: BuildKBRequest):
+    """
+    Queues a KB build and returns at once; poll /jobs/{id} for progress.
+    Builds run one at a time in submission order.
+    """
+    validate_kb_id(req.kb_id)
+    docs = _documents_payload(req.documents)
+    check_unique_filenames(docs)
+    job = _jobs.submit("build_kb", _build_kb_job, docs, req.kb_id)
+    return JobStatus(**job.to_dict())
+
+
+def _build_kb_job(docs, kb_id, progress):
+    return {
+        "kb_id": kb_id,
+        "num_chunks": build_knowledge_base(docs, progress=progress, kb_id=kb_id),
+    }
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+def job_status(job_id: str):
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return JobStatus(**job.to_dict())
+
+
+@app.post("/jobs/{job_id}/cancel", response_model=JobStatus)
+def cancel_job(job_id: str):
+    """
+    Cancels a queued job, or stops a running one at its next progress
+    checkpoint; a build already writing the store runs to completion.
+    """
+    job = _jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return JobStatus(**job.to_dict())
+
+
+@app.post("/upsert_documents", response_model=UpsertDocumentsResponse)
+def upsert_documents_endpoint(req: UpsertDocumentsRequest):
+    stats = upsert_documents(_documents_payload(req.documents), kb_id=req.kb_id)
+    return UpsertDocumentsResponse(**stats)
+
+
+@app.post("/delete_documents", response_model=DeleteDocumentsResponse)
+def delete_documents_endpoint(req: DeleteDocumentsRequest):
+    return DeleteDocumentsResponse(**delete_documents(req.filenames, kb_id=req.kb_id))
+
+
+@app.get("/kbs")
+def list_kbs():
+    """Known KBs with whether each is loaded, plus the registry's memory use."""
+    registry = get_kb_registry()
+    return {"kbs": registry.list_kbs(), **registry.stats()}
+
+
+@app.delete("/kbs/{kb_id}")
+def delete_kb(kb_id: str):
+    if not delete_knowledge_base(kb_id):
+        raise HTTPException(status_code=404, detail="Unknown knowledge base")
+    return {"deleted": kb_id}
+
+
+@app.get("/embedding_cache")
+def embedding_cache_stats():
+    return get_embedding_cache_stats()
+
+
+@app.get("/retrieval_cache")
+def retrieval_cache_stats():
+    return get_retrieval_cache_stats()
+
+
+@app.get("/llm_cache")
+def llm_cache_stats():
+    cache = get_response_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
 @app.post("/generate_test_cases", response_model=GenerateTestCasesResponse)
 def generate_test_cases_endpoint(req: GenerateTestCasesRequest):
-    result = generate_test_cases(req.query)
+    result = generate_test_cases(req.query, kb_id=req.kb_id)
     return GenerateTestCasesResponse(
         raw_output=result["raw_output"],
         test_cases=result["test_cases"],
     )
 
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/generate_test_cases_stream")
+async def generate_test_cases_stream_endpoint(req: GenerateTestCasesRequest):
+    """
+    Server-sent events: one `test_case` event per test case as the LLM
+    finishes it, then `done` with the raw output (or `error`).
+    """
+
+    async def events():
+        count = 0
+        try:
+            async for kind, payload in astream_test_cases(req.query, kb_id=req.kb_id):
+                if kind == "test_case":
+                    count += 1
+                    yield _sse("test_case", payload.dict())
+                else:
+                    yield _sse("done", {"raw_output": payload, "num_test_cases": count})
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
 @app.post("/generate_selenium_script", response_model=GenerateSeleniumScriptResponse)
 def generate_selenium_script_endpoint(req: GenerateSeleniumScriptRequest):
     tc: TestCase = req.test_case
-    script = generate_selenium_script_from_test_case(tc)
+    script = generate_selenium_script_from_test_case(tc, kb_id=req.kb_id)
     return GenerateSeleniumScriptResponse(script=script)
+
+
+# Async variants: the LLM call is awaited on the event loop instead of holding
+# a threadpool worker, so many generations can be in flight per process.
+@app.post("/generate_test_cases_async", response_model=GenerateTestCasesResponse)
+async def generate_test_cases_async_endpoint(req: GenerateTestCasesRequest):
+    result = await agenerate_test_cases(req.query, kb_id=req.kb_id)
+    return GenerateTestCasesResponse(
+        raw_output=result["raw_output"],
+        test_cases=result["test_cases"],
+    )
+
+
+@app.post("/generate_selenium_script_async", response_model=GenerateSeleniumScriptResponse)
+async def generate_selenium_script_async_endpoint(req: GenerateSeleniumScriptRequest):
+    tc: TestCase = req.test_case
+    script = await agenerate_selenium_script_from_test_case(tc, kb_id=req.kb_id)
+    return GenerateSeleniumScriptResponse(script=script)
+
+
+@app.post("/generate_selenium_scripts", response_model=GenerateSeleniumScriptsResponse)
+async def generate_selenium_scripts_endpoint(req: GenerateSeleniumScriptsRequest):
+    results = await agenerate_selenium_scripts(
+        req.test_cases, req.max_concurrency, kb_id=req.kb_id
+    )
+    return GenerateSeleniumScriptsResponse(
+        results=[SeleniumScriptResult(**r) for r in results],
+    )
@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+# Latency quantiles are computed over the most recent METRICS_WINDOW samples
+# of each series; _sum and _count are cumulative since process start.
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1024"))
+METRICS_DISABLED = os.getenv("METRICS_DISABLED", "") in ("1", "true", "yes")
+METRICS_PREFIX = "autoqa_"
+QUANTILES = (0.5, 0.95, 0.99)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Summary:
+    """
+    One latency series: cumulative count and sum plus a bounded window of
+    recent samples for quantiles. Observing is an append, so it is cheap
+    enough for every request; sorting happens only when metrics are read.
+    """
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.count = 0
+        self.sum = 0.0
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def quantiles(self, qs=QUANTILES) -> Dict[float, float]:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in qs}
+        last = len(ordered) - 1
+        return {q: ordered[min(last, int(round(q * last)))] for q in qs}
+
+
+class _Span:
+    __slots__ = ("registry", "name", "labels", "start")
+
+    def __init__(self, registry: "MetricsRegistry", name: str, labels: Dict[str, str]):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(
+            "stage_duration_seconds", time.perf_counter() - self.start,
+            stage=self.name, **self.labels,
+        )
+        return False
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and latency summaries, keyed by name and labels.
+    Rendered in the Prometheus text exposition format by render_prometheus.
+
+    Process-pool workers (parallel ingest) keep their own registry, so spans
+    recorded inside them are not reported; the parent times the whole step.
+    """
+
+    def __init__(self, window: int = METRICS_WINDOW, enabled: bool = not METRICS_DISABLED):
+        self.window = window
+        self.enabled = enabled
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._summaries: Dict[str, Dict[LabelKey, Summary]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        if not self.enabled or not amount:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._summaries.setdefault(name, {})
+            summary = series.get(key)
+            if summary is None:
+                summary = series[key] = Summary(self.window)
+            summary.observe(value)
+
+    def span(self, stage: str, **labels):
+        """
+        Context manager timing one pipeline stage into
+        stage_duration_seconds{stage=...}.
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, stage, labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+    def snapshot(self) -> Dict[str, List[Dict]]:
+        """Counters and summaries (with quantiles) as plain dicts."""
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(key), "value": value}
+                for name, series in self._counters.items()
+                for key, value in series.items()
+            ]
+            summaries = [
+                {
+                    "name": name,
+                    "labels": dict(key),
+                    "count": s.count,
+                    "sum": s.sum,
+                    "quantiles": s.quantiles(),
+                }
+                for name, series in self._summaries.items()
+                for key, s in series.items()
+            ]
+        return {"counters": counters, "summaries": summaries}
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._counters):
+                full = METRICS_PREFIX + name
+                lines.append(f"# TYPE {full} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{full}{_format_labels(key)} {_format_value(value)}")
+            for name in sorted(self._summaries):
+                full = METRICS_PREFIX + name
+                lines.append(f"# TYPE {full} summary")
+                for key, s in sorted(self._summaries[name].items()):
+                    for q, v in s.quantiles().items():
+                        lines.append(f"{full}{_format_labels(key, ('quantile', str(q)))} {v:.6g}")
+                    lines.append(f"{full}_sum{_format_labels(key)} {s.sum:.6g}")
+                    lines.append(f"{full}_count{_format_labels(key)} {s.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def span(stage: str, **labels):
+    """Times a stage on the process-wide registry; see MetricsRegistry.span."""
+    return metrics.span(stage, **labels)
+
+
+def timed(stage: str):
+    """Decorator form of span for functions that are a stage on their own."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with metrics.span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
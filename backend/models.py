@@ -1,5 +1,5 @@
-from typing import List, Optional
-from pydantic import BaseModel
+from typing import Any, List, Optional
+from pydantic import BaseModel, Field
 
 
 class Document(BaseModel):
@@ -10,6 +10,7 @@ class Document(BaseModel):
 
 class BuildKBRequest(BaseModel):
     documents: List[Document]
+    kb_id: str = "default"
 
 
 class BuildKBResponse(BaseModel):
@@ -17,6 +18,45 @@ class BuildKBResponse(BaseModel):
     num_chunks: int
 
 
+class JobStatus(BaseModel):
+    id: str
+    kind: str
+    status: str  # "queued", "running", "succeeded", "failed" or "cancelled"
+    stage: str  # "queued", "parsing", "embedding", "writing" or "done"
+    done: int
+    total: int
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancel_requested: bool = False
+
+
+class UpsertDocumentsRequest(BaseModel):
+    documents: List[Document]
+    kb_id: str = "default"
+
+
+class UpsertDocumentsResponse(BaseModel):
+    added: int
+    updated: int
+    unchanged: int
+    embedded_chunks: int
+    reused_chunks: int
+    num_chunks: int
+
+
+class DeleteDocumentsRequest(BaseModel):
+    filenames: List[str]
+    kb_id: str = "default"
+
+
+class DeleteDocumentsResponse(BaseModel):
+    deleted: List[str]
+    num_chunks: int
+
+
 class TestCase(BaseModel):
     id: str
     feature: str
@@ -28,6 +68,7 @@ class TestCase(BaseModel):
 
 class GenerateTestCasesRequest(BaseModel):
     query: str
+    kb_id: str = "default"
 
 
 class GenerateTestCasesResponse(BaseModel):
@@ -37,7 +78,24 @@ class GenerateTestCasesResponse(BaseModel):
 
 class GenerateSeleniumScriptRequest(BaseModel):
     test_case: TestCase
+    kb_id: str = "default"
 
 
 class GenerateSeleniumScriptResponse(BaseModel):
     script: str
+
+
+class GenerateSeleniumScriptsRequest(BaseModel):
+    test_cases: List[TestCase]
+    max_concurrency: Optional[int] = Field(None, ge=1)
+    kb_id: str = "default"
+
+
+class SeleniumScriptResult(BaseModel):
+    test_case_id: str
+    script: Optional[str] = None
+    error: Optional[str] = None
+
+
+class GenerateSeleniumScriptsResponse(BaseModel):
+    results: List[SeleniumScriptResult]
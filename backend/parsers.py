@@ -1,24 +1,71 @@
-from typing import List, Dict, Any, Tuple
-from bs4 import BeautifulSoup
+from typing import List, Dict, Any, Tuple, Iterator, Optional
+import importlib.util
 import json
+import re
+
+from .metrics import span
+
+# bs4 (and lxml) are imported on first use, not at import time, to keep
+# backend startup fast.
+
+# lxml is several times faster than the pure-Python parser; use it when present
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+# Upper bound for structure-aware chunks; all-MiniLM-L6-v2 truncates at
+# 256 word pieces, roughly 1000 characters of English.
+CHUNK_MAX_CHARS = 800
 
 
 def parse_support_document(filename: str, content: str) -> str:
     """
-    For .md, .txt: return as-is.
-    For .json: pretty-print.
+    For .md, .txt, .json: return as-is.
+    JSON is no longer re-indented: iter_chunks splits it by key straight from
+    the uploaded text, so chunk offsets point into the original file.
     You can extend this for PDF, etc.
     """
-    lower = filename.lower()
-    if lower.endswith(".json"):
-        try:
-            obj = json.loads(content)
-            return json.dumps(obj, indent=2)
-        except Exception:
-            return content
+    return content
+
+
+def chunk_format(filename: str, doc_type: str) -> str:
+    """Picks the iter_chunks splitter for a document."""
+    if doc_type == "html":
+        return "markdown"  # parse_checkout_page marks headings with "#"
+    if filename.lower().endswith(".json"):
+        return "json"
+    return "markdown"
+
+
+def parse_document(
+    filename: str, content: str, doc_type: str
+) -> Tuple[Iterator[Tuple[int, int, str]], str, str, str]:
+    """
+    Parses and chunks one uploaded document.
+    Returns (lazy (start, end, chunk) spans, doc_type tag for metadata,
+    full html or "", DOM digest or "").
+    """
+    fmt = chunk_format(filename, doc_type)
+    if doc_type == "support":
+        parsed_text = parse_support_document(filename, content)
+        return iter_chunks(parsed_text, fmt), "support", "", ""
+    elif doc_type == "html":
+        full_html, html_text, digest = parse_checkout_page(content)
+        return iter_chunks(html_text, fmt), "html", full_html, digest
     else:
-        # .md, .txt, others – treat as plain text
-        return content
+        # fallback treat as support text
+        return iter_chunks(content, fmt), "unknown", "", ""
+
+
+def parse_document_chunks(
+    doc: Dict[str, Any]
+) -> Tuple[List[Tuple[int, int, str]], str, str, str]:
+    """
+    parse_document with the spans materialized, for process-pool workers
+    (generators cannot be sent back to the parent). doc: {filename, content, doc_type}
+    """
+    spans, doc_type, full_html, digest = parse_document(
+        doc["filename"], doc["content"], doc["doc_type"]
+    )
+    return list(spans), doc_type, full_html, digest
 
 
 def parse_checkout_html(content: str) -> Tuple[str, str]:
@@ -27,27 +74,374 @@ def parse_checkout_html(content: str) -> Tuple[str, str]:
       - full_html (original)
       - extracted_text (for KB)
     """
-    full_html = content
-    soup = BeautifulSoup(content, "html.parser")
-    text = soup.get_text(separator="\n")
+    full_html, text, _ = parse_checkout_page(content)
     return full_html, text
 
 
+def parse_checkout_page(content: str) -> Tuple[str, str, str]:
+    """
+    Like parse_checkout_html, plus a compact DOM digest (see build_dom_digest)
+    computed from the same parse.
+    """
+    from bs4 import BeautifulSoup
+
+    with span("html_parse"):
+        soup = BeautifulSoup(content, HTML_PARSER)
+    with span("dom_digest"):
+        digest = build_dom_digest(soup)
+
+    # CSS is noise for retrieval; headings become Markdown-style so the
+    # text can be chunked by section.
+    for style in soup.find_all("style"):
+        style.decompose()
+    for heading in soup.find_all(re.compile(r"^h[1-6]$")):
+        heading.string = "#" * int(heading.name[1]) + " " + heading.get_text(" ", strip=True)
+    text = soup.get_text(separator="\n")
+    text = re.sub(r"[ \t]+\n", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text).strip()
+    return content, text, digest
+
+
+_INTERACTIVE_TAGS = ("form", "input", "select", "textarea", "button", "a", "option")
+_DIGEST_ATTRS = ("id", "name", "type", "value", "for", "href", "placeholder", "min", "max")
+_JS_LISTENER_RE = re.compile(
+    r"""(getElementById|querySelector(?:All)?)\(\s*["'`](.+?)["'`]\s*\)"""
+    r"""[^;]*?addEventListener\(\s*["'`](\w+)["'`]"""
+)
+_JS_TAG_RE = re.compile(r"<(input|select|textarea|button|a)\b[^>]*>", re.I)
+_JS_MESSAGE_RE = re.compile(r"""\.(?:innerText|textContent)\s*=\s*["'`]([^"'`]+)["'`]""")
+
+
+def _element_signature(el, labels: Dict[str, str]) -> str:
+    sig = el.name
+    if el.get("id"):
+        sig += f"#{el['id']}"
+    for cls in el.get("class", []):
+        sig += f".{cls}"
+    attrs = []
+    for attr in _DIGEST_ATTRS:
+        if attr == "id" or el.get(attr) is None:
+            continue
+        attrs.append(f"{attr}={el[attr]}")
+    attrs.extend(f"{k}={v}" for k, v in el.attrs.items() if k.startswith("data-"))
+    for flag in ("checked", "disabled", "required", "novalidate", "selected"):
+        if el.has_attr(flag):
+            attrs.append(flag)
+    if attrs:
+        sig += " [" + ", ".join(attrs) + "]"
+    text = " ".join(el.get_text(" ", strip=True).split())
+    if el.name == "label" and el.find("input") is not None:
+        text = ""
+    if text and el.name != "form":
+        sig += f' "{text[:60]}"'
+    label = labels.get(el.get("id", "")) or _wrapping_label(el)
+    if label:
+        sig += f' (label: "{label}")'
+    return sig
+
+
+def _wrapping_label(el) -> str:
+    parent = el.find_parent("label")
+    if parent is None:
+        return ""
+    return " ".join(parent.get_text(" ", strip=True).split())[:60]
+
+
+def build_dom_digest(html) -> str:
+    """
+    Compact, selector-oriented summary of a page for script generation:
+    title, forms with their fields, interactive elements, other elements with
+    ids (e.g. totals and error slots), and what the inline scripts hook into.
+    A few hundred tokens instead of the full markup with CSS and JS.
+
+    html: raw HTML string or an already-parsed BeautifulSoup.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = html if isinstance(html, BeautifulSoup) else BeautifulSoup(html, HTML_PARSER)
+    scripts = [s.get_text() for s in soup.find_all("script")]
+
+    labels = {
+        lab["for"]: " ".join(lab.get_text(" ", strip=True).split())
+        for lab in soup.find_all("label")
+        if lab.get("for")
+    }
+
+    lines: List[str] = []
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    if title:
+        lines.append(f"Page title: {title}")
+
+    body = soup.body or soup
+    seen: Dict[str, int] = {}
+    order: List[str] = []
+    for el in body.find_all(True):
+        if el.name in ("script", "style"):
+            continue
+        if el.name not in _INTERACTIVE_TAGS and not el.get("id"):
+            continue
+        sig = _element_signature(el, labels)
+        form = el.find_parent("form")
+        if form is not None and el.name != "form":
+            sig = "  - " + sig  # indent fields under their form
+        else:
+            sig = "- " + sig
+        if sig not in seen:
+            order.append(sig)
+            seen[sig] = 0
+        seen[sig] += 1
+
+    lines.append("Elements (document order; indented = inside the form above):")
+    for sig in order:
+        count = seen[sig]
+        lines.append(sig + (f" x{count}" if count > 1 else ""))
+
+    script_text = "\n".join(scripts)
+    listeners = sorted(
+        {
+            f"{'#' if fn == 'getElementById' else ''}{sel} -> {event}"
+            for fn, sel, event in _JS_LISTENER_RE.findall(script_text)
+        }
+    )
+    if listeners:
+        lines.append("Script event listeners (selector -> event):")
+        lines.extend(f"- {l}" for l in listeners)
+    rendered = list(dict.fromkeys(m.group(0) for m in _JS_TAG_RE.finditer(script_text)))
+    if rendered:
+        lines.append("Elements rendered by script:")
+        lines.extend(f"- {t}" for t in rendered)
+    messages = list(dict.fromkeys(_JS_MESSAGE_RE.findall(script_text)))
+    if messages:
+        lines.append("Messages set by script:")
+        lines.extend(f'- "{m}"' for m in messages)
+
+    return "\n".join(lines)
+
+
 def chunk_text(text: str, chunk_size: int = 500, overlap: int = 100) -> List[str]:
     """
     Simple character-based chunking.
     """
+    return [c for _, _, c in chunk_spans(text, chunk_size, overlap)]
+
+
+def chunk_spans(
+    text: str, chunk_size: int = 500, overlap: int = 100
+) -> List[Tuple[int, int, str]]:
+    """
+    chunk_text with positions: (start, end, chunk) where chunk is exactly
+    text[start:end] after "\r" removal, so overlapping hits can be stitched
+    back together later.
+    """
     text = text.replace("\r", "")
-    chunks = []
+    spans = []
     start = 0
     while start < len(text):
         end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk.strip())
+        window = text[start:end]
+        stripped = window.strip()
+        if stripped:
+            lead = len(window) - len(window.lstrip())
+            s0 = start + lead
+            spans.append((s0, s0 + len(stripped), stripped))
         start = end - overlap
         if start < 0:
             start = 0
         if start >= len(text):
             break
-    # Filter out empty chunks
-    return [c for c in chunks if c]
+    return spans
+
+
+# Markdown headings, and numbered headings ("1. Form Validation") only after
+# a blank line, so the steps of a numbered list stay in one section
+_HEADING_RE = re.compile(r"^(?:#{1,6}\s+\S|(?<=\n\n)\d+[.)]\s+\S)", re.M)
+_FENCE_RE = re.compile(r"^(```|~~~)", re.M)
+_JSON_WS_RE = re.compile(r"\s*")
+_json_decoder = json.JSONDecoder()
+
+
+def iter_chunks(
+    text: str, fmt: str = "markdown", max_chars: int = CHUNK_MAX_CHARS
+) -> Iterator[Tuple[int, int, str]]:
+    """
+    Structure-aware chunker. Yields (start, end, chunk) lazily; start/end are
+    character offsets into `text` (after "\r" removal).
+
+    fmt:
+      - "markdown": sections start at Markdown headings or unindented numbered
+        headings ("1. Form Validation") that follow a blank line, never
+        inside code fences; adjacent small sections are packed up to
+        max_chars, and long ones are split at paragraph, then line, then word
+        boundaries. chunk == text[start:end].
+      - "json": one chunk per top-level key (e.g. per API endpoint) or array
+        element, rendered as compact `path: {...}`; values longer than
+        max_chars are split by their own keys. Invalid JSON falls back to
+        "markdown".
+    """
+    text = text.replace("\r", "")
+    if fmt == "json":
+        try:
+            _json_decoder.decode(text)
+        except ValueError:
+            fmt = "markdown"
+        else:
+            yield from _iter_json_chunks(text, max_chars)
+            return
+    yield from _iter_text_chunks(text, max_chars)
+
+
+def _strip_span(text: str, start: int, end: int) -> Optional[Tuple[int, int, str]]:
+    chunk = text[start:end]
+    stripped = chunk.strip()
+    if not stripped:
+        return None
+    start += len(chunk) - len(chunk.lstrip())
+    return start, start + len(stripped), stripped
+
+
+def _iter_sections(text: str) -> Iterator[Tuple[int, int]]:
+    fences = [m.start() for m in _FENCE_RE.finditer(text)]
+    fenced = list(zip(fences[::2], fences[1::2] + [len(text)]))
+
+    def in_fence(pos: int) -> bool:
+        return any(a < pos < b for a, b in fenced)
+
+    start = 0
+    for m in _HEADING_RE.finditer(text):
+        if m.start() == 0 or in_fence(m.start()):
+            continue
+        yield start, m.start()
+        start = m.start()
+    yield start, len(text)
+
+
+def _split_long(
+    text: str, start: int, end: int, max_chars: int, seps=("\n\n", "\n", " ")
+) -> Iterator[Tuple[int, int]]:
+    if end - start <= max_chars:
+        yield start, end
+        return
+    if not seps:
+        # a single "word" longer than max_chars: hard cut
+        for i in range(start, end, max_chars):
+            yield i, min(i + max_chars, end)
+        return
+
+    sep = seps[0]
+    current = None
+    i = start
+    while i < end:
+        j = text.find(sep, i, end)
+        j = end if j == -1 else j + len(sep)
+        if j - i > max_chars:
+            if current:
+                yield current
+                current = None
+            yield from _split_long(text, i, j, max_chars, seps[1:])
+        elif current and j - current[0] > max_chars:
+            yield current
+            current = (i, j)
+        else:
+            current = (current[0] if current else i, j)
+        i = j
+    if current:
+        yield current
+
+
+def _iter_text_chunks(text: str, max_chars: int) -> Iterator[Tuple[int, int, str]]:
+    current = None
+    for start, end in _iter_sections(text):
+        if end - start > max_chars:
+            if current:
+                span = _strip_span(text, *current)
+                if span:
+                    yield span
+                current = None
+            for piece in _split_long(text, start, end, max_chars):
+                span = _strip_span(text, *piece)
+                if span:
+                    yield span
+            continue
+        if current and end - current[0] > max_chars:
+            span = _strip_span(text, *current)
+            if span:
+                yield span
+            current = None
+        current = (current[0] if current else start, end)
+    if current:
+        span = _strip_span(text, *current)
+        if span:
+            yield span
+
+
+def _json_members(text: str, pos: int) -> Iterator[Tuple[Any, Any, int, int]]:
+    """
+    Yields (key or index, value, start, end) for each member of the JSON
+    object/array whose opening bracket is at text[pos].
+    """
+    closer = "}" if text[pos] == "{" else "]"
+    is_object = closer == "}"
+    idx = pos + 1
+    n = 0
+    while True:
+        idx = _JSON_WS_RE.match(text, idx).end()
+        if text[idx] == closer:
+            return
+        key: Any = n
+        if is_object:
+            key, idx = _json_decoder.raw_decode(text, idx)
+            idx = _JSON_WS_RE.match(text, idx).end() + 1  # skip ':'
+            idx = _JSON_WS_RE.match(text, idx).end()
+        start = idx
+        value, idx = _json_decoder.raw_decode(text, idx)
+        yield key, value, start, idx
+        n += 1
+        idx = _JSON_WS_RE.match(text, idx).end()
+        if text[idx] == ",":
+            idx += 1
+
+
+def _pack_siblings(
+    pieces: Iterator[Tuple[int, int, str]], max_chars: int
+) -> Iterator[Tuple[int, int, str]]:
+    """Joins consecutive small sibling chunks (one per line) up to max_chars."""
+    current = None
+    for start, end, rendered in pieces:
+        if current and len(current[2]) + 1 + len(rendered) <= max_chars:
+            current = (current[0], end, current[2] + "\n" + rendered)
+            continue
+        if current:
+            yield current
+        current = (start, end, rendered)
+    if current:
+        yield current
+
+
+def _iter_json_chunks(text: str, max_chars: int) -> Iterator[Tuple[int, int, str]]:
+    def walk(path: str, value: Any, start: int, end: int):
+        compact = json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+        rendered = f"{path}: {compact}" if path else compact
+        if len(rendered) <= max_chars or not isinstance(value, (dict, list)) or not value:
+            yield start, end, rendered
+            return
+        children = (
+            piece
+            for key, sub, s, e in _json_members(text, start)
+            for piece in walk(_json_path(path, key), sub, s, e)
+        )
+        yield from _pack_siblings(children, max_chars)
+
+    root_start = _JSON_WS_RE.match(text, 0).end()
+    root, root_end = _json_decoder.raw_decode(text, root_start)
+    if not isinstance(root, (dict, list)) or not root:
+        yield root_start, root_end, json.dumps(root, ensure_ascii=False)
+        return
+    # always split at the top level: one chunk per key / endpoint at least
+    for key, value, start, end in _json_members(text, root_start):
+        yield from walk(_json_path("", key), value, start, end)
+
+
+def _json_path(parent: str, key: Any) -> str:
+    if isinstance(key, int):
+        return f"{parent}[{key}]"
+    return f"{parent}.{key}" if parent else key
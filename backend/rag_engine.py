@@ -1,109 +1,670 @@
 import os
 import json
-from typing import List, Dict, Any
+import asyncio
+import hashlib
+import multiprocessing
+import threading
+import time
+from collections import deque
+from typing import (
+    TYPE_CHECKING, List, Dict, Any, Optional, Tuple, Callable, Iterable, Iterator, AsyncIterator
+)
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
-from .vector_store import SimpleVectorStore
-from .parsers import parse_support_document, parse_checkout_html, chunk_text
-from .llm_client import call_llm
+from .vector_store import RowSpool, SimpleVectorStore, StoreSnapshot
+from .kb_registry import KBRegistry, DEFAULT_KB_ID
+from .embedding_cache import EmbeddingCache
+from .query_cache import LRUCache, normalize_query
+from .metrics import metrics, span, timed
+from .parsers import parse_document, parse_document_chunks
+from .context_packer import pack_context, estimate_tokens
+from .llm_client import (
+    call_llm, acall_llm, astream_llm, get_llm_provider, get_response_cache
+)
+from .stream_parser import JSONArrayStreamParser
 from .models import TestCase
 
+if TYPE_CHECKING:
+    # imported on first use: pulling in torch takes seconds
+    from sentence_transformers import SentenceTransformer
+
 
 # use a lightweight sentence-transformer
 EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-_embedding_model: SentenceTransformer = None
-_vector_store = SimpleVectorStore(
-    path=os.path.join(os.path.dirname(__file__), "..", "kb_store.pkl")
+_embedding_model: Optional["SentenceTransformer"] = None
+_embedding_model_lock = threading.Lock()
+# background warm-up (see start_warm_up): idle, warming, ready or failed
+_warm_up_state: Dict[str, Any] = {"status": "idle", "error": None, "seconds": None}
+# parse/chunk changed documents across this many processes (<= 1 disables);
+# batches under INGEST_PARALLEL_MIN_CHARS are not worth the process overhead
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+INGEST_PARALLEL_MIN_CHARS = int(os.getenv("INGEST_PARALLEL_MIN_CHARS", "1000000"))
+_ingest_pool: Optional[ProcessPoolExecutor] = None
+# upper bound on retrieved context per prompt, in (estimated) tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# send the full checkout.html instead of its DOM digest in script prompts
+SCRIPT_PROMPT_FULL_HTML = os.getenv("SCRIPT_PROMPT_FULL_HTML", "") in ("1", "true", "yes")
+# "dense" (embedding similarity, the original behavior), "hybrid" (dense +
+# BM25, rank-fused; set RETRIEVAL_MODE=hybrid to opt in) or "keyword"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+# hybrid only: score dense similarity over BM25 matches instead of the whole KB
+HYBRID_PREFILTER = os.getenv("HYBRID_PREFILTER", "") in ("1", "true", "yes")
+RETRIEVAL_MODES = ("dense", "hybrid", "keyword")
+# chunks per model.encode call; progress is reported between batches
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+# One store per kb_id under kb_stores/; the pre-namespacing kb_store/ keeps
+# serving as the "default" KB. Loaded stores are LRU-evicted past the budget.
+_kb_registry = KBRegistry(
+    root=os.path.join(os.path.dirname(__file__), "..", "kb_stores"),
+    memory_budget_bytes=int(os.getenv("KB_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024,
+    # "flat" (exact) or "ivf" (approximate, recall@5 ~0.96 on clustered data
+    # at its default nprobe; see IVFIndex); unset keeps each store's current type
+    index_type=os.getenv("KB_INDEX_TYPE") or None,
+    # "float16" or "int8": scan a compact copy, rescore candidates in float32
+    quantization=os.getenv("KB_QUANTIZATION") or None,
+    legacy_default_path=os.path.join(os.path.dirname(__file__), "..", "kb_store"),
 )
 
 
-def get_embedding_model() -> SentenceTransformer:
+_embedding_cache = EmbeddingCache(
+    path=os.path.join(os.path.dirname(__file__), "..", "embedding_cache.sqlite"),
+    max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000")),
+)
+
+# In-process caches for repeated and retried requests: query embeddings by
+# (model, normalized query), and finished retrievals by KB version, so a
+# write to a KB makes its cached results unreachable without a purge.
+_query_embedding_cache = LRUCache(int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024")))
+_retrieval_cache = LRUCache(int(os.getenv("RETRIEVAL_CACHE_SIZE", "256")))
+
+# Serializes KB writes (build, upsert, delete) from any thread or job.
+_kb_write_lock = threading.RLock()
+
+# progress(stage, done, total); see jobs.Job.report
+ProgressFn = Callable[[str, int, int], None]
+
+
+def _report(progress: Optional[ProgressFn], stage: str, done: int = 0, total: int = 0):
+    if progress is not None:
+        progress(stage, done, total)
+
+
+def get_embedding_model() -> "SentenceTransformer":
     global _embedding_model
     if _embedding_model is None:
-        _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        with _embedding_model_lock:
+            if _embedding_model is None:
+                from sentence_transformers import SentenceTransformer
+
+                _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
     return _embedding_model
 
 
-def build_knowledge_base(documents: List[Dict[str, Any]]) -> int:
+def warm_up():
     """
-    documents: list of dicts: {filename, content, doc_type}
-      doc_type: "support" or "html"
-    Returns: num_chunks
+    Pays the one-off costs the first request would otherwise see: loads the
+    embedding model and runs a dummy encode, imports the HTML parser and LLM
+    client, and loads the tokenizer used for context packing.
+    """
+    started = time.perf_counter()
+    _warm_up_state.update(status="warming", error=None)
+    try:
+        get_embedding_model().encode(["warm-up"], convert_to_numpy=True)
+        parse_document("warm-up.html", "<html><body></body></html>", "html")
+        estimate_tokens("warm-up")
+        get_llm_provider().warm_up()
+    except Exception as e:
+        _warm_up_state.update(status="failed", error=str(e))
+        raise
+    _warm_up_state.update(status="ready", seconds=time.perf_counter() - started)
+
+
+def start_warm_up() -> bool:
+    """Runs warm_up in a daemon thread once. Returns False if already started."""
+    if _warm_up_state["status"] != "idle":
+        return False
+    _warm_up_state["status"] = "warming"
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    return True
+
+
+def get_readiness() -> Dict[str, Any]:
+    """
+    ready: True unless a warm-up is still running or has failed; without a
+    warm-up the backend serves requests, loading what it needs on first use.
     """
-    model = get_embedding_model()
+    status = _warm_up_state["status"]
+    return {
+        "ready": status in ("idle", "ready"),
+        "warm_up": status,
+        "embedding_model_loaded": _embedding_model is not None,
+        "error": _warm_up_state["error"],
+        "warm_up_seconds": _warm_up_state["seconds"],
+    }
+
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
 
-    all_chunks: List[str] = []
-    metadatas: List[Dict[str, Any]] = []
-    html_full_content = ""
+def _document_hash(doc: Dict[str, Any]) -> str:
+    return _hash_text(f"{doc['doc_type']}\n{doc['content']}")
 
-    # reset store
-    _vector_store.reset()
 
+class DuplicateFilenames(ValueError):
+    pass
+
+
+def check_unique_filenames(documents: List[Dict[str, Any]]):
+    """
+    Filenames key the manifest and the chunk-hash diff, so one request must
+    not carry the same filename twice. Raises DuplicateFilenames.
+    """
+    seen = set()
+    duplicates = set()
     for doc in documents:
-        filename = doc["filename"]
-        content = doc["content"]
-        doc_type = doc["doc_type"]
-
-        if doc_type == "support":
-            parsed_text = parse_support_document(filename, content)
-            chunks = chunk_text(parsed_text)
-            for c in chunks:
-                all_chunks.append(c)
-                metadatas.append({"source": filename, "doc_type": "support"})
-        elif doc_type == "html":
-            full_html, html_text = parse_checkout_html(content)
-            html_full_content = full_html
-            chunks = chunk_text(html_text)
-            for c in chunks:
-                all_chunks.append(c)
-                metadatas.append({"source": filename, "doc_type": "html"})
-        else:
-            # fallback treat as support text
-            chunks = chunk_text(content)
-            for c in chunks:
-                all_chunks.append(c)
-                metadatas.append({"source": filename, "doc_type": "unknown"})
-
-    if not all_chunks:
-        return 0
-
-    embeddings = model.encode(all_chunks, convert_to_numpy=True)
-    _vector_store.add_documents(
-        embeddings=embeddings,
-        texts=all_chunks,
-        metadatas=metadatas,
-        html_full=html_full_content,
+        (duplicates if doc["filename"] in seen else seen).add(doc["filename"])
+    if duplicates:
+        raise DuplicateFilenames(
+            f"Duplicate filenames in request: {', '.join(sorted(duplicates))}"
+        )
+
+
+def embed_chunks(
+    chunks: List[str],
+    chunk_hashes: List[str],
+    progress: Optional[ProgressFn] = None,
+) -> np.ndarray:
+    """
+    Embeds chunks, serving vectors from the persistent cache where possible
+    and caching the ones that had to be computed. Misses are encoded in
+    batches of EMBED_BATCH_SIZE, reporting ("embedding", done, total) after each.
+    """
+    cached = _embedding_cache.get_many(EMBEDDING_MODEL_NAME, chunk_hashes)
+    missing = [i for i, v in enumerate(cached) if v is None]
+    total = len(chunks)
+    done = total - len(missing)
+    metrics.inc("cache_requests_total", done, cache="embedding", result="hit")
+    metrics.inc("cache_requests_total", len(missing), cache="embedding", result="miss")
+    _report(progress, "embedding", done, total)
+    if missing:
+        model = get_embedding_model()
+        for b in range(0, len(missing), EMBED_BATCH_SIZE):
+            batch = missing[b : b + EMBED_BATCH_SIZE]
+            with span("embed"):
+                fresh = model.encode([chunks[i] for i in batch], convert_to_numpy=True)
+            _embedding_cache.put_many(
+                EMBEDDING_MODEL_NAME, [chunk_hashes[i] for i in batch], fresh
+            )
+            for i, vec in zip(batch, fresh):
+                cached[i] = vec
+            done += len(batch)
+            _report(progress, "embedding", done, total)
+    return np.vstack(cached).astype(np.float32, copy=False)
+
+
+def get_embedding_cache_stats() -> Dict[str, Any]:
+    return _embedding_cache.stats()
+
+
+def get_retrieval_cache_stats() -> Dict[str, Any]:
+    return {
+        "query_embeddings": _query_embedding_cache.stats(),
+        "retrievals": _retrieval_cache.stats(),
+    }
+
+
+def get_kb_registry() -> KBRegistry:
+    return _kb_registry
+
+
+def _get_store(kb_id: str) -> SimpleVectorStore:
+    return _kb_registry.get(kb_id)
+
+
+def _get_ingest_pool() -> Optional[ProcessPoolExecutor]:
+    global _ingest_pool
+    if INGEST_WORKERS <= 1:
+        return None
+    if _ingest_pool is None:
+        # spawn, not fork: the server is multi-threaded (uvicorn, job queue,
+        # warm-up, torch) and holds SQLite connections, and a forked child
+        # would inherit the loaded embedding stack. Spawned workers only
+        # import backend.parsers (parse_document_chunks) and its bs4/lxml.
+        _ingest_pool = ProcessPoolExecutor(
+            max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _ingest_pool
+
+
+def shutdown_ingest_pool():
+    """Stops the parse/chunk worker processes; call on application shutdown."""
+    global _ingest_pool
+    if _ingest_pool is not None:
+        _ingest_pool.shutdown(cancel_futures=True)
+    _ingest_pool = None
+
+
+def _parse_documents(
+    docs: List[Dict[str, Any]]
+) -> Iterator[Tuple[Iterable[Tuple[int, int, str]], str, str, str]]:
+    """
+    Parses and chunks documents, in input order. Large batches are spread
+    over a process pool, with at most two documents per worker in flight so
+    parsed results never pile up ahead of embedding; small ones stay
+    in-process, where chunks stream lazily and nothing is paid for pickling.
+    """
+    total_chars = sum(len(d["content"]) for d in docs)
+    pool = _get_ingest_pool()
+    if pool is None or len(docs) < 2 or total_chars < INGEST_PARALLEL_MIN_CHARS:
+        for doc in docs:
+            yield parse_document(doc["filename"], doc["content"], doc["doc_type"])
+        return
+    pending = deque(
+        pool.submit(parse_document_chunks, doc) for doc in docs[: INGEST_WORKERS * 2]
     )
+    for doc in docs[INGEST_WORKERS * 2 :]:
+        result = pending.popleft().result()
+        pending.append(pool.submit(parse_document_chunks, doc))
+        yield result
+    while pending:
+        yield pending.popleft().result()
+
+
+def upsert_documents(
+    documents: List[Dict[str, Any]],
+    remove: Optional[List[str]] = None,
+    progress: Optional[ProgressFn] = None,
+    kb_id: str = DEFAULT_KB_ID,
+) -> Dict[str, Any]:
+    """
+    Adds or replaces documents in the KB without touching the others.
+    Documents whose content hash is unchanged are skipped entirely; for changed
+    documents only chunks whose hash was not already stored get re-embedded.
+    Documents named in `remove` are dropped in the same store write.
 
-    return len(all_chunks)
+    documents: list of dicts: {filename, content, doc_type}
+    progress: called with ("parsing" | "embedding" | "writing", done, total);
+      parsing and embedding interleave, and the embedding total grows as
+      documents are chunked. It may raise to abort, which is safe up to and
+      including "writing"
+    Returns: counts of added/updated/unchanged documents and embedded/reused chunks
+    """
+    with _kb_write_lock:
+        store = _get_store(kb_id)
+        # the store lock also covers the diff against the live version, which
+        # another process (or an evicted copy of this store) may have moved
+        with store.locked():
+            stats = _upsert_documents(store, documents, remove or [], progress)
+        _kb_registry.touch(kb_id, store)
+        return stats
+
+
+def _embed_rows(
+    base: StoreSnapshot,
+    previous: Dict[str, int],
+    texts: List[str],
+    chunk_hashes: List[str],
+) -> Tuple[np.ndarray, int]:
+    """
+    Vectors for one batch of chunks: stored rows (`previous`, by chunk hash)
+    where a chunk survived an edit unchanged, embed_chunks for the rest.
+    Returns (embeddings, number of chunks embedded).
+    """
+    missing = [i for i, h in enumerate(chunk_hashes) if h not in previous]
+    reused = [i for i, h in enumerate(chunk_hashes) if h in previous]
+    if missing:
+        fresh = embed_chunks([texts[i] for i in missing], [chunk_hashes[i] for i in missing])
+        dim = fresh.shape[1]
+    else:
+        dim = base.embeddings.shape[1]
+    embeddings = np.empty((len(texts), dim), dtype=np.float32)
+    if missing:
+        embeddings[missing] = fresh
+    if reused:
+        embeddings[reused] = base.embeddings[[previous[chunk_hashes[i]] for i in reused]]
+    return embeddings, len(missing)
+
+
+def _upsert_documents(
+    store: SimpleVectorStore,
+    documents: List[Dict[str, Any]],
+    remove: List[str],
+    progress: Optional[ProgressFn],
+) -> Dict[str, Any]:
+    check_unique_filenames(documents)
+    base = store.snapshot()
+    remove = [f for f in remove if f in base.documents]
+    stats = {
+        "added": 0,
+        "updated": 0,
+        "unchanged": 0,
+        "embedded_chunks": 0,
+        "reused_chunks": 0,
+    }
 
+    changed: List[Tuple[Dict[str, Any], str, Optional[Dict[str, Any]]]] = []
+    for doc in documents:
+        filename = doc["filename"]
+        doc_hash = _document_hash(doc)
+        existing = base.documents.get(filename)
+        if existing is not None and existing["hash"] == doc_hash:
+            stats["unchanged"] += 1
+            continue
+        stats["updated" if existing is not None else "added"] += 1
+        changed.append((doc, doc_hash, existing))
+
+    if not changed and not remove:
+        stats["num_chunks"] = len(base.records)
+        return stats
+
+    # Stored vectors of the changed documents by chunk hash, so chunks that
+    # survived an edit unchanged are not re-embedded.
+    previous: Dict[str, int] = {}
+    for doc, _, existing in changed:
+        if existing is not None:
+            rows = base.document_rows(doc["filename"])
+            previous.update(zip(existing["chunk_hashes"], rows))
+
+    manifest: Dict[str, Dict[str, Any]] = {}
+    html_full_content = None
+    html_digest_content = None
+    if any(base.documents[f]["doc_type"] == "html" for f in remove):
+        html_full_content = ""
+        html_digest_content = ""
+
+    # Chunks are embedded EMBED_BATCH_SIZE at a time as parsing produces
+    # them and spilled to disk, so memory stays flat however large the upload.
+    rows = RowSpool(store.path)
+    batch: List[Tuple[str, str, Dict[str, Any]]] = []
+    num_chunks = 0
+
+    def flush():
+        texts = [c for c, _, _ in batch]
+        embeddings, embedded = _embed_rows(base, previous, texts, [h for _, h, _ in batch])
+        rows.append(embeddings, texts, [m for _, _, m in batch])
+        stats["embedded_chunks"] += embedded
+        stats["reused_chunks"] += len(batch) - embedded
+        batch.clear()
+        _report(progress, "embedding", len(rows), num_chunks)
 
-def retrieve_context(query: str, top_k: int = 8) -> Dict[str, Any]:
-    if _vector_store.is_empty():
-        raise RuntimeError("Knowledge base is empty. Build it first.")
+    try:
+        _report(progress, "parsing", 0, len(changed))
+        parsed = _parse_documents([doc for doc, _, _ in changed])
+        for n, (doc, doc_hash, existing) in enumerate(changed):
+            with span("parse"):
+                spans, doc_type, full_html, digest = next(parsed)
+            filename = doc["filename"]
+            if doc_type == "html":
+                html_full_content = full_html
+                html_digest_content = digest
+            elif existing is not None and existing["doc_type"] == "html":
+                html_full_content = ""
+                html_digest_content = ""
+
+            doc_chunk_hashes: List[str] = []
+            for start, end, c in spans:
+                chunk_hash = _hash_text(c)
+                doc_chunk_hashes.append(chunk_hash)
+                metadata = {"source": filename, "doc_type": doc_type, "start": start, "end": end}
+                batch.append((c, chunk_hash, metadata))
+                num_chunks += 1
+                if len(batch) >= EMBED_BATCH_SIZE:
+                    flush()
+            manifest[filename] = {
+                "hash": doc_hash,
+                "doc_type": doc_type,
+                "chunk_hashes": doc_chunk_hashes,
+            }
+            _report(progress, "parsing", n + 1, len(changed))
+        if batch:
+            flush()
+
+        metrics.inc("chunks_total", num_chunks, op="parsed")
+        metrics.inc("chunks_total", stats["embedded_chunks"], op="embedded")
+        metrics.inc("chunks_total", stats["reused_chunks"], op="reused")
+        _report(progress, "writing", num_chunks, num_chunks)
+        with span("write"):
+            store.replace_documents(
+                documents=manifest,
+                embeddings=None,
+                texts=[],
+                metadatas=[],
+                remove=remove,
+                html_full=html_full_content,
+                html_digest=html_digest_content,
+                rows=rows,
+            )
+    finally:
+        rows.discard()
+    stats["num_chunks"] = len(store.records)
+    return stats
 
-    model = get_embedding_model()
-    q_emb = model.encode([query], convert_to_numpy=True)[0]
-    hits = _vector_store.similarity_search(q_emb, top_k=top_k)
 
-    context_texts = []
-    sources = set()
-    for h in hits:
-        context_texts.append(h["text"])
-        sources.add(h["metadata"].get("source", "unknown"))
+def delete_documents(
+    filenames: List[str], kb_id: str = DEFAULT_KB_ID
+) -> Dict[str, Any]:
+    """
+    Removes the given documents and all their chunks from the KB.
+    Returns: names actually deleted and the remaining chunk count
+    """
+    with _kb_write_lock:
+        store = _get_store(kb_id)
+        with store.locked():
+            result = _delete_documents(store, filenames)
+        _kb_registry.touch(kb_id, store)
+        return result
+
+
+def _delete_documents(
+    store: SimpleVectorStore, filenames: List[str]
+) -> Dict[str, Any]:
+    deleted = [f for f in filenames if f in store.documents]
+    if deleted:
+        drops_html = any(
+            store.documents[f]["doc_type"] == "html" for f in deleted
+        )
+        store.replace_documents(
+            documents={},
+            embeddings=None,
+            texts=[],
+            metadatas=[],
+            remove=deleted,
+            html_full="" if drops_html else None,
+            html_digest="" if drops_html else None,
+        )
+    return {"deleted": deleted, "num_chunks": len(store.records)}
+
+
+def build_knowledge_base(
+    documents: List[Dict[str, Any]],
+    progress: Optional[ProgressFn] = None,
+    kb_id: str = DEFAULT_KB_ID,
+) -> int:
+    """
+    documents: list of dicts: {filename, content, doc_type}
+      doc_type: "support" or "html"
+    Makes the KB hold exactly these documents: new and changed ones are
+    upserted, unchanged ones are kept as-is and any others are deleted, all
+    in a single store write. progress: see upsert_documents.
+    Returns: num_chunks
+    """
+    with _kb_write_lock:
+        store = _get_store(kb_id)
+        with store.locked():
+            wanted = {doc["filename"] for doc in documents}
+            stale = [f for f in store.documents if f not in wanted]
+            num_chunks = _upsert_documents(store, documents, stale, progress)["num_chunks"]
+        _kb_registry.touch(kb_id, store)
+        return num_chunks
+
+
+def delete_knowledge_base(kb_id: str) -> bool:
+    """Removes a whole KB from memory and disk. Returns False if it did not exist."""
+    with _kb_write_lock:
+        # a KB recreated under the same id starts again at version 1, so
+        # nothing cached against the old one may be served for it
+        _retrieval_cache.clear()
+        cache = get_response_cache()
+        if cache is not None:
+            cache.invalidate_tagged(f"{kb_id}/")
+        return _kb_registry.delete(kb_id)
+
+
+def _kb_cache_tag(kb_id: str, rag: Dict[str, Any]) -> str:
+    """
+    LLM cache tag: cached generations are only reused for the KB version the
+    context was retrieved from.
+    """
+    return f"{kb_id}/kb-v{rag['kb_version']}"
+
+
+@timed("assemble_context")
+def _assemble_context(
+    snapshot: StoreSnapshot,
+    hits: List[Dict[str, Any]],
+    token_budget: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Stitches overlapping chunks back together, drops duplicates and packs the
+    result into the token budget (CONTEXT_TOKEN_BUDGET by default).
+    """
+    packed = pack_context(hits, token_budget or CONTEXT_TOKEN_BUDGET)
+    metrics.inc("context_tokens_total", packed["num_tokens"])
 
     return {
-        "context_text": "\n\n---\n\n".join(context_texts),
-        "sources": list(sources),
-        "html_full": _vector_store.html_full,
+        "context_text": packed["context_text"],
+        "sources": packed["sources"],
+        "context_tokens": packed["num_tokens"],
+        "html_full": snapshot.html_full,
+        "html_digest": snapshot.html_digest,
+        "kb_version": snapshot.version,
     }
 
 
-def generate_test_cases(query: str) -> Dict[str, Any]:
-    rag = retrieve_context(query, top_k=10)
+def _encode_queries(queries: List[str]) -> np.ndarray:
+    """
+    Query embeddings, one row per query. Only queries missing from the
+    query-embedding cache go through the model, in a single encode call.
+    """
+    keys = [(EMBEDDING_MODEL_NAME, normalize_query(q)) for q in queries]
+    cached = [_query_embedding_cache.get(k) for k in keys]
+    missing = [i for i, emb in enumerate(cached) if emb is None]
+    metrics.inc(
+        "cache_requests_total", len(keys) - len(missing), cache="query_embedding", result="hit"
+    )
+    metrics.inc("cache_requests_total", len(missing), cache="query_embedding", result="miss")
+    if missing:
+        model = get_embedding_model()
+        with span("embed_query"):
+            new_embs = model.encode([queries[i] for i in missing], convert_to_numpy=True)
+        for i, emb in zip(missing, new_embs):
+            _query_embedding_cache.set(keys[i], emb)
+            cached[i] = emb
+    return np.stack(cached)
+
+
+def _retrieval_key(
+    kb_id: str,
+    snapshot: StoreSnapshot,
+    query: str,
+    top_k: int,
+    token_budget: Optional[int],
+    mode: Optional[str],
+) -> Tuple:
+    return (
+        kb_id,
+        snapshot.version,
+        mode or RETRIEVAL_MODE,
+        HYBRID_PREFILTER,
+        top_k,
+        token_budget,
+        normalize_query(query),
+    )
+
+
+@timed("search")
+def _search(
+    snapshot: StoreSnapshot, queries: List[str], top_k: int, mode: Optional[str]
+) -> List[List[Dict[str, Any]]]:
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {RETRIEVAL_MODES}")
+    if mode == "keyword":
+        # no embedding needed at all
+        return [snapshot.keyword_search(q, top_k=top_k) for q in queries]
+
+    q_embs = _encode_queries(queries)
+    if mode == "dense":
+        return snapshot.similarity_search_batch(q_embs, top_k=top_k)
+    return snapshot.hybrid_search_batch(
+        q_embs, queries, top_k=top_k, prefilter=HYBRID_PREFILTER
+    )
 
+
+def retrieve_context(
+    query: str,
+    top_k: int = 8,
+    token_budget: Optional[int] = None,
+    kb_id: str = DEFAULT_KB_ID,
+    mode: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    mode: "dense", "hybrid" or "keyword" (default RETRIEVAL_MODE).
+    """
+    # one snapshot for the whole retrieval, so a build swapping in a new
+    # version mid-request cannot mix rows, HTML and version of two KBs
+    snapshot = _get_store(kb_id).snapshot()
+    if snapshot.is_empty():
+        raise RuntimeError("Knowledge base is empty. Build it first.")
+
+    key = _retrieval_key(kb_id, snapshot, query, top_k, token_budget, mode)
+    cached = _retrieval_cache.get(key)
+    metrics.inc(
+        "cache_requests_total", cache="retrieval", result="miss" if cached is None else "hit"
+    )
+    if cached is not None:
+        return dict(cached)
+    hits = _search(snapshot, [query], top_k, mode)[0]
+    rag = _assemble_context(snapshot, hits, token_budget)
+    _retrieval_cache.set(key, rag)
+    return dict(rag)
+
+
+def retrieve_context_batch(
+    queries: List[str],
+    top_k: int = 8,
+    token_budget: Optional[int] = None,
+    kb_id: str = DEFAULT_KB_ID,
+    mode: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    retrieve_context for many queries: one encode call and one batched scan.
+    Returns one context dict per query, in input order.
+    """
+    snapshot = _get_store(kb_id).snapshot()
+    if snapshot.is_empty():
+        raise RuntimeError("Knowledge base is empty. Build it first.")
+    if not queries:
+        return []
+
+    keys = [_retrieval_key(kb_id, snapshot, q, top_k, token_budget, mode) for q in queries]
+    results: List[Optional[Dict[str, Any]]] = [_retrieval_cache.get(k) for k in keys]
+    missing = [i for i, rag in enumerate(results) if rag is None]
+    metrics.inc("cache_requests_total", len(keys) - len(missing), cache="retrieval", result="hit")
+    metrics.inc("cache_requests_total", len(missing), cache="retrieval", result="miss")
+    if missing:
+        all_hits = _search(snapshot, [queries[i] for i in missing], top_k, mode)
+        for i, hits in zip(missing, all_hits):
+            results[i] = _assemble_context(snapshot, hits, token_budget)
+            _retrieval_cache.set(keys[i], results[i])
+    return [dict(rag) for rag in results]
+
+
+@timed("prompt")
+def _test_case_prompts(query: str, rag: Dict[str, Any]) -> Tuple[str, str]:
     system_prompt = (
         "You are a QA expert generating test cases for a web checkout page. "
         "All reasoning MUST be strictly grounded in the provided context. "
@@ -133,9 +694,21 @@ Remember:
 - Use only information from the context.
 - Include both positive and negative test cases if applicable.
 """
+    return system_prompt, user_prompt
 
-    raw_output = call_llm(system_prompt=system_prompt, user_prompt=user_prompt)
 
+def _test_case_from_obj(obj: Dict[str, Any]) -> TestCase:
+    return TestCase(
+        id=obj.get("id", ""),
+        feature=obj.get("feature", ""),
+        scenario=obj.get("scenario", ""),
+        steps=obj.get("steps", []),
+        expected_result=obj.get("expected_result", ""),
+        grounded_in=obj.get("grounded_in", []),
+    )
+
+
+def _parse_test_cases(raw_output: str) -> List[TestCase]:
     test_cases: List[TestCase] = []
 
     # Try to parse JSON
@@ -144,29 +717,92 @@ Remember:
         if isinstance(parsed, dict):
             parsed = [parsed]
         for obj in parsed:
-            tc = TestCase(
-                id=obj.get("id", ""),
-                feature=obj.get("feature", ""),
-                scenario=obj.get("scenario", ""),
-                steps=obj.get("steps", []),
-                expected_result=obj.get("expected_result", ""),
-                grounded_in=obj.get("grounded_in", []),
-            )
-            test_cases.append(tc)
+            test_cases.append(_test_case_from_obj(obj))
     except Exception:
         # If JSON parsing fails, we just return empty list and raw text
         test_cases = []
+    return test_cases
+
+
+def generate_test_cases(query: str, kb_id: str = DEFAULT_KB_ID) -> Dict[str, Any]:
+    rag = retrieve_context(query, top_k=10, kb_id=kb_id)
+    system_prompt, user_prompt = _test_case_prompts(query, rag)
+
+    raw_output = call_llm(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        cache_tag=_kb_cache_tag(kb_id, rag),
+    )
 
     return {
         "raw_output": raw_output,
-        "test_cases": test_cases,
+        "test_cases": _parse_test_cases(raw_output),
     }
 
 
-def generate_selenium_script_from_test_case(test_case: TestCase) -> str:
-    rag = retrieve_context(
-        f"{test_case.feature} - {test_case.scenario}", top_k=10
+async def agenerate_test_cases(query: str, kb_id: str = DEFAULT_KB_ID) -> Dict[str, Any]:
+    """
+    Async variant of generate_test_cases: retrieval runs in a worker thread
+    and the LLM call goes through the pooled async client.
+    """
+    rag = await asyncio.to_thread(retrieve_context, query, 10, kb_id=kb_id)
+    system_prompt, user_prompt = _test_case_prompts(query, rag)
+
+    raw_output = await acall_llm(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        cache_tag=_kb_cache_tag(kb_id, rag),
     )
+
+    return {
+        "raw_output": raw_output,
+        "test_cases": _parse_test_cases(raw_output),
+    }
+
+
+async def astream_test_cases(
+    query: str, kb_id: str = DEFAULT_KB_ID
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streaming variant of generate_test_cases. Yields ("test_case", TestCase)
+    as soon as each array element is complete in the LLM's token stream,
+    then ("done", raw_output).
+    """
+    rag = await asyncio.to_thread(retrieve_context, query, 10, kb_id=kb_id)
+    system_prompt, user_prompt = _test_case_prompts(query, rag)
+
+    parser = JSONArrayStreamParser()
+    parts: List[str] = []
+    deltas = astream_llm(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        cache_tag=_kb_cache_tag(kb_id, rag),
+    )
+    try:
+        async for delta in deltas:
+            parts.append(delta)
+            for obj in parser.feed(delta):
+                try:
+                    test_case = _test_case_from_obj(obj)
+                except Exception:
+                    # malformed element: skip it, the raw output still has it
+                    continue
+                # outside the try: an exception thrown in at the yield is the
+                # consumer's, and must not be mistaken for a malformed element
+                yield "test_case", test_case
+    finally:
+        # closing this generator early closes the LLM stream with it
+        await deltas.aclose()
+
+    yield "done", "".join(parts).strip()
+
+
+def _script_query(test_case: TestCase) -> str:
+    return f"{test_case.feature} - {test_case.scenario}"
+
+
+@timed("prompt")
+def _selenium_script_prompts(test_case: TestCase, rag: Dict[str, Any]) -> Tuple[str, str]:
     html_full = rag["html_full"]
 
     if not html_full:
@@ -187,7 +823,18 @@ def generate_selenium_script_from_test_case(test_case: TestCase) -> str:
     # Build a JSON string for the test case manually to avoid pydantic.json() issues
     test_case_json = json.dumps(test_case.dict(), indent=2)
 
-    # We include the full HTML so the LLM can see IDs, names, etc.
+    # The DOM digest carries every id/name/class/form field the LLM needs for
+    # selectors at a fraction of the tokens; stores built before digests
+    # existed (or SCRIPT_PROMPT_FULL_HTML=1) fall back to the full file.
+    html_digest = rag.get("html_digest", "")
+    if html_digest and not SCRIPT_PROMPT_FULL_HTML:
+        page_section = (
+            "checkout.html DOM digest (all forms, fields, buttons, ids, classes "
+            f"and script hooks on the page):\n{html_digest}"
+        )
+    else:
+        page_section = f"Full checkout.html (full file content):\n{html_full}"
+
     user_prompt = f"""
 Test Case (JSON):
 {test_case_json}
@@ -195,8 +842,7 @@ Test Case (JSON):
 Project Documentation + HTML-derived context:
 {rag['context_text']}
 
-Full checkout.html (full file content):
-{html_full}
+{page_section}
 
 Requirements:
 - Use Selenium with Python.
@@ -205,6 +851,77 @@ Requirements:
 - Do NOT invent any elements; use IDs/names/classes that exist in the HTML.
 - At the end, assert the expected result described in the test case.
 """
+    return system_prompt, user_prompt
+
+
+def generate_selenium_script_from_test_case(
+    test_case: TestCase, kb_id: str = DEFAULT_KB_ID
+) -> str:
+    rag = retrieve_context(_script_query(test_case), top_k=10, kb_id=kb_id)
+    system_prompt, user_prompt = _selenium_script_prompts(test_case, rag)
 
-    script = call_llm(system_prompt=system_prompt, user_prompt=user_prompt)
+    script = call_llm(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        cache_tag=_kb_cache_tag(kb_id, rag),
+    )
     return script
+
+
+async def agenerate_selenium_script_from_test_case(
+    test_case: TestCase, kb_id: str = DEFAULT_KB_ID
+) -> str:
+    """Async variant of generate_selenium_script_from_test_case."""
+    rag = await asyncio.to_thread(
+        retrieve_context, _script_query(test_case), 10, kb_id=kb_id
+    )
+    system_prompt, user_prompt = _selenium_script_prompts(test_case, rag)
+
+    script = await acall_llm(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        cache_tag=_kb_cache_tag(kb_id, rag),
+    )
+    return script
+
+
+async def agenerate_selenium_scripts(
+    test_cases: List[TestCase],
+    max_concurrency: Optional[int] = None,
+    kb_id: str = DEFAULT_KB_ID,
+) -> List[Dict[str, Any]]:
+    """
+    Generates scripts for many test cases: one batched retrieval pass for all
+    of them, then the LLM calls fan out concurrently (at most max_concurrency
+    from this batch, on top of the client-wide limit).
+    Returns one {test_case_id, script, error} dict per test case, in order;
+    a failing case sets `error` instead of failing the batch.
+    """
+    if not test_cases:
+        return []
+
+    rags = await asyncio.to_thread(
+        retrieve_context_batch, [_script_query(tc) for tc in test_cases], 10, kb_id=kb_id
+    )
+    if not rags[0]["html_full"]:
+        raise RuntimeError(
+            "checkout.html was not uploaded or stored in the knowledge base."
+        )
+
+    cache_tag = _kb_cache_tag(kb_id, rags[0])
+    limit = asyncio.Semaphore(max_concurrency or len(test_cases))
+
+    async def one(test_case: TestCase, rag: Dict[str, Any]) -> Dict[str, Any]:
+        system_prompt, user_prompt = _selenium_script_prompts(test_case, rag)
+        async with limit:
+            try:
+                script = await acall_llm(
+                    system_prompt=system_prompt,
+                    user_prompt=user_prompt,
+                    cache_tag=cache_tag,
+                )
+            except Exception as e:
+                return {"test_case_id": test_case.id, "script": None, "error": str(e)}
+        return {"test_case_id": test_case.id, "script": script, "error": None}
+
+    return await asyncio.gather(*(one(tc, rag) for tc, rag in zip(test_cases, rags)))
@@ -0,0 +1,67 @@
+import json
+from typing import List, Dict, Any
+
+
+class JSONArrayStreamParser:
+    """
+    Incremental parser for an LLM emitting a JSON array of objects.
+    feed() accepts arbitrary text fragments and returns the top-level objects
+    completed by that fragment, so callers can act on each element as soon as
+    its closing brace arrives instead of waiting for the whole array.
+
+    Text before the first `[` or `{` (stray prose, code fences) is skipped; a
+    bare top-level object is returned as a single element.
+    """
+
+    def __init__(self):
+        self._buf: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self._object_depth = 0  # depth at which top-level elements open
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        done: List[Dict[str, Any]] = []
+        for ch in text:
+            if not self._started:
+                if ch == "[":
+                    self._started = True
+                    self._depth = 1
+                    self._object_depth = 1
+                elif ch == "{":
+                    self._started = True
+                    self._depth = 1
+                    self._object_depth = 0
+                    self._buf = [ch]
+                continue
+
+            if self._depth > self._object_depth:
+                self._buf.append(ch)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == self._object_depth:
+                    self._buf = [ch]
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == self._object_depth and self._buf:
+                    try:
+                        obj = json.loads("".join(self._buf))
+                    except ValueError:
+                        obj = None
+                    if isinstance(obj, dict):
+                        done.append(obj)
+                    self._buf = []
+        return done
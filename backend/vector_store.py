@@ -1,99 +1,1014 @@
 import os
-import pickle
-from typing import List, Dict, Any, Optional
+import re
+import json
+import mmap
+import shutil
+import tempfile
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 
 import numpy as np
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
-class SimpleVectorStore:
+from .ann_index import (
+    IVF_CENTROIDS_FILE,
+    IVF_LIST_OFFSETS_FILE,
+    IVF_META_FILE,
+    IVF_ROWS_FILE,
+    make_index,
+)
+from .keyword_index import (
+    KW_DOC_LEN_FILE,
+    KW_OFFSETS_FILE,
+    KW_ROWS_FILE,
+    KW_TERMS_FILE,
+    KW_TFS_FILE,
+    KeywordIndex,
+    reciprocal_rank_fusion,
+)
+from .metrics import span
+from .quantization import (
+    QUANTIZED_CODES_FILE,
+    QUANTIZED_SCALES_FILE,
+    QuantizedVectors,
+    rescore,
+)
+
+
+EMBEDDINGS_FILE = "embeddings.npy"
+RECORDS_FILE = "records.jsonl"
+OFFSETS_FILE = "offsets.npy"
+DOC_IDS_FILE = "doc_ids.npy"
+META_FILE = "meta.json"
+# names the live snapshot directory (e.g. "v00000007"); swapped by rename
+CURRENT_FILE = "CURRENT"
+# held by whichever process (or store instance) is writing the store
+LOCK_FILE = "LOCK"
+
+_SNAPSHOT_DIR_RE = re.compile(r"^v\d+$")
+# every file a store writes, data and derived; in a legacy flat layout they
+# sit directly in the store directory and are removed once it is converted
+_LEGACY_FILES = (
+    EMBEDDINGS_FILE, RECORDS_FILE, OFFSETS_FILE, DOC_IDS_FILE, META_FILE,
+    IVF_CENTROIDS_FILE, IVF_LIST_OFFSETS_FILE, IVF_ROWS_FILE, IVF_META_FILE,
+    KW_TERMS_FILE, KW_OFFSETS_FILE, KW_ROWS_FILE, KW_TFS_FILE, KW_DOC_LEN_FILE,
+    QUANTIZED_CODES_FILE, QUANTIZED_SCALES_FILE,
+)
+# a snapshot directory without meta.json (written last) is still being built,
+# possibly by another process; past this age it is an interrupted write
+ABANDONED_SNAPSHOT_SECONDS = 3600
+# scratch directories of RowSpool; ones untouched for
+# ABANDONED_SNAPSHOT_SECONDS were left by an ingest that died
+SPOOL_PREFIX = ".spool-"
+
+
+def normalize_rows(emb: np.ndarray) -> np.ndarray:
     """
-    Minimal vector store:
-    - Stores embeddings (numpy array)
-    - Stores texts and metadatas lists
-    - Persists to a pickle file
+    Returns a float32 copy of `emb` with every row scaled to unit length.
     """
+    emb = np.asarray(emb, dtype=np.float32)
+    if emb.ndim == 1:
+        emb = emb.reshape(1, -1)
+    norms = np.linalg.norm(emb, axis=1, keepdims=True)
+    return (emb / (norms + 1e-10)).astype(np.float32, copy=False)
 
-    def __init__(self, path: str = "kb_store.pkl"):
+
+def _atomic_write_bytes(path: str, data: bytes):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def store_exists(path: str) -> bool:
+    """True if `path` holds a written store (snapshotted or legacy flat layout)."""
+    return os.path.exists(os.path.join(path, CURRENT_FILE)) or os.path.exists(
+        os.path.join(path, META_FILE)
+    )
+
+
+class _StoreLock:
+    """
+    Exclusive lock on a store directory through an OS lock on its LOCK file:
+    flock on POSIX, msvcrt.locking on Windows. Both are per open file, so
+    they also exclude other store instances in the same process.
+    """
+
+    def __init__(self, store_path: str):
+        self.path = os.path.join(store_path, LOCK_FILE)
+        self._file = None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        f = open(self.path, "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass  # LK_LOCK gives up after ~10s; keep waiting
+        except BaseException:
+            f.close()
+            raise
+        self._file = f
+
+    def release(self):
+        f, self._file = self._file, None
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            f.close()
+
+
+class RecordFile(Sequence):
+    """
+    Read-only, offset-indexed view over a JSON-lines file.
+    Record i lives at bytes [offsets[i], offsets[i + 1]) and is decoded on access,
+    so opening the file costs nothing regardless of its size.
+    """
+
+    def __init__(self, path: str, offsets: np.ndarray):
         self.path = path
+        self.offsets = offsets
+        self._file = None
+        self._mm = None
+        if len(offsets) > 1 and offsets[-1] > 0:
+            self._file = open(path, "rb")
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return max(len(self.offsets) - 1, 0)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError(idx)
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        return json.loads(self._mm[start:end])
+
+    def raw(self, idx: int) -> bytes:
+        """Returns the encoded bytes of record `idx`, newline included."""
+        return self._mm[int(self.offsets[idx]):int(self.offsets[idx + 1])]
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+            self._mm = None
+            self._file = None
+
+
+class RowSpool:
+    """
+    New rows for a store write, appended in batches and spilled to a scratch
+    directory inside the store as they arrive, so an ingest holds one batch
+    in memory rather than the whole corpus. Hand it to
+    SimpleVectorStore.replace_documents(rows=...), then discard() it.
+    """
+
+    def __init__(self, store_path: str):
+        os.makedirs(store_path, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=SPOOL_PREFIX, dir=store_path)
+        self._embeddings_path = os.path.join(self.path, "embeddings.f32")
+        self._records_path = os.path.join(self.path, RECORDS_FILE)
+        self._embeddings_file = open(self._embeddings_path, "wb")
+        self._records_file = open(self._records_path, "wb")
+        self._lengths = array("q")
+        self._records: Optional[RecordFile] = None
+        # per-row source filename, for document ids at write time
+        self.sources: List[str] = []
+        self.dim: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def append(
+        self, embeddings: np.ndarray, texts: List[str], metadatas: List[Dict[str, Any]]
+    ):
+        emb = normalize_rows(embeddings)
+        self.dim = emb.shape[1]
+        self._embeddings_file.write(emb.tobytes())
+        for text, metadata in zip(texts, metadatas):
+            line = (
+                json.dumps({"text": text, "metadata": metadata}, ensure_ascii=False) + "\n"
+            ).encode("utf-8")
+            self._records_file.write(line)
+            self._lengths.append(len(line))
+            self.sources.append(metadata.get("source", "unknown"))
+
+    def finish(self) -> Tuple[Optional[np.ndarray], RecordFile]:
+        """Unit-length embeddings (memory-mapped, None if empty) and records."""
+        self._embeddings_file.close()
+        self._records_file.close()
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(np.frombuffer(self._lengths, dtype=np.int64), out=offsets[1:])
+        self._records = RecordFile(self._records_path, offsets)
+        embeddings = None
+        if len(self):
+            embeddings = np.memmap(
+                self._embeddings_path, dtype=np.float32, mode="r", shape=(len(self), self.dim)
+            )
+        return embeddings, self._records
+
+    def discard(self):
+        self._embeddings_file.close()
+        self._records_file.close()
+        if self._records is not None:
+            self._records.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class _FieldView(Sequence):
+    """Lazy list-like view of one field of every record."""
+
+    def __init__(self, records: Sequence, field: str):
+        self._records = records
+        self._field = field
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [r[self._field] for r in self._records[idx]]
+        return self._records[idx][self._field]
+
+
+class StoreSnapshot:
+    """
+    One immutable, fully loaded version of a store: vectors, records, doc ids,
+    manifest, HTML and search index. Nothing in a snapshot is modified after
+    it is opened, so a reader that grabs one (SimpleVectorStore.snapshot())
+    sees a consistent KB for as long as it holds it, whatever writers do.
+    """
+
+    def __init__(self, index, path: Optional[str] = None, rescore_factor: int = 4):
+        self.path = path
+        self.index = index
+        self.rescore_factor = rescore_factor
         self.embeddings: Optional[np.ndarray] = None
-        self.texts: List[str] = []
-        self.metadatas: List[Dict[str, Any]] = []
+        # compact copy scanned instead of `embeddings` when quantization is on
+        self.quantized: Optional[QuantizedVectors] = None
+        self.keyword_index = KeywordIndex()
+        self.records: Sequence = []
+        self.doc_ids: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.documents: Dict[str, Dict[str, Any]] = {}
         self.html_full: str = ""
+        self.html_digest: str = ""
+        # bumped on every write; lets callers invalidate anything derived from the KB
+        self.version: int = 0
+        # open() had to build the index, keyword index or quantized codes in
+        # memory because the snapshot on disk lacks them in the requested form
+        self.derived_stale = False
 
-        if os.path.exists(self.path):
-            self._load()
-
-    def _load(self):
-        with open(self.path, "rb") as f:
-            data = pickle.load(f)
-        self.embeddings = data["embeddings"]
-        self.texts = data["texts"]
-        self.metadatas = data["metadatas"]
-        self.html_full = data.get("html_full", "")
-
-    def _save(self):
-        data = {
-            "embeddings": self.embeddings,
-            "texts": self.texts,
-            "metadatas": self.metadatas,
-            "html_full": self.html_full,
-        }
-        with open(self.path, "wb") as f:
-            pickle.dump(data, f)
+    @classmethod
+    def open(
+        cls,
+        path: str,
+        index_type: Optional[str] = None,
+        quantization: Optional[str] = None,
+        rescore_factor: int = 4,
+        **index_kwargs,
+    ) -> "StoreSnapshot":
+        """
+        Loads the snapshot written to directory `path`. If index_type differs
+        from the stored index, or the keyword index or quantized codes of the
+        requested kind are missing, they are built in memory and
+        derived_stale is set; the published directory is never written to
+        (SimpleVectorStore persists them as a new version).
+        """
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
 
-    def reset(self):
-        self.embeddings = None
-        self.texts = []
-        self.metadatas = []
-        self.html_full = ""
-        self._save()
+        stored_type = meta.get("index_type", "flat")
+        snap = cls(
+            make_index(index_type or stored_type, **index_kwargs), path, rescore_factor
+        )
+        snap.html_full = meta.get("html_full", "")
+        snap.html_digest = meta.get("html_digest", "")
+        snap.version = meta.get("version", 0)
+        snap.documents = meta.get("documents", {})
+        snap.records = RecordFile(
+            os.path.join(path, RECORDS_FILE), np.load(os.path.join(path, OFFSETS_FILE))
+        )
 
-    def add_documents(
-        self,
-        embeddings: np.ndarray,
-        texts: List[str],
-        metadatas: List[Dict[str, Any]],
-        html_full: str,
-    ):
-        if self.embeddings is None:
-            self.embeddings = embeddings
-            self.texts = texts
-            self.metadatas = metadatas
-        else:
-            self.embeddings = np.vstack([self.embeddings, embeddings])
-            self.texts.extend(texts)
-            self.metadatas.extend(metadatas)
-        if html_full:
-            self.html_full = html_full
-        self._save()
+        if len(snap.records) > 0:
+            snap.embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+            snap.doc_ids = np.load(os.path.join(path, DOC_IDS_FILE))
+            snap.index.load(path)
+            if snap.index.kind != stored_type:
+                # store was written with another index type
+                snap.index.build(snap.embeddings)
+                snap.derived_stale = True
+            if not snap.keyword_index.load(path):
+                # written before keyword search existed
+                snap.keyword_index.build(snap.texts)
+                snap.derived_stale = True
+            if quantization:
+                snap.quantized = QuantizedVectors.load(path, quantization)
+                if snap.quantized is None:
+                    snap.quantized = QuantizedVectors.quantize(snap.embeddings, quantization)
+                    snap.derived_stale = True
+        return snap
+
+    @property
+    def texts(self) -> Sequence:
+        return _FieldView(self.records, "text")
+
+    @property
+    def metadatas(self) -> Sequence:
+        return _FieldView(self.records, "metadata")
+
+    def close(self):
+        """Releases the record mmap; only safe once no reader holds the snapshot."""
+        if isinstance(self.records, RecordFile):
+            self.records.close()
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate footprint of the loaded snapshot: vectors and index arrays
+        (memory-mapped ones counted in full, as if every page were resident),
+        row offsets and ids, and the stored HTML.
+        """
+        total = len(self.html_full) + len(self.html_digest)
+        total += self.doc_ids.nbytes + self.index.memory_bytes()
+        total += self.keyword_index.memory_bytes()
+        if self.quantized is not None:
+            # float32 rows are only paged in for the few rescored candidates
+            total += self.quantized.nbytes
+        elif self.embeddings is not None:
+            total += self.embeddings.nbytes
+        if isinstance(self.records, RecordFile):
+            total += self.records.offsets.nbytes
+        return total
+
+    def document_rows(self, source: str) -> np.ndarray:
+        """Row indices currently holding chunks of `source`, in insertion order."""
+        entry = self.documents.get(source)
+        if entry is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.doc_ids == entry["id"])
 
     def is_empty(self) -> bool:
-        return self.embeddings is None or len(self.texts) == 0
+        return self.embeddings is None or len(self.records) == 0
 
-    def similarity_search(self, query_embedding: np.ndarray, top_k: int = 5):
+    def _dense_search_batch(
+        self, queries: np.ndarray, top_k: int, nprobe: Optional[int] = None
+    ):
+        """(n_queries, k) row indices and scores for unit queries, best first."""
+        with span("dense_scan"):
+            if self.quantized is None:
+                return self.index.search_batch(
+                    self.embeddings, queries, top_k, nprobe=nprobe
+                )
+            cand, approx = self.index.search_batch(
+                self.quantized, queries, top_k * self.rescore_factor, nprobe=nprobe
+            )
+        with span("rescore"):
+            return rescore(self.embeddings, queries, cand, approx, top_k)
+
+    def similarity_search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = 5,
+        nprobe: Optional[int] = None,
+    ):
         """
         Returns list of (text, metadata, score) sorted by similarity.
+        nprobe: IVF lists to scan (higher = better recall, slower); ignored by
+          the flat index.
         """
         if self.is_empty():
             return []
 
-        # normalize
-        emb = self.embeddings
-        q = query_embedding.reshape(1, -1)
+        # stored rows are already unit-length, only the query needs normalizing
+        q = normalize_rows(query_embedding)[0]
+        with span("dense_scan"):
+            if self.quantized is None:
+                top_indices, scores = self.index.search(
+                    self.embeddings, q, top_k, nprobe=nprobe
+                )
+            else:
+                cand, approx = self.index.search(
+                    self.quantized, q, top_k * self.rescore_factor, nprobe=nprobe
+                )
+        if self.quantized is not None:
+            with span("rescore"):
+                top_indices, scores = rescore(
+                    self.embeddings, q[None, :], cand[None, :], approx[None, :], top_k
+                )
+            top_indices, scores = top_indices[0], scores[0]
+
+        return self._hits(top_indices, scores)
+
+    def similarity_search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        nprobe: Optional[int] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Like similarity_search for a (n_queries, dim) matrix of queries, scored
+        with one matrix product instead of one scan per query.
+        Returns one result list per query, in input order.
+        """
+        query_embeddings = np.asarray(query_embeddings)
+        n_queries = 1 if query_embeddings.ndim == 1 else query_embeddings.shape[0]
+        if self.is_empty():
+            return [[] for _ in range(n_queries)]
+
+        q = normalize_rows(query_embeddings)
+        top_indices, scores = self._dense_search_batch(q, top_k, nprobe)
+        return [self._hits(idx, sc) for idx, sc in zip(top_indices, scores)]
+
+    def keyword_search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """BM25 search over chunk texts; hits as in similarity_search."""
+        if self.is_empty():
+            return []
+        with span("keyword_scan"):
+            rows, scores = self.keyword_index.search(query, top_k)
+        return self._hits(rows, scores)
+
+    def hybrid_search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        query_texts: List[str],
+        top_k: int = 5,
+        depth: Optional[int] = None,
+        prefilter: bool = False,
+        nprobe: Optional[int] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Dense and BM25 rankings fused by reciprocal rank: each list
+        contributes its best `depth` rows (default 4 * top_k). Exact tokens
+        such as coupon codes or element ids surface even when the embedding
+        misses them. Hit scores are the fused scores.
 
-        emb_norm = emb / (np.linalg.norm(emb, axis=1, keepdims=True) + 1e-10)
-        q_norm = q / (np.linalg.norm(q, axis=1, keepdims=True) + 1e-10)
+        prefilter: when BM25 matches at least `depth` rows, the dense side
+          only scores those rows (exactly, in float32) instead of scanning
+          the whole store.
+        """
+        if self.is_empty():
+            return [[] for _ in query_texts]
+        depth = depth or 4 * top_k
+        q = normalize_rows(query_embeddings)
 
-        scores = np.dot(emb_norm, q_norm.T).reshape(-1)  # cosine similarity
+        with span("keyword_scan"):
+            keyword = [self.keyword_index.score(text) for text in query_texts]
+        dense: List[Optional[np.ndarray]] = [None] * len(query_texts)
+        if prefilter:
+            for i, (rows, _) in enumerate(keyword):
+                if len(rows) >= depth:
+                    scores = np.asarray(self.embeddings[rows], dtype=np.float32) @ q[i]
+                    order = np.argsort(-scores, kind="stable")[:depth]
+                    dense[i] = rows[order]
+        scan = [i for i, d in enumerate(dense) if d is None]
+        if scan:
+            idx, scores = self._dense_search_batch(q[scan], depth, nprobe)
+            for i, row_idx, row_scores in zip(scan, idx, scores):
+                dense[i] = row_idx[np.isfinite(row_scores)]
 
-        top_indices = np.argsort(scores)[::-1][:top_k]
         results = []
-        for idx in top_indices:
+        for (kw_rows, kw_scores), dense_rows in zip(keyword, dense):
+            kw_order = np.argsort(-kw_scores, kind="stable")[:depth]
+            rows, fused = reciprocal_rank_fusion([dense_rows, kw_rows[kw_order]], top_k)
+            results.append(self._hits(rows, fused))
+        return results
+
+    def _hits(self, indices: np.ndarray, scores: np.ndarray) -> List[Dict[str, Any]]:
+        results = []
+        for idx, score in zip(indices, scores):
+            if not np.isfinite(score):
+                # IVF batch search pads with -inf when a query has < top_k candidates
+                continue
+            record = self.records[idx]
             results.append(
                 {
-                    "text": self.texts[idx],
-                    "metadata": self.metadatas[idx],
-                    "score": float(scores[idx]),
+                    "text": record["text"],
+                    "metadata": record["metadata"],
+                    "score": float(score),
                 }
             )
         return results
+
+
+def _write_meta(path: str, snap: StoreSnapshot):
+    _atomic_write_bytes(
+        os.path.join(path, META_FILE),
+        json.dumps(
+            {
+                "html_full": snap.html_full,
+                "html_digest": snap.html_digest,
+                "documents": snap.documents,
+                "index_type": snap.index.kind,
+                "version": snap.version,
+            }
+        ).encode("utf-8"),
+    )
+
+
+class SimpleVectorStore:
+    """
+    Minimal vector store persisted as a directory of immutable snapshots:
+    - v<version>/: one complete version of the store
+      - embeddings.npy: unit-normalized float32 matrix, opened memory-mapped
+      - records.jsonl + offsets.npy: texts and metadatas, decoded lazily by row
+      - doc_ids.npy: per-row id of the document the chunk came from
+      - meta.json: html_full, its DOM digest, the document manifest, index
+        type and version
+      - optional ANN index files (see ann_index.py)
+    - CURRENT: name of the live snapshot directory
+
+    A write never touches the live snapshot: it builds the next version in a
+    new directory, publishes it by atomically renaming a new CURRENT into
+    place, then swaps the in-memory StoreSnapshot reference. Readers that
+    took a snapshot() keep a consistent view throughout; older versions are
+    deleted once they are two writes behind. Nothing published is ever
+    modified.
+
+    Writers are serialized across threads, processes and store instances by
+    an OS lock on the LOCK file (see locked()). Under it a writer first
+    rebases on whatever version CURRENT names, so a write never builds on a
+    stale version and drops rows another writer added, and pruning never
+    removes the version CURRENT named before the write. Stores written
+    before snapshots (files directly in the directory) are read as-is and
+    converted on their next write.
+
+    Because rows are normalized at write time, cosine similarity is a single
+    matrix-vector product and several processes can share the same pages.
+
+    The manifest maps each source filename to its id, content hash and chunk
+    hashes, which lets callers replace or drop single documents without
+    re-embedding the rest of the store.
+
+    index_type selects the search index ("flat" for exact, "ivf" for
+    approximate); None keeps whatever the store was last written with.
+    quantization ("float16" or "int8") keeps a 2x / 4x smaller copy of the
+    vectors in memory for the main scan; the top_k * rescore_factor best
+    candidates are then rescored exactly against the float32 rows.
+    Extra keyword arguments (e.g. nprobe) are passed to the index.
+    """
+
+    def __init__(
+        self,
+        path: str = "kb_store",
+        index_type: Optional[str] = None,
+        quantization: Optional[str] = None,
+        rescore_factor: int = 4,
+        **index_kwargs,
+    ):
+        self.path = path
+        self.index_type = index_type
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.index_kwargs = index_kwargs
+        self._write_lock = threading.RLock()
+        self._store_lock = _StoreLock(path)
+        self._lock_depth = 0
+        self._snapshot = StoreSnapshot(make_index(index_type or "flat", **index_kwargs))
+
+        self._remove_abandoned_spools()
+        current = self._current_dir()
+        if current is not None:
+            self._snapshot = self._open(current)
+            if self._snapshot.derived_stale:
+                # persist what open() rebuilt as a new version, leaving the
+                # published one untouched; a writer may have published (and
+                # persisted the derived files) in the meantime
+                with self.locked() as base:
+                    if base.derived_stale:
+                        self._write(
+                            np.ones(len(base.records), dtype=bool),
+                            None,
+                            [],
+                            np.zeros(0, dtype=np.int32),
+                            base.documents,
+                            base.html_full,
+                            base.html_digest,
+                        )
+
+    def _remove_abandoned_spools(self):
+        """
+        Deletes RowSpool directories nothing has written to for
+        ABANDONED_SNAPSHOT_SECONDS: their ingest died before discarding them.
+        A spool grows by appends, which leave the directory's own mtime
+        alone, so its files are checked too.
+        """
+        if not os.path.isdir(self.path):
+            return
+        now = time.time()
+        for entry in os.listdir(self.path):
+            if not entry.startswith(SPOOL_PREFIX):
+                continue
+            full = os.path.join(self.path, entry)
+            try:
+                touched = max(
+                    [os.path.getmtime(full)]
+                    + [os.path.getmtime(os.path.join(full, f)) for f in os.listdir(full)]
+                )
+            except OSError:
+                continue  # discarded concurrently
+            if now - touched >= ABANDONED_SNAPSHOT_SECONDS:
+                shutil.rmtree(full, ignore_errors=True)
+
+    def _open(self, path: str) -> StoreSnapshot:
+        return StoreSnapshot.open(
+            path,
+            self.index_type,
+            quantization=self.quantization,
+            rescore_factor=self.rescore_factor,
+            **self.index_kwargs,
+        )
+
+    @contextmanager
+    def locked(self):
+        """
+        Holds the store's write lock (reentrant) and yields the live snapshot,
+        first reloaded if another process or instance published a newer
+        version. Every write takes it; hold it around a read-modify-write,
+        such as diffing documents against the snapshot before
+        replace_documents, so no other write lands in between.
+        """
+        with self._write_lock:
+            if self._lock_depth == 0:
+                self._store_lock.acquire()
+            self._lock_depth += 1
+            try:
+                if self._lock_depth == 1:
+                    self._refresh()
+                yield self._snapshot
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    self._store_lock.release()
+
+    def _refresh(self):
+        """Swaps in the version CURRENT names if it is not the loaded one."""
+        current = self._current_dir()
+        if current is not None and current != self._snapshot.path:
+            self._snapshot = self._open(current)
+
+    def snapshot(self) -> StoreSnapshot:
+        """
+        The live version of the store. Hold on to it for the duration of a
+        request so every read sees the same KB version.
+        """
+        return self._snapshot
+
+    # Read-through accessors for the live snapshot. Callers doing more than
+    # one read should take a snapshot() instead, as a write may land between.
+    @property
+    def embeddings(self) -> Optional[np.ndarray]:
+        return self._snapshot.embeddings
+
+    @property
+    def records(self) -> Sequence:
+        return self._snapshot.records
+
+    @property
+    def doc_ids(self) -> np.ndarray:
+        return self._snapshot.doc_ids
+
+    @property
+    def documents(self) -> Dict[str, Dict[str, Any]]:
+        return self._snapshot.documents
+
+    @property
+    def html_full(self) -> str:
+        return self._snapshot.html_full
+
+    @property
+    def html_digest(self) -> str:
+        return self._snapshot.html_digest
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    @property
+    def index(self):
+        return self._snapshot.index
+
+    @property
+    def texts(self) -> Sequence:
+        return self._snapshot.texts
+
+    @property
+    def metadatas(self) -> Sequence:
+        return self._snapshot.metadatas
+
+    def _current_dir(self) -> Optional[str]:
+        pointer = os.path.join(self.path, CURRENT_FILE)
+        if os.path.exists(pointer):
+            with open(pointer, "r", encoding="utf-8") as f:
+                return os.path.join(self.path, f.read().strip())
+        if os.path.exists(os.path.join(self.path, META_FILE)):
+            return self.path  # legacy flat layout
+        return None
+
+    def _write(
+        self,
+        keep: Optional[np.ndarray],
+        embeddings: Optional[np.ndarray],
+        records: Sequence,
+        doc_ids: np.ndarray,
+        documents: Dict[str, Dict[str, Any]],
+        html_full: str,
+        html_digest: str,
+    ):
+        """
+        Writes the next version as the existing rows selected by the boolean
+        mask `keep` (None drops them all) followed by the new rows, then
+        publishes it and swaps it in. records: list of {text, metadata}, or a
+        RecordFile of spooled rows. Call under locked().
+        """
+        base = self._snapshot
+        # claim the next free version directory; mkdir fails if it exists,
+        # so a version another process is building (or an interrupted write
+        # left behind) is skipped, never overwritten
+        os.makedirs(self.path, exist_ok=True)
+        version = max(base.version, self._latest_version()) + 1
+        while True:
+            name = f"v{version:08d}"
+            target = os.path.join(self.path, name)
+            try:
+                os.mkdir(target)
+                break
+            except FileExistsError:
+                version += 1
+
+        if keep is None or len(base.records) == 0:
+            kept = np.zeros(0, dtype=np.int64)
+        else:
+            kept = np.flatnonzero(keep)
+
+        if isinstance(records, RecordFile):
+            # spooled rows (RowSpool): already encoded on disk
+            lines = None
+            new_lengths = np.diff(records.offsets)
+        else:
+            lines = [
+                (json.dumps(r, ensure_ascii=False) + "\n").encode("utf-8")
+                for r in records
+            ]
+            new_lengths = [len(l) for l in lines]
+
+        n_old = len(kept)
+        n_new = 0 if embeddings is None else embeddings.shape[0]
+        if n_old + n_new > 0:
+            dim = embeddings.shape[1] if n_new else base.embeddings.shape[1]
+            out = np.lib.format.open_memmap(
+                os.path.join(target, EMBEDDINGS_FILE),
+                mode="w+",
+                dtype=np.float32,
+                shape=(n_old + n_new, dim),
+            )
+            if n_old:
+                out[:n_old] = base.embeddings[kept]
+            if n_new:
+                out[n_old:] = embeddings
+            out.flush()
+            del out
+
+        records_path = os.path.join(target, RECORDS_FILE)
+        lengths = np.zeros(n_old + n_new, dtype=np.int64)
+        if n_old == len(base.records) and n_old > 0:
+            # nothing dropped: copy the old file wholesale and append
+            shutil.copyfile(base.records.path, records_path)
+            lengths[:n_old] = np.diff(base.records.offsets)
+            mode = "ab"
+        else:
+            mode = "wb"
+        with open(records_path, mode) as f:
+            if mode == "wb":
+                for i, row in enumerate(kept):
+                    raw = base.records.raw(row)
+                    lengths[i] = len(raw)
+                    f.write(raw)
+            if lines is None:
+                with open(records.path, "rb") as src:
+                    shutil.copyfileobj(src, f)
+            else:
+                f.writelines(lines)
+        lengths[n_old:] = new_lengths
+        offsets = np.concatenate([np.zeros(1, dtype=np.int64), np.cumsum(lengths)])
+
+        all_doc_ids = np.concatenate(
+            [base.doc_ids[kept], np.asarray(doc_ids, dtype=np.int32)]
+        ).astype(np.int32)
+        np.save(os.path.join(target, OFFSETS_FILE), offsets)
+        np.save(os.path.join(target, DOC_IDS_FILE), all_doc_ids)
+
+        draft = StoreSnapshot(make_index(base.index.kind, **self.index_kwargs), target)
+        if n_old + n_new > 0:
+            with span("index_build"):
+                draft.index.build(
+                    np.load(os.path.join(target, EMBEDDINGS_FILE), mmap_mode="r"),
+                    previous=base.index,
+                )
+                draft.index.save(target)
+        with span("keyword_index_build"):
+            draft.keyword_index.build(
+                (r["text"] for r in records), previous=base.keyword_index, kept=kept
+            )
+            if n_old + n_new > 0:
+                draft.keyword_index.save(target)
+        if self.quantization and n_old + n_new > 0:
+            with span("quantize"):
+                QuantizedVectors.quantize(
+                    np.load(os.path.join(target, EMBEDDINGS_FILE), mmap_mode="r"),
+                    self.quantization,
+                ).save(target)
+
+        # meta.json goes last: its presence marks the directory complete
+        draft.documents = documents
+        draft.html_full = html_full
+        draft.html_digest = html_digest
+        draft.version = version
+        _write_meta(target, draft)
+
+        # publish: CURRENT is replaced by rename, so other processes opening
+        # the store see either the old version or the new one, never a mix
+        _atomic_write_bytes(os.path.join(self.path, CURRENT_FILE), name.encode("utf-8"))
+        self._snapshot = self._open(target)
+        # base is what CURRENT named until now (locked() rebased on it), so
+        # only versions already superseded before this write are removed
+        self._prune(below=base.version)
+
+    def _latest_version(self) -> int:
+        """Highest version directory number on disk, 0 if there is none."""
+        numbers = [int(e[1:]) for e in os.listdir(self.path) if _SNAPSHOT_DIR_RE.match(e)]
+        return max(numbers, default=0)
+
+    def _prune(self, below: int):
+        """
+        Deletes complete snapshot directories numbered below `below`, and
+        every legacy flat file. Incomplete directories (no meta.json) are
+        left to whoever is writing them unless older than
+        ABANDONED_SNAPSHOT_SECONDS, whatever their number. Readers still
+        holding a deleted version keep working on POSIX, where open and
+        mmapped files outlive their directory entry.
+        """
+        now = time.time()
+        for entry in os.listdir(self.path):
+            full = os.path.join(self.path, entry)
+            if _SNAPSHOT_DIR_RE.match(entry):
+                try:
+                    if os.path.exists(os.path.join(full, META_FILE)):
+                        if int(entry[1:]) >= below:
+                            continue
+                    elif now - os.path.getmtime(full) < ABANDONED_SNAPSHOT_SECONDS:
+                        continue
+                except OSError:
+                    continue  # removed concurrently
+                shutil.rmtree(full, ignore_errors=True)
+            elif entry in _LEGACY_FILES:
+                try:
+                    os.remove(full)
+                except OSError:
+                    pass  # still open elsewhere (Windows); retried next write
+
+    def _next_document_id(self, documents: Dict[str, Dict[str, Any]]) -> int:
+        return max((d["id"] for d in documents.values()), default=-1) + 1
+
+    def reset(self):
+        with self.locked():
+            self._write(None, None, [], np.zeros(0, dtype=np.int32), {}, "", "")
+
+    def add_documents(
+        self,
+        embeddings: np.ndarray,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        html_full: str,
+        html_digest: str = "",
+    ):
+        with self.locked() as base:
+            documents = dict(base.documents)
+            doc_ids = []
+            for m in metadatas:
+                source = m.get("source", "unknown")
+                if source not in documents:
+                    documents[source] = {
+                        "id": self._next_document_id(documents),
+                        "hash": "",
+                        "doc_type": "",
+                        "chunk_hashes": [],
+                    }
+                doc_ids.append(documents[source]["id"])
+            records = [{"text": t, "metadata": m} for t, m in zip(texts, metadatas)]
+            keep = np.ones(len(base.records), dtype=bool)
+            self._write(
+                keep,
+                normalize_rows(embeddings),
+                records,
+                doc_ids,
+                documents,
+                html_full or base.html_full,
+                html_digest if html_full else base.html_digest,
+            )
+
+    def document_rows(self, source: str) -> np.ndarray:
+        """Row indices currently holding chunks of `source`, in insertion order."""
+        return self._snapshot.document_rows(source)
+
+    def replace_documents(
+        self,
+        documents: Dict[str, Dict[str, Any]],
+        embeddings: Optional[np.ndarray],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        remove: List[str],
+        html_full: Optional[str] = None,
+        html_digest: Optional[str] = None,
+        rows: Optional[RowSpool] = None,
+    ):
+        """
+        Drops every chunk of the sources in `remove` (and of the sources in
+        `documents`), then appends the given chunks in a single rewrite.
+
+        documents: {source: {"hash", "doc_type", "chunk_hashes"}} manifest
+          entries for the sources whose chunks are being (re)written.
+        rows: the new chunks as a RowSpool, instead of embeddings, texts and
+          metadatas; it is finished here but left for the caller to discard.
+        html_full: new checkout HTML, "" to clear it, None to leave it alone.
+        html_digest: same, for the compact DOM digest of that HTML.
+        """
+        with self.locked() as base:
+            manifest = dict(base.documents)
+            dropped = set(remove) | set(documents)
+            drop_ids = [manifest[s]["id"] for s in dropped if s in manifest]
+            keep = ~np.isin(base.doc_ids, drop_ids)
+            for s in remove:
+                manifest.pop(s, None)
+
+            for source, entry in documents.items():
+                old = manifest.get(source)
+                doc_id = old["id"] if old else self._next_document_id(manifest)
+                manifest[source] = dict(entry, id=doc_id)
+            if rows is not None:
+                embeddings, records = rows.finish()
+                sources = rows.sources
+            else:
+                records = [{"text": t, "metadata": m} for t, m in zip(texts, metadatas)]
+                sources = [m["source"] for m in metadatas]
+                if embeddings is not None and len(embeddings):
+                    embeddings = normalize_rows(embeddings)
+                else:
+                    embeddings = None
+            doc_ids = np.fromiter(
+                (manifest[source]["id"] for source in sources), dtype=np.int32, count=len(sources)
+            )
+            self._write(
+                keep,
+                embeddings,
+                records,
+                doc_ids,
+                manifest,
+                base.html_full if html_full is None else html_full,
+                base.html_digest if html_digest is None else html_digest,
+            )
+
+    def memory_bytes(self) -> int:
+        return self._snapshot.memory_bytes()
+
+    def is_empty(self) -> bool:
+        return self._snapshot.is_empty()
+
+    def similarity_search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = 5,
+        nprobe: Optional[int] = None,
+    ):
+        """See StoreSnapshot.similarity_search; runs on the live snapshot."""
+        return self._snapshot.similarity_search(query_embedding, top_k, nprobe)
+
+    def similarity_search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        nprobe: Optional[int] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """See StoreSnapshot.similarity_search_batch; runs on the live snapshot."""
+        return self._snapshot.similarity_search_batch(query_embeddings, top_k, nprobe)
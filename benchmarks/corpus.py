@@ -0,0 +1,148 @@
+import json
+import os
+import random
+import re
+from typing import Dict, Iterator, List
+
+ASSETS_DIR = os.path.join(os.path.dirname(__file__), "..", "assets")
+
+# Each generated section stays between half and all of the chunker's 800
+# characters, so sections neither pack together nor split: one section is
+# one chunk and corpus size can be targeted in chunks.
+SECTION_MIN_CHARS = 450
+SECTION_MAX_CHARS = 760
+SECTIONS_PER_DOC = 200
+
+_FEATURES = [
+    "Discount Code", "Shipping", "Cart Summary", "Payment", "Pay Now Button",
+    "Form Validation", "Success Message", "Quantity", "Express Shipping",
+    "Gift Card", "Order History", "Address Book", "Tax Calculation", "Refunds",
+]
+_FIELDS = ["name", "email", "address", "zip", "phone", "card-number", "cvv", "quantity"]
+_METHODS = ["GET", "POST", "PUT", "DELETE"]
+
+
+def _asset_sentences() -> Dict[str, List[str]]:
+    """Bullet and prose lines from assets/, the vocabulary of the corpus."""
+    def lines(name: str) -> List[str]:
+        with open(os.path.join(ASSETS_DIR, name), "r", encoding="utf-8") as f:
+            text = f.read()
+        out = []
+        for line in text.splitlines():
+            line = re.sub(r"^\s*(?:[-*]|\d+\.)\s*", "", line).strip()
+            if len(line) > 30 and not line.startswith("#"):
+                out.append(line)
+        return out
+
+    with open(os.path.join(ASSETS_DIR, "api_endpoints.json"), "r", encoding="utf-8") as f:
+        api = json.load(f)
+    return {
+        "specs": lines("product_specs.md"),
+        "ux": lines("ui_ux_guide.txt"),
+        "api": [v["description"] for v in api.values() if "description" in v],
+    }
+
+
+class CorpusGenerator:
+    """
+    Deterministic synthetic documents shaped like assets/: Markdown product
+    specs, numbered UX guides, API contracts as JSON, and the real
+    checkout.html. Sentences are drawn from the assets and varied with
+    numbered features, coupon codes, field ids and endpoints, so both the
+    embedder and BM25 see realistic, distinguishable chunks.
+    """
+
+    def __init__(self, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.sentences = _asset_sentences()
+        self.counter = 0
+
+    def _vary(self, sentence: str) -> str:
+        rng = self.rng
+        self.counter += 1
+        n = self.counter
+        extras = [
+            f"The coupon `SAVE{rng.randint(5, 95)}X{n}` applies to {rng.choice(_FEATURES).lower()}.",
+            f"Field `#{rng.choice(_FIELDS)}-{n}` must be validated before submit.",
+            f"Endpoint `{rng.choice(_METHODS)} /api/v{rng.randint(1, 3)}/resource_{n}` "
+            f"returns the updated totals.",
+            f"Rule R-{n}: {rng.choice(_FEATURES)} depends on {rng.choice(_FEATURES).lower()}.",
+        ]
+        return f"{sentence} {rng.choice(extras)}"
+
+    def _paragraph(self, kind: str, prefix: str = "- ") -> str:
+        target = self.rng.randint(SECTION_MIN_CHARS, SECTION_MAX_CHARS - 60)
+        lines: List[str] = []
+        size = 0
+        while size < target:
+            line = prefix + self._vary(self.rng.choice(self.sentences[kind]))
+            lines.append(line)
+            size += len(line) + 1
+        text = "\n".join(lines)
+        return text[: SECTION_MAX_CHARS - 60].rsplit(" ", 1)[0]
+
+    def specs_doc(self, index: int, sections: int) -> Dict[str, str]:
+        parts = [f"# Product Specifications {index}"]
+        for s in range(sections):
+            feature = self.rng.choice(_FEATURES)
+            parts.append(f"## {feature} Rules {index}.{s}\n\n{self._paragraph('specs')}")
+        return {
+            "filename": f"product_specs_{index:06d}.md",
+            "content": "\n\n".join(parts),
+            "doc_type": "support",
+        }
+
+    def ux_doc(self, index: int, sections: int) -> Dict[str, str]:
+        parts = [f"UI/UX Guidelines {index}"]
+        for s in range(sections):
+            feature = self.rng.choice(_FEATURES)
+            parts.append(f"{s + 1}. {feature} {index}.{s}\n{self._paragraph('ux', '   - ')}")
+        return {
+            "filename": f"ui_ux_guide_{index:06d}.txt",
+            "content": "\n\n".join(parts),
+            "doc_type": "support",
+        }
+
+    def api_doc(self, index: int, sections: int) -> Dict[str, str]:
+        api = {}
+        for s in range(sections):
+            method = self.rng.choice(_METHODS)
+            api[f"{method} /api/v1/{index}/endpoint_{s}"] = {
+                "body": {f: "string" for f in self.rng.sample(_FIELDS, 4)},
+                "description": self._paragraph("api", "")[:500],
+            }
+        return {
+            "filename": f"api_endpoints_{index:06d}.json",
+            "content": json.dumps(api, indent=2),
+            "doc_type": "support",
+        }
+
+    def checkout_doc(self) -> Dict[str, str]:
+        with open(os.path.join(ASSETS_DIR, "checkout.html"), "r", encoding="utf-8") as f:
+            content = f.read()
+        return {"filename": "checkout.html", "content": content, "doc_type": "html"}
+
+    def documents(self, n_chunks: int) -> Iterator[Dict[str, str]]:
+        """
+        Documents totalling about `n_chunks` chunks once parsed: the checkout
+        page, then specs, UX guides and API contracts in a 2:2:1 mix of
+        SECTIONS_PER_DOC sections each.
+        """
+        yield self.checkout_doc()
+        makers = [self.specs_doc, self.ux_doc, self.specs_doc, self.ux_doc, self.api_doc]
+        remaining = n_chunks
+        index = 0
+        while remaining > 0:
+            sections = min(SECTIONS_PER_DOC, remaining)
+            yield makers[index % len(makers)](index, sections)
+            remaining -= sections
+            index += 1
+
+    def queries(self, n: int) -> List[str]:
+        """Distinct retrieval queries in the style of the Streamlit test-case prompts."""
+        out = []
+        for i in range(n):
+            feature = self.rng.choice(_FEATURES)
+            detail = self._vary(self.rng.choice(self.sentences["specs"] + self.sentences["ux"]))
+            out.append(f"Generate test cases for {feature} #{i}: {detail}")
+        return out
@@ -0,0 +1,39 @@
+import re
+import zlib
+from typing import List, Union
+
+import numpy as np
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class FakeEmbedder:
+    """
+    Offline stand-in for SentenceTransformer.encode: a hashed bag of words
+    projected through a fixed random table. Deterministic across processes
+    and runs, shares words -> similar vectors, and costs microseconds per
+    text, so benchmarks measure the store and not the model.
+    """
+
+    def __init__(self, dim: int = 384, buckets: int = 4096, seed: int = 0):
+        self.dim = dim
+        self.buckets = buckets
+        rng = np.random.default_rng(seed)
+        self.table = rng.standard_normal((buckets, dim)).astype(np.float32)
+
+    def _embed(self, text: str) -> np.ndarray:
+        ids = [zlib.crc32(w.encode("utf-8")) % self.buckets
+               for w in _WORD_RE.findall(text.lower())]
+        if not ids:
+            return self.table[0]
+        return self.table[ids].sum(axis=0)
+
+    def encode(
+        self, sentences: Union[str, List[str]], convert_to_numpy: bool = True, **kwargs
+    ) -> np.ndarray:
+        if isinstance(sentences, str):
+            return self._embed(sentences)
+        out = np.empty((len(sentences), self.dim), dtype=np.float32)
+        for i, text in enumerate(sentences):
+            out[i] = self._embed(text)
+        return out
@@ -0,0 +1,455 @@
+"""
+HTTP load test of the FastAPI backend with user journeys mirroring the three
+Streamlit tabs (build the KB, generate test cases, generate Selenium scripts).
+
+    # against a running backend (start it with LLM_PROVIDER=fake to avoid
+    # paying for tokens)
+    python -m benchmarks.loadtest --url http://localhost:8000 --rates 1,2,4,8 --step-seconds 30
+
+    # or let the harness start one with the fake LLM provider
+    python -m benchmarks.loadtest --spawn-server --rates 2,4,8,16 --output load.json
+
+Users arrive open-loop (Poisson by default) at each rate in --rates for
+--step-seconds, each running one journey picked by --mix. Every step reports
+throughput, error rate and latency percentiles per endpoint and journey, and
+is flagged as saturated once errors, dropped arrivals or p95 growth show the
+backend no longer keeps up.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from .run import REPO_ROOT, machine_info, percentiles
+
+ASSETS_DIR = os.path.join(REPO_ROOT, "assets")
+
+QUERIES = [
+    "Generate positive and negative test cases for discount code SAVE15, express "
+    "shipping, and form validation.",
+    "Generate test cases for the Pay Now button and the success message.",
+    "Generate negative test cases for invalid discount codes.",
+    "Generate test cases for cart quantity updates and total price calculation.",
+    "Generate test cases for required fields in the checkout form.",
+    "Generate test cases for choosing Credit Card or PayPal.",
+]
+
+
+class Recorder:
+    """Latencies, time to first byte and failures per endpoint or journey."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.ttfb: Dict[str, List[float]] = {}
+        self.errors: Dict[str, Counter] = {}
+
+    def record(
+        self, name: str, seconds: float, error: Optional[str] = None,
+        ttfb: Optional[float] = None,
+    ):
+        self.latencies.setdefault(name, []).append(seconds)
+        counter = self.errors.setdefault(name, Counter())
+        if error:
+            counter[error] += 1
+        if ttfb is not None:
+            self.ttfb.setdefault(name, []).append(ttfb)
+
+    def summary(self, elapsed: float) -> Dict[str, Dict[str, Any]]:
+        out = {}
+        for name, samples in sorted(self.latencies.items()):
+            errors = self.errors[name]
+            n_errors = sum(errors.values())
+            entry = {
+                "count": len(samples),
+                "errors": n_errors,
+                "error_rate": n_errors / len(samples),
+                "error_kinds": dict(errors),
+                "throughput_rps": (len(samples) - n_errors) / elapsed if elapsed else 0.0,
+                **percentiles(samples),
+                "p95_ms": float(_quantile_ms(samples, 95)),
+                "max_ms": 1000 * max(samples),
+            }
+            if name in self.ttfb:
+                entry["ttfb_p50_ms"] = float(_quantile_ms(self.ttfb[name], 50))
+                entry["ttfb_p99_ms"] = float(_quantile_ms(self.ttfb[name], 99))
+            out[name] = entry
+        return out
+
+
+def _quantile_ms(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return 1000 * ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class LoadContext:
+    def __init__(self, session, args: argparse.Namespace, documents: List[Dict[str, str]]):
+        self.session = session
+        self.args = args
+        self.url = args.url.rstrip("/")
+        self.kb_id = args.kb_id
+        self.documents = documents
+        self.rng = random.Random(args.seed)
+        self.recorder = Recorder()
+        self.user_seq = 0
+
+    def query(self) -> str:
+        """A UI-style request; unique unless it is one of the repeated ones."""
+        self.user_seq += 1
+        base = self.rng.choice(QUERIES)
+        if self.rng.random() < self.args.repeat_fraction:
+            return base
+        return f"{base} (session {self.user_seq})"
+
+    async def request(
+        self, method: str, path: str, name: Optional[str] = None, **kwargs
+    ) -> Tuple[int, Any]:
+        """Timed JSON request; records it under `name` (default: the path)."""
+        name = name or f"{method} {path}"
+        start = time.perf_counter()
+        try:
+            async with self.session.request(method, self.url + path, **kwargs) as resp:
+                body = await resp.json(content_type=None)
+                status = resp.status
+        except asyncio.TimeoutError:
+            self.recorder.record(name, time.perf_counter() - start, "timeout")
+            raise
+        except Exception as e:
+            self.recorder.record(name, time.perf_counter() - start, type(e).__name__)
+            raise
+        error = None if 200 <= status < 300 else f"http_{status}"
+        self.recorder.record(name, time.perf_counter() - start, error)
+        if error:
+            raise RuntimeError(f"{name} -> {status}")
+        return status, body
+
+    async def stream_test_cases(self, query: str) -> List[Dict[str, Any]]:
+        """Reads /generate_test_cases_stream to the end, like the UI does."""
+        name = "POST /generate_test_cases_stream"
+        start = time.perf_counter()
+        first = None
+        cases: List[Dict[str, Any]] = []
+        error = None
+        try:
+            async with self.session.post(
+                self.url + "/generate_test_cases_stream",
+                json={"query": query, "kb_id": self.kb_id},
+            ) as resp:
+                if resp.status != 200:
+                    error = f"http_{resp.status}"
+                else:
+                    event = None
+                    async for raw in resp.content:
+                        if first is None:
+                            first = time.perf_counter() - start
+                        line = raw.decode("utf-8").rstrip("\n")
+                        if line.startswith("event:"):
+                            event = line[len("event:"):].strip()
+                        elif line.startswith("data:") and event == "test_case":
+                            cases.append(json.loads(line[len("data:"):]))
+                        elif line.startswith("data:") and event == "error":
+                            error = "stream_error"
+        except asyncio.TimeoutError:
+            error = "timeout"
+        except Exception as e:
+            error = type(e).__name__
+        self.recorder.record(name, time.perf_counter() - start, error, ttfb=first)
+        if error:
+            raise RuntimeError(f"{name} -> {error}")
+        return cases
+
+    async def think(self):
+        if self.args.think_seconds > 0:
+            await asyncio.sleep(self.rng.expovariate(1 / self.args.think_seconds))
+
+
+async def build_journey(ctx: LoadContext):
+    """Tab 1: upload the assets and build the KB."""
+    payload = {"documents": ctx.documents, "kb_id": ctx.kb_id}
+    if ctx.args.build_endpoint == "sync":
+        await ctx.request("POST", "/build_kb", json=payload)
+        return
+    _, job = await ctx.request("POST", "/build_kb_async", json=payload)
+    while job["status"] in ("queued", "running"):
+        await asyncio.sleep(0.5)
+        _, job = await ctx.request("GET", f"/jobs/{job['id']}", name="GET /jobs/{job_id}")
+    if job["status"] != "succeeded":
+        raise RuntimeError(f"build job {job['status']}")
+
+
+async def _test_cases(ctx: LoadContext) -> List[Dict[str, Any]]:
+    query = ctx.query()
+    if ctx.rng.random() < ctx.args.stream_fraction:
+        return await ctx.stream_test_cases(query)
+    _, body = await ctx.request(
+        "POST", "/generate_test_cases", json={"query": query, "kb_id": ctx.kb_id}
+    )
+    return body.get("test_cases", [])
+
+
+async def test_cases_journey(ctx: LoadContext):
+    """Tab 2: describe what to test and generate test cases."""
+    await _test_cases(ctx)
+
+
+async def script_journey(ctx: LoadContext):
+    """Tab 3: generate test cases, pick one, then generate its script (or all)."""
+    cases = await _test_cases(ctx)
+    if not cases:
+        raise RuntimeError("no test cases to script")
+    await ctx.think()
+    if len(cases) > 1 and ctx.rng.random() < ctx.args.batch_fraction:
+        await ctx.request(
+            "POST", "/generate_selenium_scripts",
+            json={"test_cases": cases, "kb_id": ctx.kb_id},
+        )
+    else:
+        await ctx.request(
+            "POST", "/generate_selenium_script",
+            json={"test_case": ctx.rng.choice(cases), "kb_id": ctx.kb_id},
+        )
+
+
+JOURNEYS = {
+    "build": build_journey,
+    "test_cases": test_cases_journey,
+    "script": script_journey,
+}
+
+
+async def _run_journey(ctx: LoadContext, name: str):
+    start = time.perf_counter()
+    error = None
+    try:
+        await JOURNEYS[name](ctx)
+    except Exception as e:
+        error = type(e).__name__
+    ctx.recorder.record(f"journey:{name}", time.perf_counter() - start, error)
+
+
+async def run_step(ctx: LoadContext, rate: float, mix: Dict[str, float]) -> Dict[str, Any]:
+    """Open-loop arrivals at `rate` users/s for --step-seconds, then drains."""
+    args = ctx.args
+    ctx.recorder = Recorder()
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    tasks: set = set()
+    started = dropped = 0
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    next_at = t0
+    while next_at < t0 + args.step_seconds:
+        await asyncio.sleep(max(0.0, next_at - loop.time()))
+        if len(tasks) >= args.max_users:
+            dropped += 1  # the backend is not keeping up with the arrival rate
+        else:
+            task = asyncio.create_task(
+                _run_journey(ctx, ctx.rng.choices(names, weights)[0])
+            )
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            started += 1
+        gap = ctx.rng.expovariate(rate) if args.arrivals == "poisson" else 1 / rate
+        next_at += gap
+    if tasks:
+        await asyncio.wait(set(tasks), timeout=args.drain_seconds)
+    unfinished = list(tasks)
+    for task in unfinished:
+        task.cancel()
+    # let cancelled journeys unwind (and release their connections)
+    await asyncio.gather(*unfinished, return_exceptions=True)
+    elapsed = loop.time() - t0
+    summary = ctx.recorder.summary(elapsed)
+    return {
+        "rate": rate,
+        "seconds": elapsed,
+        "users_started": started,
+        "users_dropped": dropped,
+        "users_unfinished": len(unfinished),
+        "endpoints": {k: v for k, v in summary.items() if not k.startswith("journey:")},
+        "journeys": {
+            k[len("journey:"):]: v for k, v in summary.items() if k.startswith("journey:")
+        },
+    }
+
+
+def _mark_saturation(steps: List[Dict[str, Any]], max_error_rate: float, p95_growth: float):
+    """
+    A step is saturated when users were dropped or left unfinished, the
+    journey error rate exceeds max_error_rate, or a journey's p95 grew more
+    than p95_growth times over the first step.
+    """
+    baseline = steps[0]["journeys"] if steps else {}
+    for step in steps:
+        reasons = []
+        if step["users_dropped"] or step["users_unfinished"]:
+            reasons.append("backlog")
+        for name, j in step["journeys"].items():
+            if j["error_rate"] > max_error_rate:
+                reasons.append(f"{name} errors {j['error_rate']:.0%}")
+            base = baseline.get(name)
+            if base and base["p95_ms"] and j["p95_ms"] > p95_growth * base["p95_ms"]:
+                reasons.append(f"{name} p95 {j['p95_ms'] / base['p95_ms']:.1f}x")
+        step["saturated"] = bool(reasons)
+        step["saturation_reasons"] = reasons
+
+
+def _load_documents() -> List[Dict[str, str]]:
+    docs = []
+    for name in sorted(os.listdir(ASSETS_DIR)):
+        with open(os.path.join(ASSETS_DIR, name), "r", encoding="utf-8") as f:
+            content = f.read()
+        docs.append({
+            "filename": name,
+            "content": content,
+            "doc_type": "html" if name.endswith(".html") else "support",
+        })
+    return docs
+
+
+def _parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition(":")
+        if name not in JOURNEYS:
+            raise SystemExit(f"unknown journey {name!r}; expected one of {sorted(JOURNEYS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def _wait_healthy(session, url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get(url + "/health") as resp:
+                if resp.status == 200:
+                    return
+        except Exception:
+            pass
+        if time.monotonic() > deadline:
+            raise SystemExit(f"backend at {url} did not become healthy in {timeout:.0f}s")
+        await asyncio.sleep(0.5)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    import aiohttp
+
+    mix = _parse_mix(args.mix)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.max_users)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        await _wait_healthy(session, args.url.rstrip("/"), args.startup_timeout)
+        ctx = LoadContext(session, args, _load_documents())
+        if not args.skip_setup:
+            # the generate journeys need a KB to retrieve from
+            await build_journey(ctx)
+        steps = []
+        try:
+            for rate in (float(r) for r in args.rates.split(",") if r.strip()):
+                print(f"step: {rate:g} users/s for {args.step_seconds:g}s...", file=sys.stderr)
+                step = await run_step(ctx, rate, mix)
+                steps.append(step)
+                for name, j in step["journeys"].items():
+                    print(
+                        f"  {name:10s} n={j['count']:<5d} err={j['error_rate']:.1%} "
+                        f"p50={j['p50_ms']:.0f}ms p95={j['p95_ms']:.0f}ms "
+                        f"p99={j['p99_ms']:.0f}ms",
+                        file=sys.stderr,
+                    )
+        finally:
+            if not args.keep_kb:
+                try:
+                    await ctx.request("DELETE", f"/kbs/{ctx.kb_id}", name="cleanup")
+                except Exception:
+                    pass
+    _mark_saturation(steps, args.max_error_rate, args.p95_growth)
+    return {
+        "machine": machine_info(),
+        "params": {
+            k: getattr(args, k)
+            for k in (
+                "url", "rates", "step_seconds", "arrivals", "mix", "stream_fraction",
+                "batch_fraction", "repeat_fraction", "think_seconds", "build_endpoint",
+                "max_users", "seed",
+            )
+        },
+        "steps": steps,
+    }
+
+
+def _spawn_server(port: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.setdefault("LLM_PROVIDER", "fake")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT, env=env,
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--spawn-server", action="store_true",
+                        help="start a backend (LLM_PROVIDER=fake unless set) on --port")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rates", default="1,2,4,8",
+                        help="comma-separated arrival rates in users/s, one step each")
+    parser.add_argument("--step-seconds", type=float, default=30)
+    parser.add_argument("--arrivals", choices=["poisson", "constant"], default="poisson")
+    parser.add_argument("--mix", default="build:1,test_cases:6,script:3",
+                        help="journey weights, e.g. build:1,test_cases:6,script:3")
+    parser.add_argument("--stream-fraction", type=float, default=0.3,
+                        help="share of test-case requests using the SSE endpoint")
+    parser.add_argument("--batch-fraction", type=float, default=0.2,
+                        help="share of script journeys generating all scripts at once")
+    parser.add_argument("--repeat-fraction", type=float, default=0.2,
+                        help="share of queries repeated verbatim (cache hits)")
+    parser.add_argument("--think-seconds", type=float, default=1.0)
+    parser.add_argument("--build-endpoint", choices=["sync", "async"], default="sync")
+    parser.add_argument("--kb-id", default="loadtest")
+    parser.add_argument("--keep-kb", action="store_true")
+    parser.add_argument("--skip-setup", action="store_true")
+    parser.add_argument("--max-users", type=int, default=256,
+                        help="in-flight journeys before arrivals are dropped")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--drain-seconds", type=float, default=120)
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--max-error-rate", type=float, default=0.05)
+    parser.add_argument("--p95-growth", type=float, default=3.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report JSON here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.spawn_server:
+        args.url = f"http://127.0.0.1:{args.port}"
+        server = _spawn_server(args.port)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    for step in report["steps"]:
+        if step["saturated"]:
+            print(f"saturated at {step['rate']:g} users/s: "
+                  f"{', '.join(step['saturation_reasons'])}", file=sys.stderr)
+            break
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
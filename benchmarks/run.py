@@ -0,0 +1,292 @@
+"""
+Retrieval and ingest benchmarks on synthetic corpora, fully offline.
+
+    python -m benchmarks.run --sizes 1000,10000,100000 --output results.json
+    python -m benchmarks.run --sizes 1000 --baseline results.json
+
+Each size runs in its own subprocess so peak RSS is per size. Results are a
+JSON document (machine info + one entry per size); with --baseline, latency
+and throughput are compared against a previous run and the exit code is 1
+if anything regressed by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50, p99 and mean of durations in seconds, reported in milliseconds."""
+    ms = np.asarray(samples, dtype=np.float64) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+    }
+
+
+def _time_each(fn, items) -> List[float]:
+    out = []
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_size(n_chunks: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """Builds a KB of about n_chunks chunks in a scratch directory and measures it."""
+    from backend import rag_engine
+    from backend.embedding_cache import EmbeddingCache
+    from backend.kb_registry import KBRegistry
+    from backend.metrics import metrics
+    from backend.vector_store import SimpleVectorStore
+
+    from .corpus import CorpusGenerator
+    from .fake_embedder import FakeEmbedder
+
+    workdir = tempfile.mkdtemp(prefix="autoqa-bench-")
+    try:
+        # everything the engine persists goes to the scratch directory
+        rag_engine._embedding_model = FakeEmbedder(dim=args.dim)
+        rag_engine._embedding_cache = EmbeddingCache(
+            path=os.path.join(workdir, "embedding_cache.sqlite")
+        )
+        rag_engine._kb_registry = KBRegistry(
+            root=os.path.join(workdir, "kb_stores"),
+            memory_budget_bytes=1 << 62,
+            index_type=args.index,
+            quantization=args.quantization,
+        )
+        kb_id = "bench"
+
+        t0 = time.perf_counter()
+        generator = CorpusGenerator(seed=args.seed)
+        documents = list(generator.documents(n_chunks))
+        queries = generator.queries(args.queries)
+        corpus_seconds = time.perf_counter() - t0
+
+        metrics.reset()
+        t0 = time.perf_counter()
+        num_chunks = rag_engine.build_knowledge_base(documents, kb_id=kb_id)
+        build_seconds = time.perf_counter() - t0
+        stages = {
+            s["labels"]["stage"]: round(s["sum"], 6)
+            for s in metrics.snapshot()["summaries"]
+            if s["name"] == "stage_duration_seconds"
+        }
+        total_chars = sum(len(d["content"]) for d in documents)
+        del documents
+
+        path = rag_engine.get_kb_registry().path_for(kb_id)
+        load_times = []
+        for _ in range(args.load_repeats):
+            t0 = time.perf_counter()
+            store = SimpleVectorStore(
+                path=path, index_type=args.index, quantization=args.quantization
+            )
+            load_times.append(time.perf_counter() - t0)
+        snapshot = store.snapshot()
+
+        embedder = rag_engine._embedding_model
+        q_embs = embedder.encode(queries)
+        rows = range(len(queries))
+        top_k = args.top_k
+        dense = _time_each(lambda i: snapshot.similarity_search(q_embs[i], top_k=top_k), rows)
+        keyword = _time_each(lambda i: snapshot.keyword_search(queries[i], top_k=top_k), rows)
+        hybrid = _time_each(
+            lambda i: snapshot.hybrid_search_batch(q_embs[i:i + 1], [queries[i]], top_k=top_k),
+            rows,
+        )
+        t0 = time.perf_counter()
+        snapshot.similarity_search_batch(q_embs, top_k=top_k)
+        batch_seconds = time.perf_counter() - t0
+        # end to end, including query encoding and context packing; queries
+        # are distinct, so the query and retrieval caches never hit
+        retrieve = _time_each(
+            lambda q: rag_engine.retrieve_context(q, top_k=top_k, kb_id=kb_id), queries
+        )
+
+        return {
+            "target_chunks": n_chunks,
+            "num_chunks": num_chunks,
+            "corpus_chars": total_chars,
+            "corpus_seconds": corpus_seconds,
+            "build": {
+                "seconds": build_seconds,
+                "chunks_per_second": num_chunks / build_seconds,
+                "stage_seconds": stages,
+            },
+            "load": {
+                "min_ms": 1000 * min(load_times),
+                "median_ms": 1000 * float(np.median(load_times)),
+            },
+            "similarity_search": percentiles(dense),
+            "similarity_search_batch": {
+                "per_query_ms": 1000 * batch_seconds / max(len(queries), 1),
+            },
+            "keyword_search": percentiles(keyword),
+            "hybrid_search": percentiles(hybrid),
+            "retrieve_context": percentiles(retrieve),
+            "store_memory_mb": snapshot.memory_bytes() / (1024 * 1024),
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+    finally:
+        rag_engine.shutdown_ingest_pool()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def machine_info() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+# (path into a result, True if higher is better)
+_TRACKED = [
+    (("build", "chunks_per_second"), True),
+    (("load", "median_ms"), False),
+    (("similarity_search", "p50_ms"), False),
+    (("similarity_search", "p99_ms"), False),
+    (("hybrid_search", "p50_ms"), False),
+    (("retrieve_context", "p50_ms"), False),
+    (("peak_rss_mb",), False),
+]
+
+
+def compare(
+    baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """
+    Regressions of `current` against `baseline` beyond `tolerance`
+    (0.2 = 20% worse), matched by target_chunks; one line each.
+    """
+    previous = {r["target_chunks"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for result in current["results"]:
+        base = previous.get(result["target_chunks"])
+        if base is None:
+            continue
+        for path, higher_is_better in _TRACKED:
+            old, new = base, result
+            for key in path:
+                old, new = old.get(key), new.get(key)
+                if old is None or new is None:
+                    break
+            if not old or new is None:
+                continue
+            ratio = new / old
+            worse = ratio < 1 - tolerance if higher_is_better else ratio > 1 + tolerance
+            if worse:
+                regressions.append(
+                    f"{result['target_chunks']} chunks {'.'.join(path)}: "
+                    f"{old:.4g} -> {new:.4g} ({ratio:.2f}x)"
+                )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma-separated corpus sizes in chunks (up to 1000000)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--index", choices=["flat", "ivf"], default=None)
+    parser.add_argument("--quantization", choices=["float16", "int8"], default=None)
+    parser.add_argument("--load-repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.single is not None:
+        # child process: one size, result on stdout
+        print(json.dumps(run_size(args.single, args)))
+        return 0
+
+    child_args = [
+        "--queries", str(args.queries), "--top-k", str(args.top_k),
+        "--dim", str(args.dim), "--load-repeats", str(args.load_repeats),
+        "--seed", str(args.seed),
+    ]
+    if args.index:
+        child_args += ["--index", args.index]
+    if args.quantization:
+        child_args += ["--quantization", args.quantization]
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"benchmarking {size} chunks...", file=sys.stderr)
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.run", "--single", str(size), *child_args],
+            cwd=REPO_ROOT, stdout=subprocess.PIPE, check=True, text=True,
+        )
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(
+            f"  {result['num_chunks']} chunks: build {result['build']['chunks_per_second']:.0f}"
+            f" chunks/s, load {result['load']['median_ms']:.1f}ms, search p50"
+            f" {result['similarity_search']['p50_ms']:.2f}ms p99"
+            f" {result['similarity_search']['p99_ms']:.2f}ms,"
+            f" peak RSS {result['peak_rss_mb']:.0f}MB",
+            file=sys.stderr,
+        )
+        results.append(result)
+
+    report = {
+        "machine": machine_info(),
+        "params": {
+            "queries": args.queries, "top_k": args.top_k, "dim": args.dim,
+            "index": args.index, "quantization": args.quantization, "seed": args.seed,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
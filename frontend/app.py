@@ -3,6 +3,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import os
 import json
+import time
 import requests
 import streamlit as st
 from typing import List
@@ -154,6 +155,12 @@ backend_url = st.sidebar.text_input(
     help="FastAPI backend base URL.",
 )
 
+kb_id = st.sidebar.text_input(
+    "Knowledge base",
+    value="default",
+    help="Name of the KB to build and query; each name is stored separately.",
+)
+
 st.sidebar.markdown("---")
 st.sidebar.markdown(
     """
@@ -204,6 +211,20 @@ if "kb_status" not in st.session_state:
     st.session_state.kb_status = "idle"  # idle | built | error
 
 
+def iter_sse_events(resp):
+    """Yields (event, data) pairs from a server-sent-events response."""
+    event, data_lines = "message", []
+    for line in resp.iter_lines(decode_unicode=True):
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+
 
 tab1, tab2, tab3 = st.tabs(
     ["1. Build Knowledge Base", "2. Generate Test Cases", "3. Generate Selenium Scripts"]
@@ -254,7 +275,7 @@ with tab1:
         st.markdown(
             """
             - 🔍 Text is chunked and embedded using a SentenceTransformer  
-            - 🧠 Chunks are stored in a simple vector store (`kb_store.pkl`)  
+            - 🧠 Chunks are stored in a memory-mapped vector store (`kb_stores/<kb_id>/`)  
             - 🧾 Full `checkout.html` is stored for Selenium selector generation  
 
             **Recommended uploads:**
@@ -318,26 +339,41 @@ with tab1:
             st.error("Please upload at least one support document and/or `checkout.html` before building the KB.")
             st.session_state.kb_status = "error"
         else:
-            with st.spinner("Indexing documents and building embeddings…"):
-                try:
-                    resp = requests.post(
-                        f"{backend_url}/build_kb",
-                        json={"documents": docs_payload},
-                        timeout=600,
-                    )
-                    if resp.status_code == 200:
-                        data = resp.json()
+            try:
+                resp = requests.post(
+                    f"{backend_url}/build_kb_async",
+                    json={"documents": docs_payload, "kb_id": kb_id},
+                    timeout=60,
+                )
+                if resp.status_code != 202:
+                    st.error(f"Backend error: {resp.status_code} - {resp.text}")
+                    st.session_state.kb_status = "error"
+                else:
+                    # the build runs as a background job; poll it for progress
+                    job = resp.json()
+                    progress_bar = st.progress(0.0, text="Queued…")
+                    while job["status"] in ("queued", "running"):
+                        time.sleep(0.5)
+                        job = requests.get(
+                            f"{backend_url}/jobs/{job['id']}", timeout=30
+                        ).json()
+                        fraction = job["done"] / job["total"] if job["total"] else 0.0
+                        progress_bar.progress(
+                            min(fraction, 1.0),
+                            text=f"{job['stage'].capitalize()}… {job['done']}/{job['total']}",
+                        )
+                    progress_bar.empty()
+                    if job["status"] == "succeeded":
                         st.success(
-                            f"✅ Knowledge Base Built — **{data['num_chunks']}** text chunks indexed."
+                            f"✅ Knowledge Base Built — **{job['result']['num_chunks']}** text chunks indexed."
                         )
                         st.session_state.kb_status = "built"
                     else:
-                        st.error(f"Backend error: {resp.status_code} - {resp.text}")
+                        st.error(f"KB build {job['status']}: {job['error'] or ''}")
                         st.session_state.kb_status = "error"
-                except Exception as e:
-                    st.error(f"Error calling backend: {e}")
-                    st.session_state.kb_status = "error"
-
+            except Exception as e:
+                st.error(f"Error calling backend: {e}")
+                st.session_state.kb_status = "error"
 
 
 with tab2:
@@ -366,6 +402,12 @@ with tab2:
             height=120,
         )
 
+        stream_cases = st.checkbox(
+            "⚡ Show test cases as they are generated",
+            value=True,
+            help="Streams each test case from the backend as soon as the LLM finishes it.",
+        )
+
         gen_clicked = st.button("🧪 Generate Test Cases", use_container_width=True)
 
         st.markdown("</div>", unsafe_allow_html=True)
@@ -392,12 +434,53 @@ with tab2:
     if gen_clicked:
         if not query.strip():
             st.error("Please describe what you want to test.")
+        elif stream_cases:
+            # nothing from the previous run may stay on screen if this one fails
+            st.session_state.test_cases = []
+            st.session_state.raw_test_case_output = ""
+            live = st.empty()
+            try:
+                with requests.post(
+                    f"{backend_url}/generate_test_cases_stream",
+                    json={"query": query, "kb_id": kb_id},
+                    stream=True,
+                    timeout=600,
+                ) as resp:
+                    if resp.status_code != 200:
+                        st.error(f"Backend error: {resp.status_code} - {resp.text}")
+                    else:
+                        live.info("Asking the Test Case Agent to propose scenarios…")
+                        for event, data in iter_sse_events(resp):
+                            if event == "test_case":
+                                st.session_state.test_cases.append(data)
+                                with live.container():
+                                    st.markdown(
+                                        f"Received **{len(st.session_state.test_cases)}** test cases so far…"
+                                    )
+                                    for c in st.session_state.test_cases:
+                                        st.markdown(f"- `{c['id']}` {c['feature']} — {c['scenario']}")
+                            elif event == "done":
+                                st.session_state.raw_test_case_output = data.get("raw_output", "")
+                            elif event == "error":
+                                st.error(f"Backend error: {data.get('detail')}")
+                live.empty()
+                if st.session_state.test_cases:
+                    st.success(
+                        f"Generated and parsed **{len(st.session_state.test_cases)}** structured test cases."
+                    )
+                elif st.session_state.raw_test_case_output:
+                    st.warning(
+                        "The LLM responded, but I couldn't parse structured test cases. "
+                        "Check the raw output below."
+                    )
+            except Exception as e:
+                st.error(f"Error calling backend: {e}")
         else:
             with st.spinner("Asking the Test Case Agent to propose scenarios…"):
                 try:
                     resp = requests.post(
                         f"{backend_url}/generate_test_cases",
-                        json={"query": query},
+                        json={"query": query, "kb_id": kb_id},
                         timeout=600,
                     )
                     if resp.status_code == 200:
@@ -481,7 +564,7 @@ with tab3:
                 try:
                     resp = requests.post(
                         f"{backend_url}/generate_selenium_script",
-                        json={"test_case": selected_case},
+                        json={"test_case": selected_case, "kb_id": kb_id},
                         timeout=600,
                     )
                     if resp.status_code == 200:
@@ -502,4 +585,31 @@ with tab3:
                 except Exception as e:
                     st.error(f"Error calling backend: {e}")
 
+        all_cases = st.session_state.test_cases
+        if len(all_cases) > 1 and st.button(
+            f"📦 Generate Selenium Scripts for All {len(all_cases)} Test Cases",
+            use_container_width=True,
+        ):
+            with st.spinner("Generating scripts for every test case in parallel…"):
+                try:
+                    resp = requests.post(
+                        f"{backend_url}/generate_selenium_scripts",
+                        json={"test_cases": all_cases, "kb_id": kb_id},
+                        timeout=600,
+                    )
+                    if resp.status_code == 200:
+                        results = resp.json().get("results", [])
+                        ok = [r for r in results if r.get("script")]
+                        st.success(f"Generated **{len(ok)}** of **{len(results)}** scripts.")
+                        for r in results:
+                            with st.expander(f"{r['test_case_id']}", expanded=False):
+                                if r.get("script"):
+                                    st.code(r["script"], language="python")
+                                else:
+                                    st.error(r.get("error") or "The agent did not return any script.")
+                    else:
+                        st.error(f"Backend error: {resp.status_code} - {resp.text}")
+                except Exception as e:
+                    st.error(f"Error calling backend: {e}")
+
         st.markdown("</div>", unsafe_allow_html=True)
@@ -0,0 +1,364 @@
+"""
+Runs generated Selenium scripts in parallel on a pool of reusable headless
+Chrome sessions.
+
+    python tests/run_selenium.py                    # every test_*.py / *_test.py in tests/
+    python tests/run_selenium.py -n 8 --json results.json --junit results.xml
+    python tests/run_selenium.py tests/test_tc001_save15.py --headed
+
+Each worker process owns one browser. While a script runs, webdriver.Chrome
+hands it that browser (its quit() is deferred) and
+ChromeDriverManager().install() returns a driver path resolved once and
+cached on disk, so scripts run unmodified without paying for a browser
+launch or a driver lookup each. Between scripts the browser is reset
+(cookies, storage, extra windows, about:blank) and replaced if it broke.
+
+Scripts may be module-level code, have a main() under
+`if __name__ == "__main__"`, or define test_* functions. AssertionError
+counts as a failure, any other exception as an error. --timeout bounds each
+script (via SIGALRM, where available) and each page load and async script
+(via the driver).
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import runpy
+import signal
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+from xml.etree import ElementTree
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+TESTS_DIR = os.path.join(REPO_ROOT, "tests")
+# pytest unit tests of the backend, not generated scripts
+UNIT_TESTS_DIR = os.path.join(TESTS_DIR, "unit")
+DRIVER_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "autoqa", "chromedriver.json"
+)
+HEADLESS_ARGS = [
+    "--headless=new",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--window-size=1280,1024",
+]
+OUTPUT_TAIL_CHARS = 2000
+
+
+def discover(paths: List[str]) -> List[str]:
+    """
+    Generated scripts under the given files/directories (default: tests/),
+    leaving out the unit tests in tests/unit/.
+    """
+    found = []
+    for path in paths or [TESTS_DIR]:
+        if os.path.isdir(path):
+            for pattern in ("test_*.py", "*_test.py"):
+                found.extend(
+                    p for p in glob.glob(os.path.join(path, "**", pattern), recursive=True)
+                    if not os.path.abspath(p).startswith(UNIT_TESTS_DIR + os.sep)
+                )
+        else:
+            found.append(path)
+    this = os.path.abspath(__file__)
+    return sorted({os.path.abspath(p) for p in found} - {this})
+
+
+def resolve_driver_path(ttl_hours: float, refresh: bool = False) -> Optional[str]:
+    """
+    chromedriver path: CHROMEDRIVER_PATH if set, else the cached result of
+    ChromeDriverManager().install() while the file exists and is younger
+    than ttl_hours, else a fresh lookup (which is then cached). None if
+    webdriver-manager is not installed; Selenium Manager resolves it then.
+    """
+    env_path = os.getenv("CHROMEDRIVER_PATH")
+    if env_path:
+        return env_path
+    if not refresh and os.path.exists(DRIVER_CACHE_PATH):
+        try:
+            with open(DRIVER_CACHE_PATH, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            fresh = time.time() - cached["resolved_at"] < ttl_hours * 3600
+            if fresh and os.path.exists(cached["path"]):
+                return cached["path"]
+        except (OSError, ValueError, KeyError):
+            pass
+    try:
+        from webdriver_manager.chrome import ChromeDriverManager
+    except ImportError:
+        return None
+    path = ChromeDriverManager().install()
+    os.makedirs(os.path.dirname(DRIVER_CACHE_PATH), exist_ok=True)
+    with open(DRIVER_CACHE_PATH, "w", encoding="utf-8") as f:
+        json.dump({"path": path, "resolved_at": time.time()}, f)
+    return path
+
+
+class TestTimeout(Exception):
+    pass
+
+
+class PooledDriver:
+    """
+    The worker's browser as handed to a script: everything is forwarded to
+    the real driver except quit(), which the runner does once at exit.
+    """
+
+    def __init__(self, driver):
+        object.__setattr__(self, "_driver", driver)
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._driver, name, value)
+
+    def quit(self):
+        pass
+
+
+# Per worker process state, set up by _init_worker
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(
+    driver_path: Optional[str], browser_args: List[str], cwd: str, timeout: float
+):
+    from multiprocessing.util import Finalize
+    from selenium import webdriver
+
+    os.chdir(cwd)
+    if cwd not in sys.path:
+        sys.path.insert(0, cwd)
+    _worker.update(
+        driver_path=driver_path,
+        browser_args=browser_args,
+        timeout=timeout,
+        real_chrome=webdriver.Chrome,
+        driver=None,
+        used=False,
+    )
+    webdriver.Chrome = _pooled_chrome
+    try:
+        from webdriver_manager.chrome import ChromeDriverManager
+
+        real_install = ChromeDriverManager.install
+        ChromeDriverManager.install = lambda self: driver_path or real_install(self)
+    except ImportError:
+        pass
+    # runs when the pool shuts the worker down (atexit does not in workers)
+    Finalize(None, _quit_driver, exitpriority=10)
+
+
+def _new_driver():
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    options = webdriver.ChromeOptions()
+    for arg in _worker["browser_args"]:
+        options.add_argument(arg)
+    path = _worker["driver_path"]
+    service = Service(executable_path=path) if path else Service()
+    driver = _worker["real_chrome"](service=service, options=options)
+    # bound the blocking WebDriver calls too; SIGALRM cannot interrupt a
+    # call stuck waiting on the driver, and does not exist on Windows
+    driver.set_page_load_timeout(_worker["timeout"])
+    driver.set_script_timeout(_worker["timeout"])
+    return driver
+
+
+def _pooled_chrome(*args, **kwargs) -> PooledDriver:
+    # the script's own service/options are ignored: every script shares the
+    # pool's headless configuration
+    if _worker["driver"] is None:
+        _worker["driver"] = _new_driver()
+    _worker["used"] = True
+    return PooledDriver(_worker["driver"])
+
+
+def _reset_driver():
+    """Clears state left by the last script; drops the browser if it broke."""
+    driver = _worker["driver"]
+    if driver is None:
+        return
+    try:
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.delete_all_cookies()
+        with contextlib.suppress(Exception):
+            driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+        driver.get("about:blank")
+    except Exception:
+        _quit_driver()
+
+
+def _quit_driver():
+    driver, _worker["driver"] = _worker.get("driver"), None
+    if driver is not None:
+        with contextlib.suppress(Exception):
+            driver.quit()
+
+
+def _on_alarm(signum, frame):
+    raise TestTimeout()
+
+
+def _run_script(path: str, timeout: float) -> Dict[str, Any]:
+    """Runs one script on this worker's browser. Called in the worker."""
+    _worker["used"] = False
+    output = io.StringIO()
+    status, error = "passed", None
+    # POSIX only; elsewhere the driver's page-load and script timeouts apply
+    use_alarm = hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            try:
+                namespace = runpy.run_path(path, run_name="__main__")
+                if not _worker["used"]:
+                    # pytest-style script: nothing ran on import, call its tests
+                    for name, fn in sorted(namespace.items()):
+                        if name.startswith("test_") and callable(fn) and getattr(
+                            getattr(fn, "__code__", None), "co_filename", None
+                        ) == path:
+                            fn()
+            finally:
+                if use_alarm:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+    except TestTimeout:
+        status, error = "timeout", f"exceeded {timeout:g}s"
+    except AssertionError as e:
+        status, error = "failed", f"AssertionError: {e}"
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            status, error = "failed", f"SystemExit: {e.code}"
+    except BaseException as e:
+        status = "error"
+        error = "".join(traceback.format_exception_only(type(e), e)).strip()
+        output.write(traceback.format_exc())
+    seconds = time.perf_counter() - start
+    _reset_driver()
+    return {
+        "path": os.path.relpath(path, REPO_ROOT),
+        "status": status,
+        "seconds": seconds,
+        "error": error,
+        "output": output.getvalue()[-OUTPUT_TAIL_CHARS:],
+        "worker": os.getpid(),
+    }
+
+
+def write_junit(results: List[Dict[str, Any]], path: str, elapsed: float):
+    suite = ElementTree.Element(
+        "testsuite",
+        name="generated-selenium",
+        tests=str(len(results)),
+        failures=str(sum(r["status"] == "failed" for r in results)),
+        errors=str(sum(r["status"] in ("error", "timeout") for r in results)),
+        time=f"{elapsed:.3f}",
+    )
+    for r in results:
+        case = ElementTree.SubElement(
+            suite, "testcase", classname="tests", name=r["path"], time=f"{r['seconds']:.3f}"
+        )
+        if r["status"] != "passed":
+            tag = "failure" if r["status"] == "failed" else "error"
+            ElementTree.SubElement(case, tag, message=r["error"] or r["status"]).text = r["output"]
+        if r["output"]:
+            ElementTree.SubElement(case, "system-out").text = r["output"]
+    ElementTree.ElementTree(suite).write(path, encoding="utf-8", xml_declaration=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="scripts or directories (default: tests/)")
+    parser.add_argument("-n", "--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="parallel browsers")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds per script")
+    parser.add_argument("--headed", action="store_true", help="show the browsers")
+    parser.add_argument("--cwd", default=REPO_ROOT,
+                        help="working directory for scripts (they open assets/ relatively)")
+    parser.add_argument("--driver-cache-ttl", type=float, default=24,
+                        help="hours to reuse the resolved chromedriver path")
+    parser.add_argument("--refresh-driver", action="store_true")
+    parser.add_argument("--json", help="write per-test results as JSON here")
+    parser.add_argument("--junit", help="write a JUnit XML report here")
+    args = parser.parse_args(argv)
+
+    scripts = discover(args.paths)
+    if not scripts:
+        print("no generated scripts found", file=sys.stderr)
+        return 1
+
+    t0 = time.perf_counter()
+    driver_path = resolve_driver_path(args.driver_cache_ttl, refresh=args.refresh_driver)
+    resolve_seconds = time.perf_counter() - t0
+    browser_args = [a for a in HEADLESS_ARGS if not (args.headed and a.startswith("--headless"))]
+    workers = max(1, min(args.workers, len(scripts)))
+    print(
+        f"running {len(scripts)} scripts on {workers} browsers "
+        f"(driver: {driver_path or 'selenium-manager'}, resolved in {resolve_seconds:.2f}s)",
+        file=sys.stderr,
+    )
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(driver_path, browser_args, os.path.abspath(args.cwd), args.timeout),
+    ) as pool:
+        futures = {pool.submit(_run_script, path, args.timeout): path for path in scripts}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # the worker itself died (e.g. the browser could not start)
+                result = {
+                    "path": os.path.relpath(futures[future], REPO_ROOT),
+                    "status": "error", "seconds": 0.0, "error": repr(e),
+                    "output": "", "worker": None,
+                }
+            results.append(result)
+            line = f"{result['status'].upper():8s} {result['seconds']:7.2f}s  {result['path']}"
+            if result["error"]:
+                line += f"  ({result['error'].splitlines()[-1][:120]})"
+            print(line, file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    results.sort(key=lambda r: r["path"])
+    counts = {s: sum(r["status"] == s for r in results)
+              for s in ("passed", "failed", "error", "timeout")}
+    print(
+        f"{counts['passed']} passed, {counts['failed']} failed, {counts['error']} errors, "
+        f"{counts['timeout']} timed out in {elapsed:.1f}s "
+        f"(sum of test time {sum(r['seconds'] for r in results):.1f}s)",
+        file=sys.stderr,
+    )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(
+                {"elapsed_seconds": elapsed, "workers": workers, "counts": counts,
+                 "results": results},
+                f, indent=2,
+            )
+    if args.junit:
+        write_junit(results, args.junit, elapsed)
+    return 0 if counts["passed"] == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
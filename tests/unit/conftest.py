@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from backend import rag_engine
+from backend.embedding_cache import EmbeddingCache
+from backend.kb_registry import KBRegistry
+from benchmarks.fake_embedder import FakeEmbedder
+
+
+@pytest.fixture
+def rag(tmp_path, monkeypatch):
+    """
+    rag_engine with a deterministic offline embedder and its KB stores and
+    embedding cache under tmp_path. The embedder counts encoded texts.
+    """
+    embedder = FakeEmbedder(dim=32)
+    encode = embedder.encode
+    embedder.encoded = 0
+
+    def counting_encode(sentences, **kwargs):
+        embedder.encoded += 1 if isinstance(sentences, str) else len(sentences)
+        return encode(sentences, **kwargs)
+
+    embedder.encode = counting_encode
+    monkeypatch.setattr(rag_engine, "_embedding_model", embedder)
+    monkeypatch.setattr(
+        rag_engine, "_embedding_cache", EmbeddingCache(path=str(tmp_path / "cache.sqlite"))
+    )
+    monkeypatch.setattr(
+        rag_engine,
+        "_kb_registry",
+        KBRegistry(root=str(tmp_path / "kb_stores"), memory_budget_bytes=1 << 30),
+    )
+    monkeypatch.setattr(rag_engine, "INGEST_WORKERS", 1)
+    rag_engine._retrieval_cache.clear()
+    return rag_engine
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
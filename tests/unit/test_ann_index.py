@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+
+from backend.ann_index import FlatIndex, IVFIndex, measure_recall
+from backend.vector_store import SimpleVectorStore, normalize_rows
+
+# Recall@5 of the IVF index against exact search on clustered data shaped
+# like a KB (groups of similar chunks): 20k rows, 141 lists. Measured at
+# nprobe 1/4/8/16/32: 0.41/0.83/0.96/0.99/1.0.
+N_ROWS = 20_000
+DIM = 64
+TOP_K = 5
+MIN_RECALL = {8: 0.90, 16: 0.97}  # 8 is IVFIndex's default nprobe
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((N_ROWS // 500, DIM))
+    data = centers[rng.integers(0, len(centers), N_ROWS)]
+    data = normalize_rows(data + 0.5 * rng.standard_normal((N_ROWS, DIM)))
+    queries = normalize_rows(
+        data[rng.integers(0, N_ROWS, 200)] + 0.5 * rng.standard_normal((200, DIM))
+    )
+    return data, queries
+
+
+@pytest.fixture(scope="module")
+def ivf(corpus):
+    index = IVFIndex()
+    index.build(corpus[0])
+    return index
+
+
+def test_default_nprobe_recall(corpus, ivf):
+    data, queries = corpus
+    assert ivf.nprobe == 8
+    recall = measure_recall(data, ivf, queries, top_k=TOP_K)["recall"]
+    assert recall >= MIN_RECALL[8]
+
+
+@pytest.mark.parametrize("nprobe", sorted(MIN_RECALL))
+def test_recall_at_nprobe(corpus, ivf, nprobe):
+    data, queries = corpus
+    recall = measure_recall(data, ivf, queries, top_k=TOP_K, nprobe=nprobe)["recall"]
+    assert recall >= MIN_RECALL[nprobe]
+
+
+def test_recall_grows_with_nprobe_and_all_lists_is_exact(corpus, ivf):
+    data, queries = corpus
+    n_lists = ivf.centroids.shape[0]
+    recalls = [
+        measure_recall(data, ivf, queries, top_k=TOP_K, nprobe=nprobe)["recall"]
+        for nprobe in (1, 4, 16, n_lists)
+    ]
+    assert recalls == sorted(recalls)
+    assert recalls[-1] == 1.0
+
+    exact, _ = FlatIndex().search_batch(data, queries, TOP_K)
+    got, _ = ivf.search_batch(data, queries, TOP_K, nprobe=n_lists)
+    np.testing.assert_array_equal(np.sort(got, axis=1), np.sort(exact, axis=1))
+
+
+def test_small_store_is_searched_exactly(corpus):
+    data, queries = corpus
+    index = IVFIndex()
+    index.build(data[:1000])
+    assert index.centroids is None
+    assert measure_recall(data[:1000], index, queries, top_k=TOP_K)["recall"] == 1.0
+
+
+@pytest.mark.parametrize("quantization", [None, "float16", "int8"])
+def test_store_recall_with_quantization(tmp_path, corpus, quantization):
+    # quantized codes pick candidates, rescoring in float32 restores the order
+    data, queries = corpus
+    store = SimpleVectorStore(
+        str(tmp_path / "store"), index_type="ivf", quantization=quantization
+    )
+    store.add_documents(
+        data, [str(i) for i in range(N_ROWS)], [{"source": "corpus"}] * N_ROWS, ""
+    )
+    exact, _ = FlatIndex().search_batch(data, queries, TOP_K)
+    results = store.similarity_search_batch(queries, top_k=TOP_K)
+    recall = np.mean([
+        len(set(truth.tolist()) & {int(h["text"]) for h in hits}) / TOP_K
+        for truth, hits in zip(exact, results)
+    ])
+    assert recall >= MIN_RECALL[8]
+
+
+def test_incremental_growth_retrains_past_twice_the_trained_rows(tmp_path, corpus):
+    data, _ = corpus
+    store = SimpleVectorStore(str(tmp_path / "store"), index_type="ivf", min_rows=256)
+
+    def add(start, stop):
+        store.add_documents(
+            data[start:stop],
+            [str(i) for i in range(start, stop)],
+            [{"source": str(start)}] * (stop - start),
+            "",
+        )
+
+    add(0, 400)
+    assert store.index.trained_rows == 400
+    n_lists = store.index.centroids.shape[0]
+    # each write reloads the index from disk; the training size must survive
+    for start in range(400, 800, 100):
+        add(start, start + 100)
+        assert store.index.trained_rows == 400
+        assert store.index.centroids.shape[0] == n_lists
+    add(800, 900)
+    assert store.index.trained_rows == 900
+    assert store.index.centroids.shape[0] == int(np.sqrt(900)) != n_lists
+    assert SimpleVectorStore(store.path).index.trained_rows == 900
+
+
+@pytest.mark.parametrize("max_block_bytes", [256 * 1024 * 1024, 64 * 1024])
+def test_search_batch_matches_search(corpus, ivf, max_block_bytes):
+    data, queries = corpus
+    idx, scores = ivf.search_batch(
+        data, queries, TOP_K, nprobe=8, max_block_bytes=max_block_bytes
+    )
+    assert idx.shape == scores.shape == (len(queries), TOP_K)
+    for q, row_idx, row_scores in zip(queries, idx, scores):
+        expected_idx, expected_scores = ivf.search(data, q, TOP_K, nprobe=8)
+        assert set(row_idx.tolist()) == set(expected_idx.tolist())
+        np.testing.assert_allclose(row_scores, expected_scores, rtol=1e-5, atol=1e-6)
+
+
+def test_search_batch_pads_short_results(corpus):
+    data, queries = corpus
+    # one tiny list per row: each query's lists hold fewer than top_k rows
+    index = IVFIndex(n_lists=2048, min_rows=2048)
+    index.build(data[:2048])
+    idx, scores = index.search_batch(data[:2048], queries, TOP_K, nprobe=1)
+    assert scores.shape == (len(queries), TOP_K)
+    assert np.isinf(scores[:, -1]).all() and np.isfinite(scores[:, 0]).all()
@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+import pytest
+
+from backend import rag_engine
+
+
+def _case(i):
+    return {
+        "id": f"TC-{i:03d}", "feature": "Discounts", "scenario": f"scenario {i}",
+        "steps": ["Open checkout"], "expected_result": "Total updates",
+        "grounded_in": ["product_specs.md"],
+    }
+
+
+@pytest.fixture
+def llm_output(monkeypatch):
+    """Streams the given text from a fake LLM, 7 characters per delta."""
+    text = {"value": ""}
+
+    async def fake_astream_llm(**kwargs):
+        value = text["value"]
+        for i in range(0, len(value), 7):
+            yield value[i:i + 7]
+
+    monkeypatch.setattr(rag_engine, "astream_llm", fake_astream_llm)
+    monkeypatch.setattr(
+        rag_engine, "retrieve_context", lambda query, top_k, kb_id: {"context_text": ""}
+    )
+    monkeypatch.setattr(rag_engine, "_kb_cache_tag", lambda kb_id, rag: "")
+    monkeypatch.setattr(rag_engine, "_test_case_prompts", lambda query, rag: ("", ""))
+    return text
+
+
+async def _collect(query="q"):
+    return [item async for item in rag_engine.astream_test_cases(query)]
+
+
+def test_streams_each_case_then_done(llm_output):
+    llm_output["value"] = json.dumps([_case(1), {"id": "TC-bad", "steps": "x"}, _case(2)])
+
+    events = asyncio.run(_collect())
+
+    assert [kind for kind, _ in events] == ["test_case", "test_case", "done"]
+    assert [tc.id for _, tc in events[:2]] == ["TC-001", "TC-002"]
+    assert events[-1][1] == llm_output["value"]
+
+
+def test_exception_thrown_in_by_the_consumer_propagates(llm_output):
+    llm_output["value"] = json.dumps([_case(1), _case(2)])
+
+    async def consume():
+        stream = rag_engine.astream_test_cases("q")
+        kind, _ = await stream.__anext__()
+        assert kind == "test_case"
+        await stream.athrow(RuntimeError("consumer failed"))
+
+    with pytest.raises(RuntimeError, match="consumer failed"):
+        asyncio.run(consume())
@@ -0,0 +1,77 @@
+import pytest
+
+from backend import context_packer
+from backend.context_packer import estimate_tokens, merge_hits, pack_context
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # the word/punctuation estimate, so budgets do not depend on tiktoken
+    monkeypatch.setattr(context_packer, "_HAS_TIKTOKEN", False)
+
+
+def _hit(text, source, score, start=None):
+    metadata = {"source": source}
+    if start is not None:
+        metadata.update(start=start, end=start + len(text))
+    return {"text": text, "metadata": metadata, "score": score}
+
+
+DOC = "one two three four five six seven eight nine ten"
+
+
+def test_overlapping_positioned_hits_are_stitched():
+    hits = [_hit(DOC[14:35], "spec.md", 0.5, 14), _hit(DOC[:24], "spec.md", 0.9, 0)]
+    spans = merge_hits(hits)
+    assert len(spans) == 1
+    assert spans[0]["text"] == DOC[:35]
+    assert spans[0]["score"] == 0.9
+
+
+def test_adjacent_positioned_hits_stay_separate():
+    hits = [_hit(DOC[:14], "spec.md", 0.9, 0), _hit(DOC[14:], "spec.md", 0.5, 14)]
+    assert [s["text"] for s in merge_hits(hits)] == [DOC[:14], DOC[14:]]
+
+
+def test_hits_without_offsets_merge_by_text_overlap():
+    hits = [
+        _hit("alpha beta gamma", "a.md", 0.4),
+        _hit("gamma delta", "a.md", 0.8),
+        _hit("alpha beta gamma", "a.md", 0.1),  # exact duplicate
+        _hit("beta", "a.md", 0.9),  # contained
+        _hit("gamma epsilon", "b.md", 0.3),  # other source
+    ]
+    spans = merge_hits(hits)
+    assert [(s["text"], s["source"], s["score"]) for s in spans] == [
+        ("alpha beta gamma delta", "a.md", 0.9),
+        ("gamma epsilon", "b.md", 0.3),
+    ]
+
+
+def test_pack_context_orders_best_first_and_lists_sources():
+    hits = [_hit("low score text", "a.md", 0.2), _hit("high score text", "b.md", 0.9)]
+    packed = pack_context(hits, separator="\n--\n")
+    assert packed["context_text"] == "high score text\n--\nlow score text"
+    assert packed["sources"] == ["b.md", "a.md"]
+    assert packed["num_tokens"] == estimate_tokens(packed["context_text"])
+
+
+def test_pack_context_respects_the_token_budget():
+    lines = "\n".join(f"line {i} of the spec" for i in range(50))
+    hits = [_hit(lines, "spec.md", 0.9), _hit("dropped entirely", "faq.md", 0.5)]
+
+    packed = pack_context(hits, token_budget=40)
+
+    assert packed["num_tokens"] <= 40
+    assert estimate_tokens(packed["context_text"]) <= 40
+    # cut at a line boundary; the later span did not fit at all
+    assert packed["context_text"].startswith("line 0 of the spec\nline 1")
+    assert packed["context_text"].endswith("of the spec")
+    assert "dropped" not in packed["context_text"]
+    assert packed["sources"] == ["spec.md"]
+
+
+def test_pack_context_of_no_hits():
+    assert pack_context([], token_budget=100) == {
+        "context_text": "", "sources": [], "num_tokens": 0,
+    }
@@ -0,0 +1,91 @@
+import numpy as np
+
+from backend.keyword_index import KeywordIndex, reciprocal_rank_fusion, tokenize
+
+
+TEXTS = [
+    "Apply discount code SAVE15 at checkout",
+    "Free shipping on orders over $50",
+    "The /api/v1/cart endpoint returns the cart total",
+    "Express shipping costs $10 and arrives next day",
+    "Discount codes cannot be combined",
+    "Pay button id is pay-now",
+]
+
+
+def _assert_same(a: KeywordIndex, b: KeywordIndex):
+    assert a.terms == b.terms
+    np.testing.assert_array_equal(a.offsets, b.offsets)
+    np.testing.assert_array_equal(a.rows, b.rows)
+    np.testing.assert_array_equal(a.tfs, b.tfs)
+    np.testing.assert_array_equal(a.doc_len, b.doc_len)
+
+
+def test_tokenize_keeps_compound_tokens_and_their_parts():
+    tokens = tokenize("POST /api/v1/cart with pay-now")
+    assert "api/v1/cart" in tokens and "cart" in tokens and "v1" in tokens
+    assert "pay-now" in tokens and "pay" in tokens
+
+
+def test_search_ranks_exact_identifier_first():
+    index = KeywordIndex().build(TEXTS)
+    rows, scores = index.search("save15", top_k=3)
+    assert rows.tolist() == [0]
+    rows, scores = index.search("shipping discount", top_k=10)
+    assert set(rows.tolist()) == {0, 1, 3, 4}
+    assert np.all(np.diff(scores) <= 0)
+    assert len(index.search("nonexistent", top_k=3)[0]) == 0
+
+
+def test_incremental_build_matches_fresh_build():
+    previous = KeywordIndex().build(TEXTS)
+    # drop rows 1 and 4, keep the rest in a new order, append two rows
+    kept = np.array([5, 0, 2, 3])
+    new_texts = ["Gift cards never expire", "Discount code WELCOME10 for new users"]
+
+    incremental = KeywordIndex().build(new_texts, previous=previous, kept=kept)
+    fresh = KeywordIndex().build([TEXTS[i] for i in kept] + new_texts)
+
+    # term ids are assigned in a different order, so compare by term
+    assert sorted(incremental.terms) == sorted(fresh.terms)
+    np.testing.assert_array_equal(incremental.doc_len, fresh.doc_len)
+    for query in ("discount code", "shipping", "cart total", "pay-now", "gift"):
+        rows_a, scores_a = incremental.score(query)
+        rows_b, scores_b = fresh.score(query)
+        np.testing.assert_array_equal(rows_a, rows_b)
+        np.testing.assert_allclose(scores_a, scores_b, rtol=1e-6)
+    # "combined" only occurred in a dropped row
+    assert "combined" not in incremental.term_ids
+
+
+def test_incremental_build_without_new_rows_is_a_no_op():
+    previous = KeywordIndex().build(TEXTS)
+    same = KeywordIndex().build([], previous=previous, kept=np.arange(len(TEXTS)))
+    _assert_same(same, previous)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = KeywordIndex().build(TEXTS)
+    index.save(str(tmp_path))
+    loaded = KeywordIndex()
+    assert loaded.load(str(tmp_path))
+    _assert_same(loaded, index)
+    assert not KeywordIndex().load(str(tmp_path / "missing"))
+
+
+def test_reciprocal_rank_fusion():
+    dense = np.array([3, 1, 2])
+    keyword = np.array([1, 4])
+    rows, scores = reciprocal_rank_fusion([dense, keyword], top_k=3, k=60)
+
+    # row 1 is ranked by both lists, row 3 only first by one
+    assert rows.tolist() == [1, 3, 4]
+    np.testing.assert_allclose(
+        scores, [1 / 62 + 1 / 61, 1 / 61, 1 / 62], rtol=1e-6
+    )
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_reciprocal_rank_fusion_of_empty_rankings():
+    rows, scores = reciprocal_rank_fusion([np.array([], dtype=np.int64)], top_k=5)
+    assert len(rows) == 0 and len(scores) == 0
@@ -0,0 +1,54 @@
+import json
+
+from backend.stream_parser import JSONArrayStreamParser
+
+
+CASES = [
+    {"test_id": "TC-001", "steps": ["Open checkout", "Click \"Pay\""], "grounded_in": "spec.md"},
+    {"test_id": "TC-002", "expected": "Total shows {discount} and [brackets]", "nested": {"a": [1, {"b": 2}]}},
+    {"test_id": "TC-003", "note": "escaped \\\" quote and \\\\ backslash"},
+]
+
+
+def _feed_all(parser, fragments):
+    out = []
+    for fragment in fragments:
+        out.extend(parser.feed(fragment))
+    return out
+
+
+def test_objects_are_returned_as_soon_as_they_close():
+    text = json.dumps(CASES)
+    parser = JSONArrayStreamParser()
+    first_end = text.index(json.dumps(CASES[0])) + len(json.dumps(CASES[0]))
+
+    assert parser.feed(text[: first_end - 1]) == []
+    assert parser.feed(text[first_end - 1 : first_end]) == [CASES[0]]
+    assert parser.feed(text[first_end:]) == CASES[1:]
+
+
+def test_any_fragmentation_gives_the_same_objects():
+    text = json.dumps(CASES, indent=2)
+    for size in (1, 2, 7, 64, len(text)):
+        fragments = [text[i : i + size] for i in range(0, len(text), size)]
+        assert _feed_all(JSONArrayStreamParser(), fragments) == CASES
+
+
+def test_prose_and_code_fences_around_the_array_are_skipped():
+    text = "Here are the test cases:\n```json\n" + json.dumps(CASES) + "\n```\nDone."
+    assert _feed_all(JSONArrayStreamParser(), [text]) == CASES
+
+
+def test_bare_object_is_a_single_element():
+    assert _feed_all(JSONArrayStreamParser(), [json.dumps(CASES[0])]) == [CASES[0]]
+
+
+def test_non_object_and_malformed_elements_are_dropped():
+    text = '[1, "two", ["x"], {"ok": 1}, {"bad": tru}, {"ok": 2}]'
+    assert _feed_all(JSONArrayStreamParser(), [text]) == [{"ok": 1}, {"ok": 2}]
+
+
+def test_truncated_output_returns_only_finished_objects():
+    text = json.dumps(CASES)
+    cut = text.index('"TC-003"')
+    assert _feed_all(JSONArrayStreamParser(), [text[:cut]]) == CASES[:2]
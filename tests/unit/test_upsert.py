@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pytest
+
+from backend.vector_store import normalize_rows
+
+
+def _doc(filename, content, doc_type="support"):
+    return {"filename": filename, "content": content, "doc_type": doc_type}
+
+
+SPEC = "\n\n".join(
+    f"Section {i}\n\nThe discount code SAVE{i} takes {i} percent off the cart total."
+    for i in range(40)
+)
+HTML = "<html><body><form id='checkout'><button id='pay'>Pay</button></form></body></html>"
+
+
+def _store(rag, kb_id="default"):
+    return rag.get_kb_registry().get(kb_id)
+
+
+def test_build_embeds_every_chunk_once(rag):
+    num_chunks = rag.build_knowledge_base([_doc("spec.md", SPEC), _doc("checkout.html", HTML, "html")])
+
+    store = _store(rag)
+    assert num_chunks == len(store.records) > 1
+    assert rag._embedding_model.encoded == num_chunks
+    assert "checkout" in store.html_full
+    manifest = store.documents["spec.md"]
+    assert len(manifest["chunk_hashes"]) == len(store.document_rows("spec.md"))
+
+
+def test_upsert_stores_normalized_embeddings_of_chunk_texts(rag, monkeypatch):
+    # small batches so several flushes go through the spool
+    monkeypatch.setattr(rag, "EMBED_BATCH_SIZE", 3)
+    rag.upsert_documents([_doc("spec.md", SPEC), _doc("notes.md", "Shipping is free over $50.")])
+
+    store = _store(rag)
+    texts = list(store.texts)
+    expected = normalize_rows(rag._embedding_model.encode(texts))
+    np.testing.assert_allclose(store.embeddings, expected, rtol=1e-5, atol=1e-6)
+    assert not [e for e in os.listdir(store.path) if e.startswith(".spool-")]
+
+
+def test_unchanged_document_is_skipped(rag):
+    rag.upsert_documents([_doc("spec.md", SPEC)])
+    encoded = rag._embedding_model.encoded
+    version = _store(rag).version
+
+    stats = rag.upsert_documents([_doc("spec.md", SPEC)])
+
+    assert stats["unchanged"] == 1 and stats["embedded_chunks"] == 0
+    assert rag._embedding_model.encoded == encoded
+    assert _store(rag).version == version
+
+
+def test_edit_reuses_vectors_of_unchanged_chunks(rag):
+    rag.upsert_documents([_doc("spec.md", SPEC), _doc("faq.md", "Returns are accepted for 30 days.")])
+    store = _store(rag)
+    before = {t: np.array(store.embeddings[i]) for i, t in enumerate(store.texts)}
+    # route any re-embedding to the model, not the persistent cache
+    rag._embedding_cache.clear()
+
+    edited = SPEC.replace("SAVE7 takes 7 percent", "SAVE7 takes 70 percent")
+    stats = rag.upsert_documents([_doc("spec.md", edited)])
+
+    assert stats["updated"] == 1
+    assert stats["embedded_chunks"] == 1
+    assert stats["reused_chunks"] > 0
+    assert stats["reused_chunks"] == len(store.document_rows("spec.md")) - 1
+    for i, text in enumerate(store.texts):
+        if text in before:
+            # reused rows are renormalized when spooled: equal up to rounding
+            np.testing.assert_allclose(store.embeddings[i], before[text], atol=1e-6)
+    assert any("70 percent" in t for t in store.texts)
+    assert len(store.document_rows("faq.md")) == 1
+
+
+def test_duplicate_filenames_are_rejected(rag):
+    rag.upsert_documents([_doc("spec.md", SPEC)])
+    version = _store(rag).version
+
+    with pytest.raises(rag.DuplicateFilenames, match="spec.md"):
+        rag.upsert_documents([_doc("spec.md", "first"), _doc("spec.md", "second")])
+    with pytest.raises(rag.DuplicateFilenames):
+        rag.build_knowledge_base([_doc("a.md", "x"), _doc("a.md", "y")])
+    assert _store(rag).version == version
+
+
+def test_build_drops_missing_documents_and_their_html(rag):
+    rag.build_knowledge_base([_doc("spec.md", SPEC), _doc("checkout.html", HTML, "html")])
+
+    rag.build_knowledge_base([_doc("spec.md", SPEC)])
+
+    store = _store(rag)
+    assert set(store.documents) == {"spec.md"}
+    assert store.html_full == "" and store.html_digest == ""
+    assert {m["source"] for m in store.metadatas} == {"spec.md"}
+
+
+def test_delete_documents(rag):
+    rag.upsert_documents([_doc("spec.md", SPEC), _doc("faq.md", "Returns are accepted for 30 days.")])
+
+    result = rag.delete_documents(["faq.md", "missing.md"])
+
+    assert result["deleted"] == ["faq.md"]
+    assert result["num_chunks"] == len(_store(rag).document_rows("spec.md"))
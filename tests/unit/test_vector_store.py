@@ -0,0 +1,215 @@
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from backend import vector_store
+from backend.vector_store import CURRENT_FILE, LOCK_FILE, META_FILE, SimpleVectorStore
+
+
+def _add(store, rng, n, source="a.md", dim=16):
+    texts = [f"{source} chunk {i}" for i in range(n)]
+    store.add_documents(
+        rng.standard_normal((n, dim)).astype(np.float32),
+        texts,
+        [{"source": source} for _ in texts],
+        html_full="",
+    )
+
+
+def _current(path):
+    with open(os.path.join(path, CURRENT_FILE), "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def _versions(path):
+    return sorted(e for e in os.listdir(path) if vector_store._SNAPSHOT_DIR_RE.match(e))
+
+
+def _dir_contents(path):
+    contents = {}
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), "rb") as f:
+            contents[name] = f.read()
+    return contents
+
+
+def test_write_publishes_new_version_and_reopens(tmp_path, rng):
+    path = str(tmp_path / "store")
+    store = SimpleVectorStore(path)
+    _add(store, rng, 5)
+    _add(store, rng, 3, source="b.md")
+
+    assert _current(path) == "v00000002"
+    reopened = SimpleVectorStore(path)
+    assert reopened.version == 2
+    assert len(reopened.records) == 8
+    assert reopened.texts[7] == "b.md chunk 2"
+    assert set(reopened.documents) == {"a.md", "b.md"}
+    np.testing.assert_array_equal(reopened.embeddings, store.embeddings)
+
+
+def test_published_snapshot_is_never_modified(tmp_path, rng):
+    path = str(tmp_path / "store")
+    store = SimpleVectorStore(path)
+    _add(store, rng, 5)
+    held = store.snapshot()
+    before = _dir_contents(held.path)
+
+    _add(store, rng, 3, source="b.md")
+
+    assert _dir_contents(held.path) == before
+    assert len(held.records) == 5 and held.version == 1
+    assert len(store.records) == 8 and store.version == 2
+
+
+def test_write_skips_version_claimed_by_another_writer(tmp_path, rng):
+    path = str(tmp_path / "store")
+    store = SimpleVectorStore(path)
+    _add(store, rng, 5)
+    # another process is building v2: no meta.json yet
+    claimed = os.path.join(path, "v00000002")
+    os.mkdir(claimed)
+    with open(os.path.join(claimed, "embeddings.npy"), "wb") as f:
+        f.write(b"in progress")
+
+    _add(store, rng, 3, source="b.md")
+
+    assert _current(path) == "v00000003"
+    assert store.version == 3
+    with open(os.path.join(claimed, "embeddings.npy"), "rb") as f:
+        assert f.read() == b"in progress"
+
+
+def test_prune_keeps_previous_version_and_young_incomplete_dirs(tmp_path, rng):
+    path = str(tmp_path / "store")
+    store = SimpleVectorStore(path)
+    _add(store, rng, 2)
+    abandoned = os.path.join(path, "v00000002")
+    young = os.path.join(path, "v00000003")
+    os.mkdir(abandoned)
+    os.mkdir(young)
+    old = time.time() - vector_store.ABANDONED_SNAPSHOT_SECONDS - 60
+    os.utime(abandoned, (old, old))
+
+    _add(store, rng, 2, source="b.md")  # v4, keeps v1 as the previous version
+    assert _versions(path) == ["v00000001", "v00000003", "v00000004"]
+
+    _add(store, rng, 2, source="c.md")  # v5 drops v1; v3 is still young
+    assert _versions(path) == ["v00000003", "v00000004", "v00000005"]
+
+
+def test_legacy_flat_store_is_read_then_converted(tmp_path, rng):
+    path = str(tmp_path / "store")
+    store = SimpleVectorStore(path, quantization="int8")
+    _add(store, rng, 4)
+    expected = np.array(store.embeddings)
+    # flatten into the pre-snapshot layout: every file directly in the store
+    version_dir = os.path.join(path, _current(path))
+    for name in os.listdir(version_dir):
+        shutil.move(os.path.join(version_dir, name), os.path.join(path, name))
+    os.rmdir(version_dir)
+    os.remove(os.path.join(path, CURRENT_FILE))
+    legacy = set(os.listdir(path))
+    assert any(name.startswith("bm25_") for name in legacy)
+    assert any(name.startswith("embeddings_q") for name in legacy)
+
+    store = SimpleVectorStore(path, quantization="int8")
+    assert store.snapshot().path == path
+    np.testing.assert_array_equal(store.embeddings, expected)
+
+    _add(store, rng, 2, source="b.md")
+    assert set(os.listdir(path)) == {CURRENT_FILE, LOCK_FILE, "v00000002"}
+    assert len(store.records) == 6
+
+
+def test_reopen_with_new_derived_files_writes_new_version(tmp_path, rng):
+    path = str(tmp_path / "store")
+    store = SimpleVectorStore(path, index_type="flat", min_rows=16)
+    _add(store, rng, 64)
+    published = os.path.join(path, _current(path))
+    before = _dir_contents(published)
+    query = np.asarray(store.embeddings[10])
+
+    store = SimpleVectorStore(path, index_type="ivf", quantization="int8", min_rows=16)
+
+    # the published version is untouched; the ivf index and int8 codes went
+    # into a new one
+    assert _dir_contents(published) == before
+    assert store.version == 2 and _current(path) == "v00000002"
+    assert store.index.kind == "ivf"
+    assert store.snapshot().quantized is not None
+    hits = store.similarity_search(query, top_k=1, nprobe=store.index.n_lists)
+    assert hits[0]["text"] == "a.md chunk 10"
+
+    # everything is on disk now, so reopening writes nothing
+    store = SimpleVectorStore(path, index_type="ivf", quantization="int8", min_rows=16)
+    assert store.version == 2 and not store.snapshot().derived_stale
+
+
+def test_writer_on_stale_instance_rebases_on_current_version(tmp_path, rng):
+    path = str(tmp_path / "store")
+    a = SimpleVectorStore(path)
+    _add(a, rng, 2)
+    b = SimpleVectorStore(path)  # e.g. another worker process, still at v1
+    _add(a, rng, 2, source="b.md")
+
+    _add(b, rng, 2, source="c.md")
+
+    assert b.version == 3 and len(b.records) == 6
+    assert set(b.documents) == {"a.md", "b.md", "c.md"}
+    # a's loaded version (v2) was what CURRENT named, so it was kept
+    assert _versions(path) == ["v00000002", "v00000003"]
+    _add(a, rng, 2, source="d.md")
+    assert a.version == 4 and len(a.records) == 8
+    assert {m["source"] for m in SimpleVectorStore(path).metadatas} == {
+        "a.md", "b.md", "c.md", "d.md"
+    }
+
+
+def test_concurrent_writers_serialize(tmp_path):
+    path = str(tmp_path / "store")
+    stores = [SimpleVectorStore(path), SimpleVectorStore(path)]
+
+    def writer(store, name, seed):
+        rng = np.random.default_rng(seed)
+        for i in range(5):
+            _add(store, rng, 1, source=f"{name}{i}.md")
+
+    threads = [
+        threading.Thread(target=writer, args=(s, n, i))
+        for i, (s, n) in enumerate(zip(stores, "xy"))
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    reopened = SimpleVectorStore(path)
+    assert reopened.version == 10
+    assert len(reopened.records) == 10 and len(reopened.documents) == 10
+
+
+def test_open_removes_abandoned_spools_only(tmp_path, rng):
+    path = str(tmp_path / "store")
+    store = SimpleVectorStore(path)
+    _add(store, rng, 2)
+    abandoned = vector_store.RowSpool(path)
+    abandoned.append(rng.standard_normal((1, 16)), ["x"], [{"source": "x.md"}])
+    active = vector_store.RowSpool(path)
+    active.append(rng.standard_normal((1, 16)), ["y"], [{"source": "y.md"}])
+    old = time.time() - vector_store.ABANDONED_SNAPSHOT_SECONDS - 60
+    for spool in (abandoned, active):
+        for name in os.listdir(spool.path):
+            os.utime(os.path.join(spool.path, name), (old, old))
+        os.utime(spool.path, (old, old))
+    # still being appended to: a fresh file mtime keeps it
+    os.utime(os.path.join(active.path, os.listdir(active.path)[0]))
+
+    SimpleVectorStore(path)
+
+    assert not os.path.exists(abandoned.path)
+    assert os.path.exists(active.path)
+    active.discard()